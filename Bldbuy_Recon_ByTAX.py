@@ -1,8 +1,11 @@
 import pandas as pd
+import numpy as np
 import warnings
 from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import Cell
+from openpyxl.styles import Alignment, Font, PatternFill, NamedStyle
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.worksheet.page import PageMargins
 from openpyxl.worksheet.properties import WorksheetProperties, PageSetupProperties
 from datetime import datetime
@@ -13,10 +16,316 @@ import threading
 import shutil  # 新增导入
 import sys
 import subprocess
+import multiprocessing
+import hashlib
+import json
+import tempfile
+from contextlib import closing
+from itertools import chain, islice
+from Recon_Common_ByTAX import (get_process_pool, get_worker_count, warm_up_process_pool,
+                                file_sha256, hash_frame, RunManifest, UIEventChannel,
+                                StageRecorder, RunProfiler, report_stages,
+                                iter_excel_rows, normalize_cell, make_unique_columns, frame_from_rows,
+                                select_columns, select_cells, parse_cells, ColumnTypeTracker, SpillPartitions,
+                                get_frame_cache, frame_cache_kind, get_hotel_profile, hotel_profile_choices,
+                                DEFAULT_HOTEL_PROFILE_LABEL)
+from collections import deque
+
+# 表头搜索的最大行数
+HEADER_SEARCH_ROWS = 50
+# 表头匹配度阈值（至少需要匹配的表头数量）
+HEADER_MATCH_THRESHOLD = 3
+# 未找到表头时使用的默认表头行
+DEFAULT_HEADER_ROW = 35
+# 计算报表版式指纹时使用的前几行
+LAYOUT_FINGERPRINT_ROWS = 10
+# 需要保留的退货相关列
+RETURN_COLUMNS = ['退货', '合计退货数量', '退货合计金额(结算)', '退货合计税额(结算)', '退货合计价税(结算)']
+# 规范化后报表的紧凑列类型：重复出现的文本为分类列，数量和金额为可空数值列，收货日期为datetime64
+REPORT_CATEGORY_COLUMNS = ['供应商/备用金报销账户', '部门', '税率', '商品分类', '基本单位', '退货']
+REPORT_NUMERIC_COLUMNS = ['实收数量', '单价(结算)', '小计金额(结算)', '税额(结算)', '小计价税(结算)',
+                          '合计退货数量', '退货合计金额(结算)', '退货合计税额(结算)', '退货合计价税(结算)']
+# 低内存模式默认的内存预算（MB）
+DEFAULT_MEMORY_BUDGET_MB = 256
+# 低内存模式先读取这么多行，用来估计每行占用的内存
+MEMORY_PROBE_ROWS = 1000
+# 低内存模式：每块读取的行和等待写入磁盘分区的行各占内存预算的比例
+CHUNK_BUDGET_SHARE = 0.25
+
+def get_application_path():
+    """获取程序运行路径"""
+    if getattr(sys, 'frozen', False):
+        # 如果是打包后的exe运行
+        return os.path.dirname(sys.executable)
+    # 如果是python脚本运行
+    return os.path.dirname(os.path.abspath(__file__))
+
+def apply_report_schema(df):
+    """把规范化后的报表转换为紧凑的列类型（直接修改df并返回）
+    
+    分类列转换为category；数值列按推断出的类型转换为可空的Int64或Float64，
+    含有文本等非数值的列保持原样。
+    """
+    for col in REPORT_CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in REPORT_NUMERIC_COLUMNS:
+        if col in df.columns:
+            kind = df[col].dtype.kind
+            if kind in 'iu':
+                df[col] = df[col].astype('Int64')
+            elif kind == 'f':
+                df[col] = df[col].astype('Float64')
+    return df
+
+def restore_report_columns(df):
+    """把紧凑类型的分组数据还原为普通类型（分类列还原为原来的值，可空数值列还原为int64或float64），
+    写出的值和列宽与未使用紧凑类型时相同"""
+    df = df.copy()
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(dtype.categories.dtype)
+        elif isinstance(dtype, (pd.Int64Dtype, pd.Float64Dtype)):
+            if dtype == 'Int64' and not df[col].isna().any():
+                df[col] = df[col].astype('int64')
+            else:
+                df[col] = df[col].to_numpy(dtype=float, na_value=np.nan)
+    return df
+
+def convert_tax_rates(rates):
+    """把税率列转换为百分比格式的分类列，每个不同的取值只转换一次"""
+    rates = rates.astype('category')
+    converted = [convert_tax_rate(value) for value in rates.cat.categories] + [convert_tax_rate(np.nan)]
+    # 空值的分类编码为-1，对应列表最后的空值转换结果
+    values = np.asarray(converted, dtype=object)[rates.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical(values), index=rates.index)
+
+def convert_tax_rate(x):
+    """将税率转换为百分比格式（0.13、13、"13%" 都转换为 "13%"）"""
+    if pd.isna(x):
+        return '0%'
+    tax_str = str(x).strip().replace('%', '')
+    try:
+        tax_value = float(tax_str)
+        if tax_value < 1:  # 如果是小数形式（如0.13）
+            return f"{int(tax_value * 100)}%"
+        return f"{int(tax_value)}%"
+    except ValueError:
+        return '0%'
+
+class HeaderLayoutCache:
+    """记住每种报表版式的表头行号，以前几行的版式指纹为键并保存到磁盘"""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.layouts = {}
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.layouts = json.load(f)
+        except (OSError, ValueError):
+            self.layouts = {}
+
+    @staticmethod
+    def fingerprint(rows):
+        """根据非空单元格的位置和标签文字生成版式指纹，含数字的内容（日期、单号等）只保留位置"""
+        layout = []
+        for row in rows:
+            layout.append(tuple(
+                (col_idx, '#' if any(ch.isdigit() for ch in str(value)) else str(value))
+                for col_idx, value in enumerate(row) if value is not None
+            ))
+        return hashlib.md5(repr(layout).encode('utf-8')).hexdigest()
+
+    def get(self, fingerprint):
+        return self.layouts.get(fingerprint)
+
+    def put(self, fingerprint, header_row):
+        if self.layouts.get(fingerprint) == header_row:
+            return
+        self.layouts[fingerprint] = header_row
+        try:
+            # 多个工作进程可能同时写入，先写到各自的临时文件再替换
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.layouts, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+_header_layout_cache = None
+
+def get_header_layout_cache():
+    """获取全局的表头版式缓存"""
+    global _header_layout_cache
+    if _header_layout_cache is None:
+        _header_layout_cache = HeaderLayoutCache(os.path.join(get_application_path(), 'header_layouts.json'))
+    return _header_layout_cache
+
+# 对账单各类行的样式定义，全程序只创建一次，各工作簿注册为同名的命名样式
+_STATEMENT_FILL = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
+_STATEMENT_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+STATEMENT_ROW_STYLES = {
+    'title': (Font(color='FFFFFF', size=18, name='微软雅黑', bold=True), _STATEMENT_FILL),
+    'header': (Font(color='FFFFFF', size=10, name='微软雅黑', bold=True), _STATEMENT_FILL),
+    'data': (Font(size=11, name='微软雅黑'), PatternFill()),
+    'return': (Font(size=11, name='微软雅黑'), PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')),
+    'total': (Font(color='FFFFFF', size=10, name='微软雅黑', bold=True), _STATEMENT_FILL),
+}
+
+# 退货行中取负数的列：退货数据列 -> 对账单中的列
+RETURN_VALUE_COLUMNS = {
+    '合计退货数量': '实收数量',
+    '退货合计金额(结算)': '小计金额(结算)',
+    '退货合计税额(结算)': '税额(结算)',
+    '退货合计价税(结算)': '小计价税(结算)',
+}
+
+# 合计行需要汇总的金额列
+TOTAL_AMOUNT_COLUMNS = ['小计金额(结算)', '税额(结算)', '小计价税(结算)']
+
+class StatementWriter:
+    """对账单写出引擎
+    
+    使用openpyxl的write-only模式逐行写出，每种行（标题、表头、数据、退货、合计）
+    套用预先注册的命名样式，列宽直接根据各列数据计算，不需要遍历单元格。
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def register_styles(self, wb):
+        """在工作簿中注册各类行的命名样式，返回行类型到样式数组的映射"""
+        style_arrays = {}
+        for row_type, (font, fill) in STATEMENT_ROW_STYLES.items():
+            named_style = NamedStyle(name=f"statement_{row_type}", font=font, fill=fill, alignment=_STATEMENT_ALIGNMENT)
+            wb.add_named_style(named_style)
+            style_arrays[row_type] = named_style.as_tuple()
+        return style_arrays
+
+    def column_widths(self, body, total_row):
+        """根据表头、数据和合计行各列最长内容的字符数计算列宽"""
+        widths = []
+        for col_idx, column in enumerate(self.columns):
+            values = body[column]
+            values = values[values.notna()]
+            max_length = len(str(column))
+            if len(values):
+                max_length = max(max_length, int(values.astype(str).str.len().max()))
+            if total_row[col_idx] is not None:
+                max_length = max(max_length, len(str(total_row[col_idx])))
+            widths.append(max_length + 8)
+        return widths
+
+    def setup_page(self, ws):
+        """设置页面布局"""
+        ws.page_setup.paperSize = Worksheet.PAPERSIZE_A4
+        ws.page_margins = PageMargins(top=0.25, left=0.2, right=0, bottom=1.05, header=0, footer=0.5)
+        ws.page_setup.horizontalCentered = True
+        ws.page_setup.verticalCentered = True
+        ws.sheet_properties.pageSetUpPr.fitToPage = True
+        ws.page_setup.fitToHeight = False
+        ws.page_setup.fitToWidth = 1
+        ws.oddFooter.center.text = "Page &[Page] of &[Pages]"
+        ws.print_title_rows = '1:6'
+        ws.freeze_panes = 'A7'
+
+    def data_rows(self, body):
+        """把数据行转换为写入单元格的值列表，空值为None"""
+        return body.astype(object).where(body.notna(), None).values.tolist()
+
+    def write(self, output_filepath, header_rows, body, return_mask, total_row):
+        """写出对账单
+        
+        body为按self.columns排列的数据行，return_mask标记其中的退货行，
+        total_row为合计行的值列表。
+        """
+        self.build(header_rows, body, return_mask, total_row).save(output_filepath)
+
+    def build(self, header_rows, body, return_mask, total_row, rows=None, extra_column=None, write_only=True):
+        """创建对账单工作簿（未保存）
+        
+        rows为已由data_rows转换的数据行；extra_column为(列名, 值列表)时，在表头、
+        各数据行和合计行的末尾追加一列（不套用样式）。write_only为False时创建普通工作簿，
+        保存前还可以继续添加其他sheet。
+        """
+        wb = Workbook(write_only=write_only)
+        if write_only:
+            ws = wb.create_sheet("Statement")
+        else:
+            ws = wb.active
+            ws.title = "Statement"
+        styles = self.register_styles(wb)
+        
+        # write-only模式下列宽和页面设置必须在写入数据前完成
+        for col_idx, width in enumerate(self.column_widths(body, total_row), 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+        self.setup_page(ws)
+        
+        def styled_row(values, row_type):
+            style = styles[row_type]
+            return [Cell(ws, row=1, column=1, value=value, style_array=style) for value in values]
+        
+        if rows is None:
+            rows = self.data_rows(body)
+        if extra_column is None:
+            extra_header, extra_values = [], [[]] * (len(rows) + 1)
+        else:
+            extra_header, extra_values = [extra_column[0]], [[value] for value in extra_column[1]]
+        
+        for row in header_rows:
+            ws.append(styled_row(row, 'title'))
+        ws.append(styled_row(self.columns, 'header') + extra_header)
+        
+        for row, is_return, extra in zip(rows, return_mask, extra_values):
+            ws.append(styled_row(row, 'return' if is_return else 'data') + extra)
+        ws.append(styled_row(total_row, 'total') + extra_values[len(rows)])
+        return wb
 
 class BldBuyApp:
-    def __init__(self, root):
+    def __init__(self, root=None):
         self.root = root
+        
+        # 定义期望的表头字段
+        self.expected_headers = [
+            "收货日期", "订单号", "商品名称", "实收数量", "基本单位",
+            "单价(结算)", "小计金额(结算)", "税额(结算)", "小计价税(结算)", "部门",
+            "税率", "供应商/备用金报销账户","商品分类"
+        ]
+        
+        # 初始化状态
+        self.processing = False
+        self.log_messages = []
+        # 本次处理的数据行数和对账单数量，用于统计处理速度
+        self.row_count = 0
+        self.group_count = 0
+        # 处理记录（用于跳过内容没有变化的文件和分组）以及本次生成或保留的分组记录
+        self.manifest = None
+        self.group_records = []
+        # 各处理阶段的耗时记录；profile_run为True时同时保存cProfile结果并记录内存峰值
+        self.stages = StageRecorder()
+        self.profile_run = False
+        # 合并模式：同一批报表合并后只分组一次，每个供应商每月每个税率只生成一份对账单
+        self.merge_batch = False
+        # 同时生成确认函：对账单数据直接做品类标记，写出的对账单中同时包含确认函sheet
+        self.confirmation_pipeline = False
+        self.confirmation_app = None
+        # 是否把同一文件内各供应商对账单的生成分发到工作进程池
+        self.parallel_groups = False
+        # 多进程时即使只有一个文件也交给工作进程处理（多酒店批处理时本进程只负责记录和归档）
+        self.files_in_pool = False
+        # 使用的酒店配置，为None时使用程序目录的config.txt
+        self.hotel_profile = None
+        # 低内存模式的内存预算（MB），为None时整表读取报表
+        self.memory_budget = None
+        # 低内存模式合并处理时本月去掉的重复订单行数
+        self.duplicate_count = 0
+        self.statement_writer = StatementWriter(self.expected_headers)
+        
+        # 没有窗口时（后台工作进程）只初始化处理数据所需的状态
+        if root is None:
+            return
+        
         self.root.title("供应商供货明细表工具byTAX")
         
         # 设置窗口大小并居中
@@ -31,13 +340,6 @@ class BldBuyApp:
             self.root.destroy()
             return
             
-        # 定义期望的表头字段
-        self.expected_headers = [
-            "收货日期", "订单号", "商品名称", "实收数量", "基本单位",
-            "单价(结算)", "小计金额(结算)", "税额(结算)", "小计价税(结算)", "部门",
-            "税率", "供应商/备用金报销账户","商品分类"
-        ]
-        
         # 创建主框架
         self.main_frame = ttk.Frame(root, padding="10")
         self.main_frame.pack(fill=BOTH, expand=True)
@@ -48,12 +350,15 @@ class BldBuyApp:
         # 创建日志显示区域
         self.create_log_area()
         
-        # 初始化状态
-        self.processing = False
+        # 处理线程通过事件通道更新日志和进度，由主线程定时批量刷新界面
+        self.ui_events = UIEventChannel(self.root, self.append_log_lines, self.set_progress_value)
         
         # 创建开发者信息标签
         self.create_developer_label()
         
+        # 预先启动工作进程，使第一个文件无需等待进程启动和导入
+        warm_up_process_pool()
+        
     def set_window_geometry(self, width, height):
         """设置窗口大小并居中"""
         screen_width = self.root.winfo_screenwidth()
@@ -84,6 +389,40 @@ class BldBuyApp:
         ttk.Entry(self.file_frame, textvariable=self.input_file_var, width=40).pack(side=LEFT, padx=5)
         ttk.Button(self.file_frame, text="浏览...", command=self.select_input_file).pack(side=LEFT)
         
+        # 酒店配置选项：默认使用config.txt，profiles文件夹中的每个<名称>.txt是一个酒店的配置
+        hotel_frame = ttk.Frame(control_frame)
+        hotel_frame.pack(fill=X, pady=5)
+        ttk.Label(hotel_frame, text="酒店配置:").pack(side=LEFT)
+        self.hotel_var = StringVar(value=DEFAULT_HOTEL_PROFILE_LABEL)
+        ttk.Combobox(hotel_frame, textvariable=self.hotel_var, values=hotel_profile_choices(get_application_path()),
+                     state="readonly", width=25).pack(side=LEFT, padx=5)
+        
+        # 并行处理选项
+        self.parallel_var = BooleanVar(value=True)
+        ttk.Checkbutton(control_frame, text="多进程并行处理", variable=self.parallel_var).pack(anchor=W, pady=5)
+        
+        # 合并选项：同一批报表合并后生成对账单，每个供应商每月每个税率只有一份
+        self.merge_var = BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="合并本批报表（每个供应商每月一份对账单）", variable=self.merge_var).pack(anchor=W, pady=5)
+        
+        # 同时生成确认函选项：对账单中直接包含品类标记和确认函sheet，不需要再用确认函工具处理
+        self.confirmation_var = BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="同时生成确认函", variable=self.confirmation_var).pack(anchor=W, pady=5)
+        
+        # 低内存模式选项：分块读取超大报表并暂存到磁盘分区，内存占用由内存预算决定
+        memory_frame = ttk.Frame(control_frame)
+        memory_frame.pack(fill=X, pady=5)
+        self.memory_var = BooleanVar(value=False)
+        ttk.Checkbutton(memory_frame, text="低内存模式（超大报表）", variable=self.memory_var).pack(side=LEFT)
+        ttk.Label(memory_frame, text="内存预算(MB):").pack(side=LEFT, padx=(10, 0))
+        self.memory_budget_var = IntVar(value=DEFAULT_MEMORY_BUDGET_MB)
+        ttk.Spinbox(memory_frame, textvariable=self.memory_budget_var, from_=64, to=8192, increment=64,
+                    width=8).pack(side=LEFT, padx=5)
+        
+        # 性能分析选项：保存cProfile结果并记录各阶段内存峰值，会使处理变慢
+        self.profile_var = BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="记录性能分析", variable=self.profile_var).pack(anchor=W, pady=5)
+        
         # 处理按钮
         self.process_btn = ttk.Button(control_frame, text="开始处理", command=self.start_processing)
         self.process_btn.pack(pady=10)
@@ -114,16 +453,29 @@ class BldBuyApp:
         # 将消息添加到日志列表
         self.log_messages.append(message)
         
-        # 实时显示日志
+        # 后台工作进程中没有日志窗口，日志由主进程统一输出
+        if self.root is None:
+            return
+        
+        # 交给界面线程显示
+        self.ui_events.post_log(message, "warning" if message.startswith("警告：") else None)
+        
+    def append_log_lines(self, entries):
+        """在界面线程中批量显示日志，entries为[(消息, 标签)]"""
         self.log_text.config(state=NORMAL)
-        if message.startswith("警告："):
-            self.log_text.tag_config("warning", foreground="red")
-            self.log_text.insert(END, message + "\n", "warning")
-        else:
-            self.log_text.insert(END, message + "\n")
+        self.log_text.tag_config("warning", foreground="red")
+        for message, tag in entries:
+            if tag:
+                self.log_text.insert(END, message + "\n", tag)
+            else:
+                self.log_text.insert(END, message + "\n")
         self.log_text.see(END)
         self.log_text.config(state=DISABLED)
         
+    def set_progress_value(self, value):
+        """在界面线程中更新进度条"""
+        self.progress['value'] = value
+        
     def start_processing(self):
         if self.processing:
             return
@@ -133,235 +485,773 @@ class BldBuyApp:
         self.log_text.delete(1.0, END)
         self.progress['value'] = 0
         
+        input_files = self.input_file_var.get().split("\n")
+        parallel = self.parallel_var.get()
+        self.profile_run = self.profile_var.get()
+        self.merge_batch = self.merge_var.get()
+        self.confirmation_pipeline = self.confirmation_var.get()
+        self.hotel_profile = get_hotel_profile(get_application_path(), self.hotel_var.get())
+        try:
+            self.memory_budget = self.memory_budget_var.get() if self.memory_var.get() else None
+        except TclError:
+            self.memory_budget = DEFAULT_MEMORY_BUDGET_MB
+        
         # 使用线程处理，避免界面卡顿
-        threading.Thread(target=self.process_files, daemon=True).start()
+        threading.Thread(target=self.process_files, args=(input_files, parallel), daemon=True).start()
         
     def preprocess_excel(self, file_path):
-        """预处理Excel文件，自动搜索表头位置"""
-        # 自动搜索表头位置
-        header_row = self.find_header_row(file_path)
-        
-        # 使用找到的表头行读取数据
-        df = pd.read_excel(file_path, skiprows=header_row)
+        """预处理Excel文件，单次读取中自动搜索表头位置并读取数据；内容未变化的报表直接使用缓存的解析结果"""
+        frame_cache = get_frame_cache(os.path.join(get_application_path(), 'frame_cache'))
+        cache_kind = frame_cache_kind("statements", self.expected_headers, RETURN_COLUMNS, DEFAULT_HEADER_ROW,
+                                      REPORT_CATEGORY_COLUMNS, REPORT_NUMERIC_COLUMNS)
+        with self.stages.span("read"):
+            df = frame_cache.get(file_path, cache_kind)
+            if df is not None:
+                self.log_message("报表内容未变化，使用缓存的解析结果")
+                return df
+            df = self.read_report(file_path)
         
-        # 添加需要保留的退货相关列，排除N-R列数据
-        required_columns = self.expected_headers + ['退货', '合计退货数量', '退货合计金额(结算)', '退货合计税额(结算)', '退货合计价税(结算)']
+        with self.stages.span("normalization"):
+            df = self.normalize_report(df)
+        frame_cache.put(file_path, cache_kind, df)
+        return df
+    
+    def normalize_report(self, df):
+        """规范化报表数据：收货日期去掉时间部分（保持为日期类型，写出时再格式化），
+        去掉全空的行，各列转换为紧凑类型"""
+        if '收货日期' in df.columns:
+            df['收货日期'] = pd.to_datetime(df['收货日期'], errors='coerce').dt.normalize()
         
-        # 过滤并重新排列列，排除N-R列的数据
-        exclude_columns = df.iloc[:, 13:17].columns.tolist()  # N-R列的索引是13-17
-        df = df.drop(columns=exclude_columns, errors='ignore')
+        df = df.dropna(how='all')
+        return apply_report_schema(df)
+    
+    def report_columns(self, columns):
+        """根据报表的列名确定要读取的列：预期表头和退货相关列，排除N-R列数据"""
+        required_columns = self.expected_headers + RETURN_COLUMNS
+        # N-R列的索引是13-17
+        exclude_columns = set(columns[13:17])
+        available = set(columns) - exclude_columns
+        return [col if col != '单位' else '基本单位' for col in required_columns if col in available or col == '基本单位']
         
-        # 过滤并保留所需列
-        df_filtered = df.reindex(columns=[col if col != '单位' else '基本单位' for col in required_columns if col in df.columns or col == '基本单位'])
+    def read_report(self, file_path):
+        """流式读取报表：逐行扫描找到表头后，在同一次读取中继续读取数据行，只取出需要的列"""
+        rows = iter_excel_rows(file_path)
+        try:
+            header, usecols, data_rows = self.locate_header(rows)
+            if header is None:
+                return pd.DataFrame(columns=usecols)
+            return frame_from_rows(header, data_rows, usecols)
+        finally:
+            rows.close()
         
-        # 处理收货日期，去掉时间部分
-        if '收货日期' in df_filtered.columns:
-            df_filtered['收货日期'] = pd.to_datetime(df_filtered['收货日期'], errors='coerce').dt.strftime('%Y-%m-%d')
+    def locate_header(self, rows):
+        """在逐行读取的报表中找到表头，返回(表头行, 要读取的列, 表头之后各行的迭代器)
         
-        return df_filtered.dropna(how='all')
+        表头行超出报表范围时返回的表头行为None。
+        """
+        head = [tuple(normalize_cell(value) for value in row) for row in islice(rows, HEADER_SEARCH_ROWS)]
         
-    def find_header_row(self, file_path):
-        """自动搜索Excel文件中的表头行"""
-        # 最大搜索行数
-        max_rows = 50
+        # 相同版式的报表直接使用记忆的表头行，跳过表头搜索
+        with self.stages.span("header_detection"):
+            cache = get_header_layout_cache()
+            fingerprint = cache.fingerprint(head[:LAYOUT_FINGERPRINT_ROWS])
+            header_row = cache.get(fingerprint)
+            if header_row is not None and header_row < len(head) and \
+                    self.count_header_matches(head[header_row]) >= HEADER_MATCH_THRESHOLD:
+                self.log_message(f"使用已记忆的表头行: 第{header_row+1}行")
+            else:
+                header_row = self.detect_header_row(head)
+                if header_row is None:
+                    self.log_message(f"未找到表头行，使用默认值({DEFAULT_HEADER_ROW})")
+                    header_row = DEFAULT_HEADER_ROW
+                else:
+                    cache.put(fingerprint, header_row)
         
-        # 读取前max_rows行来查找表头
-        sample_df = pd.read_excel(file_path, nrows=max_rows, header=None)
+        if header_row >= len(head):
+            return None, self.report_columns([]), iter(())
+        header = head[header_row]
+        return header, self.report_columns(make_unique_columns(header)), chain(head[header_row + 1:], rows)
         
-        # 定义匹配度阈值（至少需要匹配的表头数量）
-        min_match_threshold = 3
+    def count_header_matches(self, row):
+        """计算一行与预期表头的匹配数量"""
+        cells = ['' if cell is None else str(cell) for cell in row]
+        return sum(1 for header in self.expected_headers if any(header in cell for cell in cells))
         
+    def detect_header_row(self, rows):
+        """在给定的前若干行中搜索表头行，未找到时返回None"""
         # 遍历每一行，检查是否包含足够多的预期表头
-        for i in range(max_rows):
-            row = sample_df.iloc[i].astype(str)
+        for i, row in enumerate(rows):
             # 计算当前行与预期表头的匹配数量
-            matches = sum(1 for header in self.expected_headers if any(header in str(cell) for cell in row))
+            matches = self.count_header_matches(row)
             
             # 如果匹配数量超过阈值，认为找到了表头行
-            if matches >= min_match_threshold:
+            if matches >= HEADER_MATCH_THRESHOLD:
                 self.log_message(f"找到表头行: 第{i+1}行，匹配度: {matches}/{len(self.expected_headers)}")
                 return i
         
-        # 如果没有找到，使用默认值
-        self.log_message("未找到表头行，使用默认值(35)")
-        return 35
+        return None
         
-    def process_files(self):
+    def find_header_row(self, file_path):
+        """自动搜索Excel文件中的表头行（只读取到前HEADER_SEARCH_ROWS行为止）"""
+        rows = iter_excel_rows(file_path)
+        try:
+            head = [tuple(normalize_cell(value) for value in row) for row in islice(rows, HEADER_SEARCH_ROWS)]
+        finally:
+            rows.close()
+        
+        header_row = self.detect_header_row(head)
+        if header_row is None:
+            # 如果没有找到，使用默认值
+            self.log_message(f"未找到表头行，使用默认值({DEFAULT_HEADER_ROW})")
+            return DEFAULT_HEADER_ROW
+        return header_row
+        
+    def process_files(self, input_files, parallel=False):
         try:
-            # 初始化日志列表
-            self.log_messages = []
-            
-            input_files = self.input_file_var.get().split("\n")
-            if not input_files or not input_files[0]:
-                self.log_message("请先选择要处理的Excel文件")
-                return
-                
             output_folder = "export"
-            archive_folder = "archive"
-            
-            # 确保文件夹存在
-            for folder in [output_folder, archive_folder]:
-                if not os.path.exists(folder):
-                    os.makedirs(folder)
-                    self.log_message(f"创建文件夹: {folder}")
-            
-            # 计算总文件数
-            total_files = len([f for f in input_files if f])
-            processed_files = 0
+            file_results = self.run_batch(input_files, parallel, output_folder)
+            if not file_results:
+                return
             
-            # 处理每个文件
-            for input_file in input_files:
-                if not input_file:  # 跳过空路径
-                    continue
-                    
-                self.log_message(f"\n正在处理文件: {os.path.basename(input_file)}")
-                
-                try:
-                    # 读取config.txt获取标题信息
-                    # 获取程序运行路径
-                    if getattr(sys, 'frozen', False):
-                        # 如果是打包后的exe运行
-                        application_path = os.path.dirname(sys.executable)
-                    else:
-                        # 如果是python脚本运行
-                        application_path = os.path.dirname(os.path.abspath(__file__))
-                    config_file = os.path.join(application_path, 'config.txt')
-                    if os.path.exists(config_file):
-                        with open(config_file, 'r', encoding='utf-8') as f:
-                            config_lines = f.readlines()
-                        
-                        # 解析config.txt中的信息
-                        hotelname = ''
-                        sheet_title = ''
-                        for line in config_lines:
-                            if line.startswith('hotelname:'):
-                                hotelname = line.split(':', 1)[1].strip()
-                            elif line.startswith('Sheet_tittle:'):
-                                sheet_title = line.split(':', 1)[1].strip()
-                        
-                        # 创建标题行
-                        header_rows = [
-                            [''] * 13,
-                            [''] * 5 + [hotelname] + [''] * 7,
-                            [''] * 5 + [sheet_title] + [''] * 7,
-                            [''] * 13,
-                            [''] * 13
-                        ]
-                    else:
-                        header_rows = []
-                        self.log_message("警告：未找到config.txt文件,将会导致对帐单标题错误")
-                    
-                    df_filtered = self.preprocess_excel(input_file)
-                    
-                    # 检查表头
-                    missing_columns = set(self.expected_headers) - set(df_filtered.columns)
-                    if missing_columns:
-                        self.log_message(f"警告：文件缺少以下列：{', '.join(missing_columns)}")
-                        continue
-                    
-                    # 处理收货日期
-                    if '收货日期' in df_filtered.columns:
-                        df_filtered['收货日期'] = pd.to_datetime(df_filtered['收货日期'], errors='coerce').dt.strftime('%Y-%m-%d')
-                        earliest_date = df_filtered['收货日期'].min()
-                        year_month = datetime.strptime(earliest_date, '%Y-%m-%d').strftime('%Y-%m') if earliest_date else None
-                        
-                        if not year_month:
-                            self.log_message("警告：文件中没有有效的收货日期，无法确定年月。")
-                            continue
-                            
-                        # 创建年月子文件夹
-                        year_month_folder = os.path.join(output_folder, year_month)
-                        if not os.path.exists(year_month_folder):
-                            os.makedirs(year_month_folder)
-                            
-                    # 分组处理
-                    group_columns = ['供应商/备用金报销账户', '税率']
-                    sort_columns = ['收货日期']
-                    
-                    # 将税率转换为百分比格式
-                    def convert_tax_rate(x):
-                        if pd.isna(x):
-                            return '0%'
-                        tax_str = str(x).strip().replace('%', '')
-                        try:
-                            tax_value = float(tax_str)
-                            if tax_value < 1:  # 如果是小数形式（如0.13）
-                                return f"{int(tax_value * 100)}%"
-                            return f"{int(tax_value)}%"
-                        except ValueError:
-                            return '0%'
-                    
-                    df_filtered['税率'] = df_filtered['税率'].apply(convert_tax_rate)
-                    
-                    if all(col in df_filtered.columns for col in sort_columns):
-                        sorted_df = df_filtered.sort_values(by=sort_columns).groupby(group_columns)
-                    else:
-                        self.log_message("警告：文件中缺少排序所需的列，将不按顺序处理数据。")
-                        sorted_df = df_filtered.groupby(group_columns)
-                        
-                    # 处理每个分组
-                    for group_name, group_data in sorted_df:
-                        supplier_account, tax_rate = group_name
-                        self.process_group_data(supplier_account, group_data, year_month, year_month_folder, header_rows, tax_rate)
-                        
-                    # 归档文件
-                    archive_filepath = os.path.join(archive_folder, os.path.basename(input_file))
-                    if os.path.exists(archive_filepath):
-                        base, ext = os.path.splitext(os.path.basename(input_file))
-                        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                        archive_filepath = os.path.join(archive_folder, f"{base}_{timestamp}{ext}")
-                        
-                    shutil.move(input_file, archive_filepath)
-                    self.log_message(f"已成功归档文件 {os.path.basename(input_file)}")
-                    
-                    # 更新进度
-                    processed_files += 1
-                    progress_value = int((processed_files / total_files) * 100)
-                    self.progress['value'] = progress_value
-                    self.root.update_idletasks()  # 强制更新UI
-                    
-                except Exception as e:
-                    self.log_message(f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}")
-                    
             # 在处理完成后只显示警告信息
             warning_messages = [msg for msg in self.log_messages if msg.startswith("警告：")]
             if warning_messages:
                 self.log_message("\n所有文件处理完成。以下是处理过程中的警告信息：")
                 for msg in warning_messages:
-                    self.log_text.config(state=NORMAL)
-                    self.log_text.tag_config("warning", foreground="red")
-                    self.log_text.insert(END, msg + "\n", "warning")
-                    self.log_text.see(END)
-                    self.log_text.config(state=DISABLED)
+                    self.ui_events.post_log(msg, "warning")
             else:
                 self.log_message("\n所有文件处理完成，没有发现警告信息。")
             
-            self.progress['value'] = 100
+            self.update_progress(100)
             
             # 询问是否打开输出目录
-            if input_files:
-                open_folder = messagebox.askyesno("处理完成", "所有文件处理已完成，是否打开输出文件夹？")
-                if open_folder:
+            open_folder = self.ui_events.invoke(messagebox.askyesno, "处理完成", "所有文件处理已完成，是否打开输出文件夹？")
+            if open_folder:
+                try:
+                    os.startfile(output_folder)
+                except:
                     try:
-                        os.startfile(output_folder)
+                        if sys.platform == "darwin":  # macOS
+                            subprocess.call(["open", output_folder])
+                        else:  # Linux
+                            subprocess.call(["xdg-open", output_folder])
                     except:
-                        try:
-                            if sys.platform == "darwin":  # macOS
-                                subprocess.call(["open", output_folder])
-                            else:  # Linux
-                                subprocess.call(["xdg-open", output_folder])
-                        except:
-                            self.log_message("无法打开文件夹，请手动访问：")
-                            self.log_message(output_folder)
+                        self.log_message("无法打开文件夹，请手动访问：")
+                        self.log_message(output_folder)
             
         except Exception as e:
             self.log_message(f"处理过程中发生错误: {str(e)}")
         finally:
             self.processing = False
-            self.process_btn.config(state=NORMAL)
+            self.ui_events.post_call(self.process_btn.config, state=NORMAL)
+            
+    def run_batch(self, input_files, parallel=False, output_folder="export", archive_folder="archive"):
+        """处理一批报表并归档成功的文件（不涉及界面），返回每个文件的(路径, 是否成功, 警告列表)"""
+        # 初始化日志列表和统计
+        self.log_messages = []
+        self.row_count = 0
+        self.group_count = 0
+        self.stages = StageRecorder()
+        
+        input_files = [f for f in input_files if f]  # 跳过空路径
+        if not input_files:
+            self.log_message("请先选择要处理的Excel文件")
+            return []
+            
+        # 确保文件夹存在
+        for folder in [output_folder, archive_folder]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+                self.log_message(f"创建文件夹: {folder}")
+        
+        # 阶段耗时明细和性能分析结果保存在程序目录的logs文件夹（与确认函工具相同）
+        log_folder = os.path.join(get_application_path(), "logs")
+        if self.profile_run and parallel:
+            # cProfile只能分析当前进程，性能分析时逐个处理以便看到完整的处理过程
+            self.log_message("性能分析模式：不使用多进程，逐个处理文件")
+            parallel = False
+        
+        with RunProfiler(self.profile_run, log_folder, "statements") as profiler:
+            file_results = self.process_batch_files(input_files, parallel, output_folder, archive_folder)
+        report_stages(self.stages, log_folder, "statements", self.log_message, profiler.path)
+        return file_results
+        
+    def process_batch_files(self, input_files, parallel, output_folder, archive_folder):
+        """按内容去重后逐个（或在进程池中）处理文件并归档，返回每个文件的(路径, 是否成功, 警告列表)"""
+        # 计算总文件数
+        total_files = len(input_files)
+        processed_files = 0
+        
+        # 按内容识别已处理过的文件和本次重复选择的文件（包括改名后的副本）
+        self.manifest = manifest = RunManifest(output_folder)
+        self.group_records = []
+        profile = self.get_hotel_profile()
+        settings_hash = profile.content_hash if profile is not None else ""
+        if self.confirmation_pipeline:
+            settings_hash += "+confirmation"
+        content_hashes = {}
+        duplicate_of = {}
+        processed_entries = {}
+        first_by_hash = {}
+        for input_file in input_files:
+            try:
+                content_hash = file_sha256(input_file)
+            except OSError:
+                continue  # 无法读取的文件由process_file报告错误
+            content_hashes[input_file] = content_hash
+            if content_hash in first_by_hash:
+                duplicate_of[input_file] = first_by_hash[content_hash]
+                continue
+            first_by_hash[content_hash] = input_file
+            # 合并模式下已处理过的文件也要重新读取，否则它们的数据不会出现在合并后的对账单中
+            entry = None if self.merge_batch else manifest.find_processed_file(content_hash, settings_hash)
+            if entry is not None:
+                processed_entries[input_file] = entry
+        files_to_process = [f for f in input_files if f not in duplicate_of and f not in processed_entries]
+        
+        if self.merge_batch:
+            self.parallel_groups = parallel
+            merged_success = self.process_merged_files(files_to_process, output_folder)
+            results = iter(merged_success[input_file] for input_file in files_to_process)
+            if any(merged_success.values()):
+                manifest.record_groups(self.group_records)
+                try:
+                    manifest.save()
+                except OSError as e:
+                    self.log_message(f"警告：保存处理记录失败: {str(e)}")
+        elif parallel and (len(files_to_process) > 1 or (files_to_process and self.files_in_pool)):
+            results = self.process_files_in_pool(files_to_process, output_folder)
+        else:
+            # 逐个处理文件时，在文件内部并行生成各供应商的对账单
+            self.parallel_groups = parallel
+            results = (self.process_file_safely(input_file, output_folder) for input_file in files_to_process)
+        
+        # 按选择顺序归档文件并更新进度
+        file_results = []
+        file_success = {}
+        # 处理中途出错时也要立即关闭results，进程池处理时由它清理暂存目录
+        with closing(results):
+            for input_file in input_files:
+                first_message = len(self.log_messages)
+                first_record = len(self.group_records)
+                if input_file in processed_entries:
+                    entry = processed_entries[input_file]
+                    self.log_message(f"\n跳过文件 {os.path.basename(input_file)}：内容与 {entry['processed_at']} 处理的 {entry['name']} 相同，对账单没有变化")
+                    success = True
+                elif input_file in duplicate_of:
+                    original = duplicate_of[input_file]
+                    self.log_message(f"\n跳过文件 {os.path.basename(input_file)}：内容与本次选择的 {os.path.basename(original)} 相同")
+                    success = file_success[original]
+                else:
+                    success = next(results)
+                    if success and input_file in content_hashes and not self.merge_batch:
+                        manifest.record_file(content_hashes[input_file], os.path.basename(input_file),
+                                             settings_hash, self.group_records[first_record:])
+                        try:
+                            manifest.save()
+                        except OSError as e:
+                            self.log_message(f"警告：保存处理记录失败: {str(e)}")
+                file_success[input_file] = success
+                if success:
+                    try:
+                        self.archive_file(input_file, archive_folder)
+                        
+                        # 更新进度
+                        processed_files += 1
+                        self.update_progress(int((processed_files / total_files) * 100))
+                        
+                    except Exception as e:
+                        self.log_message(f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}")
+                file_warnings = [msg for msg in self.log_messages[first_message:] if msg.startswith("警告：")]
+                file_results.append((input_file, success, file_warnings))
+        return file_results
+        
+    def update_progress(self, value):
+        """更新进度条（没有窗口时忽略）"""
+        if self.root is None:
+            return
+        self.ui_events.post_progress(value)
+        
+    def process_file_safely(self, input_file, output_folder):
+        """处理单个文件并捕获异常，返回是否成功生成对账单"""
+        try:
+            return self.process_file(input_file, output_folder)
+        except Exception as e:
+            self.log_message(f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}")
+            return False
+            
+    def process_files_in_pool(self, input_files, output_folder):
+        """把每个文件分发到工作进程池处理，按选择顺序返回每个文件是否成功
+        
+        每个工作进程先写入各自的暂存目录，主进程再按文件顺序输出日志并把结果移入
+        输出目录，保证日志、警告和同名文件的覆盖顺序与逐个处理时一致。
+        """
+        pool = get_process_pool()
+        # 每次调用使用各自的暂存目录，共用输出目录的多个运行不会移走或删除彼此的结果
+        staging_root = tempfile.mkdtemp(prefix=".staging-", dir=output_folder)
+        staging_folders = [os.path.join(staging_root, str(index)) for index in range(len(input_files))]
+        # 低内存模式下各工作进程平分内存预算
+        memory_budget = self.memory_budget / get_worker_count() if self.memory_budget else None
+        futures = [pool.submit(_process_file_in_worker, input_file, staging_folder, self.manifest,
+                               self.confirmation_pipeline, self.hotel_profile, memory_budget)
+                   for input_file, staging_folder in zip(input_files, staging_folders)]
+        
+        try:
+            for input_file, staging_folder, future in zip(input_files, staging_folders, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"success": False, "messages": [f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}"]}
+                success = result["success"]
+                self.replay_worker_messages(result["messages"])
+                self.row_count += result.get("row_count", 0)
+                self.group_count += result.get("group_count", 0)
+                self.group_records.extend(result.get("group_records", []))
+                self.stages.extend(result.get("spans", []), file=os.path.basename(input_file))
+                if success:
+                    self.commit_staged_outputs(staging_folder, output_folder)
+                yield success
+        finally:
+            shutil.rmtree(staging_root, ignore_errors=True)
             
-    def process_group_data(self, group_name, group_data, year_month, year_month_folder, header_rows, tax_rate):
-        """处理每个分组的数据"""
+    def commit_staged_outputs(self, staging_folder, output_folder):
+        """把暂存目录中的对账单移入输出目录（覆盖同名文件）"""
+        for dirpath, _, filenames in os.walk(staging_folder):
+            target_folder = os.path.join(output_folder, os.path.relpath(dirpath, staging_folder))
+            os.makedirs(target_folder, exist_ok=True)
+            for filename in filenames:
+                os.replace(os.path.join(dirpath, filename), os.path.join(target_folder, filename))
+                
+    def process_file(self, input_file, output_folder):
+        """处理单个报表文件，生成各供应商的对账单，返回是否需要归档"""
+        self.log_message(f"\n正在处理文件: {os.path.basename(input_file)}")
+        self.stages.labels = {"file": os.path.basename(input_file)}
+        
+        header_rows = self.load_header_rows()
+        if self.memory_budget:
+            return self.process_file_in_partitions(input_file, output_folder, header_rows)
+        report = self.load_report(input_file)
+        if report is None:
+            return False
+        df_filtered, year_month = report
+                
+        # 分组处理
+        with self.stages.span("grouping"):
+            group_slices = self.split_groups(df_filtered)
+        self.render_groups(group_slices, year_month, output_folder, header_rows)
+        return True
+        
+    def process_merged_files(self, input_files, output_folder):
+        """合并模式：读取本批全部报表，按月份合并并去掉重复的订单行后只分组一次，返回{文件: 是否成功}"""
+        header_rows = self.load_header_rows()
+        if self.memory_budget:
+            return self.process_merged_files_in_partitions(input_files, output_folder, header_rows)
+        success = {}
+        reports_by_month = {}
+        for input_file in input_files:
+            self.log_message(f"\n正在读取文件: {os.path.basename(input_file)}")
+            self.stages.labels = {"file": os.path.basename(input_file)}
+            try:
+                report = self.load_report(input_file)
+            except Exception as e:
+                self.log_message(f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}")
+                report = None
+            success[input_file] = report is not None
+            if report is not None:
+                df_filtered, year_month = report
+                reports_by_month.setdefault(year_month, []).append((input_file, df_filtered))
+        
+        self.stages.labels = {"file": "merged"}
+        for year_month, reports in sorted(reports_by_month.items()):
+            try:
+                with self.stages.span("grouping"):
+                    merged = self.merge_reports([df for _, df in reports])
+                    group_slices = self.split_groups(merged)
+                self.log_message(f"\n{year_month}：合并 {len(reports)} 个报表，共 {len(merged)} 行数据，{len(group_slices)} 个对账单")
+                self.render_groups(group_slices, year_month, output_folder, header_rows)
+            except Exception as e:
+                self.log_message(f"合并处理 {year_month} 的报表时出错: {str(e)}")
+                for input_file, _ in reports:
+                    success[input_file] = False
+        return success
+        
+    def merge_reports(self, frames):
+        """合并同一月份的报表，去掉与前面报表中完全相同的订单行（同一报表内的相同行保留）"""
+        merged, duplicate_count = self.drop_repeated_rows(frames)
+        if duplicate_count:
+            self.log_message(f"去掉了 {duplicate_count} 行与其他报表重复的订单行")
+        return merged
+        
+    def drop_repeated_rows(self, frames, columns=None):
+        """按columns（默认为各报表列的并集）对齐后合并各报表，去掉与前面报表中完全相同的行，
+        返回(合并结果, 去掉的行数)"""
+        if columns is None:
+            columns = list(dict.fromkeys(col for df in frames for col in df.columns))
+        seen = set()
+        parts = []
+        duplicate_count = 0
+        for df in frames:
+            # 缺少的列补为空值后也转换为紧凑类型，使相同的行有相同的哈希
+            df = apply_report_schema(df.reindex(columns=columns))
+            row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            is_duplicate = pd.Index(row_hashes).isin(seen) if seen else np.zeros(len(df), dtype=bool)
+            duplicate_count += int(is_duplicate.sum())
+            parts.append(df[~is_duplicate])
+            seen.update(row_hashes.tolist())
+        # 各报表的分类列取值不同时合并结果为普通列，重新转换为紧凑类型
+        return apply_report_schema(pd.concat(parts, ignore_index=True)), duplicate_count
+        
+    def get_hotel_profile(self):
+        """获取酒店配置：指定了hotel_profile时使用它，否则使用程序目录的config.txt（不存在时返回None）"""
+        if self.hotel_profile is not None:
+            return self.hotel_profile
+        return get_hotel_profile(get_application_path())
+        
+    def load_header_rows(self):
+        """由酒店配置中的酒店名称和表格标题生成对账单的标题行"""
+        profile = self.get_hotel_profile()
+        if profile is not None:
+            # 创建标题行
+            return [
+                [''] * 13,
+                [''] * 5 + [profile.statement_hotel_name] + [''] * 7,
+                [''] * 5 + [profile.sheet_title] + [''] * 7,
+                [''] * 13,
+                [''] * 13
+            ]
+        self.log_message("警告：未找到config.txt文件,将会导致对帐单标题错误")
+        return []
+        
+    def load_report(self, input_file):
+        """读取并检查报表，返回(数据, 年月)；报表不可用时记录警告并返回None"""
+        df_filtered = self.preprocess_excel(input_file)
+        
+        # 检查表头
+        missing_columns = set(self.expected_headers) - set(df_filtered.columns)
+        if missing_columns:
+            self.log_message(f"警告：文件缺少以下列：{', '.join(missing_columns)}")
+            return None
+        
+        # 由最早的收货日期确定年月
+        with self.stages.span("normalization"):
+            earliest_date = df_filtered['收货日期'].min()
+            year_month = earliest_date.strftime('%Y-%m') if pd.notna(earliest_date) else None
+        
+        if not year_month:
+            self.log_message("警告：文件中没有有效的收货日期，无法确定年月。")
+            return None
+        return df_filtered, year_month
+        
+    def render_groups(self, group_slices, year_month, output_folder, header_rows):
+        """生成各分组的对账单，内容没有变化且对账单仍然存在的分组保留原有对账单"""
+        year_month_folder = self.make_year_month_folder(output_folder, year_month)
+        group_tasks = list(self.iter_group_tasks(group_slices, year_month, year_month_folder, header_rows))
+        unchanged_groups = group_tasks.count(None)
+        if unchanged_groups:
+            self.log_message(f"{unchanged_groups} 个供应商的数据没有变化，保留原有对账单")
+        self.render_group_tasks([task for task in group_tasks if task is not None])
+        
+    def make_year_month_folder(self, output_folder, year_month):
+        """创建并返回年月子文件夹"""
+        year_month_folder = os.path.join(output_folder, year_month)
+        if not os.path.exists(year_month_folder):
+            os.makedirs(year_month_folder)
+        return year_month_folder
+        
+    def iter_group_tasks(self, group_slices, year_month, year_month_folder, header_rows):
+        """逐个返回各分组的对账单生成任务；内容没有变化且对账单仍然存在的分组记录原有结果并返回None"""
+        for (supplier_account, tax_rate), group_data in group_slices:
+            self.row_count += len(group_data)
+            self.group_count += 1
+            group_key = RunManifest.group_key(year_month, supplier_account, tax_rate)
+            if self.confirmation_pipeline:
+                group_hash = hash_frame(group_data, header_rows, "confirmation")
+            else:
+                group_hash = hash_frame(group_data, header_rows)
+            if self.manifest is not None and self.manifest.is_group_current(group_key, group_hash):
+                self.group_records.append((group_key, self.manifest.groups[group_key]))
+                yield None
+                continue
+            yield (supplier_account, group_data, year_month, year_month_folder, header_rows, tax_rate,
+                   group_key, group_hash)
+        
+    def render_group_tasks(self, group_tasks):
+        """逐个（或在进程池中）生成并保存各分组的对账单"""
+        if self.parallel_groups:
+            self.render_groups_in_pool(group_tasks)
+        else:
+            for task in group_tasks:
+                self.process_group_data(*task)
+        
+    def process_file_in_partitions(self, input_file, output_folder, header_rows):
+        """低内存模式：分块读取报表并按(供应商, 税率)暂存到磁盘分区，再逐个分区生成对账单"""
+        with SpillPartitions(self.memory_budget_rows(0)) as partitions:
+            report = self.spill_report(input_file, partitions)
+            if report is None:
+                return False
+            year_month = report["year_month"]
+            groups = self.partition_groups([report])
+            self.log_message(f"已按供应商和税率分为 {len(groups)} 个分区，逐个分区生成对账单")
+            self.render_groups_lazily(self.iter_partition_slices(partitions, [report], groups),
+                                      year_month, output_folder, header_rows)
+        return True
+        
+    def process_merged_files_in_partitions(self, input_files, output_folder, header_rows):
+        """低内存模式的合并处理：各报表分块暂存到磁盘分区，再按(月份, 供应商, 税率)逐个合并生成对账单"""
+        success = {}
+        reports_by_month = {}
+        with SpillPartitions(self.memory_budget_rows(0)) as partitions:
+            for index, input_file in enumerate(input_files):
+                self.log_message(f"\n正在读取文件: {os.path.basename(input_file)}")
+                self.stages.labels = {"file": os.path.basename(input_file)}
+                try:
+                    report = self.spill_report(input_file, partitions, index)
+                except Exception as e:
+                    self.log_message(f"处理文件 {os.path.basename(input_file)} 时出错: {str(e)}")
+                    report = None
+                success[input_file] = report is not None
+                if report is not None:
+                    report["input_file"] = input_file
+                    reports_by_month.setdefault(report["year_month"], []).append(report)
+            
+            self.stages.labels = {"file": "merged"}
+            for year_month, reports in sorted(reports_by_month.items()):
+                try:
+                    groups = self.partition_groups(reports)
+                    self.log_message(f"\n{year_month}：合并 {len(reports)} 个报表，{len(groups)} 个供应商分区，逐个分区生成对账单")
+                    self.duplicate_count = 0
+                    self.render_groups_lazily(self.iter_partition_slices(partitions, reports, groups),
+                                              year_month, output_folder, header_rows)
+                    if self.duplicate_count:
+                        self.log_message(f"去掉了 {self.duplicate_count} 行与其他报表重复的订单行")
+                except Exception as e:
+                    self.log_message(f"合并处理 {year_month} 的报表时出错: {str(e)}")
+                    for report in reports:
+                        success[report["input_file"]] = False
+        return success
+        
+    def memory_budget_rows(self, bytes_per_row):
+        """按内存预算计算每块读取（及每次写入磁盘分区前缓冲）的行数；bytes_per_row未知时为0"""
+        if bytes_per_row <= 0:
+            return MEMORY_PROBE_ROWS
+        budget = self.memory_budget * 1024 * 1024 * CHUNK_BUDGET_SHARE
+        return max(MEMORY_PROBE_ROWS, int(budget / bytes_per_row))
+        
+    def spill_report(self, input_file, partitions, file_key=None):
+        """低内存模式：分块读取报表，把有供应商的数据行按(file_key, 供应商, 税率)追加到磁盘分区
+        
+        每块数据与整表读取时一样转换和检查，只保留年月所需的最早收货日期和各列的类型信息。
+        返回报表信息{"year_month", "tracker", "columns", "keys"}；报表不可用时记录警告并返回None。
+        """
+        # openpyxl的只读模式逐行解析工作表，不会一次把整个工作表读入内存
+        rows = iter_excel_rows(input_file, engine="openpyxl")
+        try:
+            with self.stages.span("read"):
+                header, usecols, data_rows = self.locate_header(rows)
+            
+            # 检查表头
+            missing_columns = set(self.expected_headers) - set(usecols)
+            if missing_columns:
+                self.log_message(f"警告：文件缺少以下列：{', '.join(missing_columns)}")
+                return None
+            
+            columns, names, indices = select_columns(header, usecols)
+            supplier_position = names.index('供应商/备用金报销账户')
+            tax_rate_position = names.index('税率')
+            tracker = ColumnTypeTracker(names)
+            earliest_date = pd.NaT
+            keys = {}
+            row_number = 0
+            chunk_rows = self.memory_budget_rows(0)
+            while True:
+                with self.stages.span("read"):
+                    cells = list(select_cells(islice(data_rows, chunk_rows), len(columns), indices))
+                    if not cells:
+                        break
+                    chunk = parse_cells(names, cells, usecols)
+                
+                with self.stages.span("normalization"):
+                    tracker.update(cells[:len(chunk)], chunk)
+                    dates = pd.to_datetime(chunk['收货日期'], errors='coerce')
+                    if dates.notna().any():
+                        earliest_date = min(earliest_date, dates.min()) if pd.notna(earliest_date) else dates.min()
+                    # 没有供应商的行不属于任何分组（全空的行也没有供应商）
+                    keep = chunk['供应商/备用金报销账户'].notna().to_numpy()
+                
+                with self.stages.span("spill"):
+                    chunk_partitions = {}
+                    for position in np.flatnonzero(keep):
+                        row = cells[position]
+                        key = (file_key, row[supplier_position], convert_tax_rate(row[tax_rate_position]))
+                        chunk_partitions.setdefault(key, []).append((row_number + position, row))
+                    for key, key_rows in chunk_partitions.items():
+                        keys[key] = None
+                        partitions.append(key, key_rows)
+                
+                if row_number == 0:
+                    # 按第一块估计每行占用的内存，确定之后每块的行数
+                    bytes_per_row = chunk.memory_usage(deep=True).sum() * 3 / max(len(chunk), 1)
+                    chunk_rows = partitions.max_buffered_rows = self.memory_budget_rows(bytes_per_row)
+                row_number += len(cells)
+            partitions.flush()
+        finally:
+            rows.close()
+        
+        if pd.isna(earliest_date):
+            self.log_message("警告：文件中没有有效的收货日期，无法确定年月。")
+            return None
+        return {"year_month": earliest_date.strftime('%Y-%m'), "tracker": tracker, "columns": usecols,
+                "keys": list(keys)}
+        
+    def partition_groups(self, reports):
+        """把各报表的磁盘分区按转换后的(供应商, 税率)归为对账单分组，按整表处理时的分组顺序返回
+        
+        单元格原值不同（如文本"001"和数字1）但转换后相同的供应商属于同一个分组。
+        返回[(供应商, 税率), [(报表序号, 分区键)]]。
+        """
+        groups = {}
+        for report_index, report in enumerate(reports):
+            raw_suppliers = [[supplier] for _, supplier, _ in report["keys"]]
+            suppliers = report["tracker"].parse(raw_suppliers, names=['供应商/备用金报销账户'])['供应商/备用金报销账户']
+            for key, supplier in zip(report["keys"], suppliers.tolist()):
+                groups.setdefault((supplier, key[2]), []).append((report_index, key))
+        if not groups:
+            return []
+        order = pd.DataFrame([group for group in groups], columns=['供应商', '税率']).sort_values(['供应商', '税率'])
+        group_keys = list(groups)
+        return [(group_keys[i], groups[group_keys[i]]) for i in order.index]
+        
+    def iter_partition_slices(self, partitions, reports, groups):
+        """从磁盘分区逐个读取对账单分组，与整表处理时一样转换、合并和排序，每次只返回一个分组"""
+        month_columns = list(dict.fromkeys(col for report in reports for col in report["columns"]))
+        for _, partition_keys in groups:
+            with self.stages.span("grouping"):
+                frames = []
+                for report_index, report in enumerate(reports):
+                    # 同一报表中属于同一分组的各分区按原来的行顺序合并
+                    numbered_rows = sorted(row for i, key in partition_keys if i == report_index
+                                           for row in partitions.read(key))
+                    if not numbered_rows:
+                        continue
+                    df = report["tracker"].parse([row for _, row in numbered_rows], report["columns"])
+                    frames.append(self.normalize_report(df))
+                if len(reports) > 1:
+                    df, duplicate_count = self.drop_repeated_rows(frames, month_columns)
+                    self.duplicate_count += duplicate_count
+                else:
+                    df = frames[0]
+                group_slices = self.split_groups(df)
+            yield from group_slices
+        
+    def render_groups_lazily(self, group_slices, year_month, output_folder, header_rows):
+        """逐个读取分组并生成对账单（低内存模式），内存中只保留正在处理的几个分组"""
+        year_month_folder = self.make_year_month_folder(output_folder, year_month)
+        unchanged_groups = 0
+        
+        def pending_tasks():
+            nonlocal unchanged_groups
+            for task in self.iter_group_tasks(group_slices, year_month, year_month_folder, header_rows):
+                if task is None:
+                    unchanged_groups += 1
+                else:
+                    yield task
+        
+        self.render_group_tasks(pending_tasks())
+        if unchanged_groups:
+            self.log_message(f"{unchanged_groups} 个供应商的数据没有变化，保留原有对账单")
+        
+    def split_groups(self, df_filtered):
+        """转换税率格式后按(供应商, 税率)分组，返回[((供应商, 税率), 按收货日期排序的分组数据)]"""
+        group_columns = ['供应商/备用金报销账户', '税率']
+        sort_columns = ['收货日期']
+        
+        df_filtered['税率'] = convert_tax_rates(df_filtered['税率'])
+        
+        # 没有供应商的行不属于任何分组
+        df_filtered = df_filtered[df_filtered['供应商/备用金报销账户'].notna()]
+        
+        # 只排序一次，排序后每个分组都是连续的行区间
+        if all(col in df_filtered.columns for col in sort_columns):
+            sorted_df = df_filtered.sort_values(by=group_columns + sort_columns, ignore_index=True)
+        else:
+            self.log_message("警告：文件中缺少排序所需的列，将不按顺序处理数据。")
+            sorted_df = df_filtered.sort_values(by=group_columns, ignore_index=True)
+        
+        return list(self.iter_group_slices(sorted_df, group_columns))
+        
+    def iter_group_slices(self, sorted_df, group_columns):
+        """在已按分组列排序的表中逐个返回(分组键, 该分组的连续行切片)"""
+        row_count = len(sorted_df)
+        if row_count == 0:
+            return
+        columns = [sorted_df[col] for col in group_columns]
+        
+        # 任一分组列的值与上一行不同即为新分组的起点；分类列直接比较分类编码
+        is_start = np.zeros(row_count, dtype=bool)
+        is_start[0] = True
+        for column in columns:
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                key = column.cat.codes.to_numpy()
+            else:
+                key = column.to_numpy()
+            is_start[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(is_start)
+        ends = np.append(starts[1:], row_count)
+        
+        for start, end in zip(starts, ends):
+            yield tuple(column.iloc[start] for column in columns), sorted_df.iloc[start:end]
+        
+    def render_groups_in_pool(self, group_tasks):
+        """把各分组对账单的生成和保存分发到工作进程池
+        
+        每个工作簿只在一个工作进程内创建和保存，进程之间不共享openpyxl对象。
+        同时提交的任务数有上限，避免把所有分组数据一次性复制到各进程；
+        日志按分组顺序输出。
+        """
+        pool = get_process_pool()
+        max_pending = get_worker_count() * 2
+        pending = deque()
+        try:
+            for task in group_tasks:
+                if len(pending) >= max_pending:
+                    self.collect_rendered_group(pending.popleft().result())
+                pending.append(pool.submit(_render_group_in_worker, task, self.confirmation_pipeline,
+                                           self.hotel_profile))
+            while pending:
+                self.collect_rendered_group(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+                
+    def collect_rendered_group(self, result):
+        """输出工作进程生成对账单时的日志，并保存分组记录和阶段耗时"""
+        self.replay_worker_messages(result["messages"])
+        self.group_records.extend(result["group_records"])
+        self.stages.extend(result["spans"], **self.stages.labels)
+        
+    def replay_worker_messages(self, messages):
+        """输出工作进程返回的日志"""
+        for message in messages:
+            self.log_message(message)
+        
+    def archive_file(self, input_file, archive_folder):
+        """归档已处理的文件"""
+        with self.stages.span("archive", file=os.path.basename(input_file)):
+            self._move_to_archive(input_file, archive_folder)
+        
+    def _move_to_archive(self, input_file, archive_folder):
+        archive_filepath = os.path.join(archive_folder, os.path.basename(input_file))
+        if os.path.exists(archive_filepath):
+            base, ext = os.path.splitext(os.path.basename(input_file))
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            archive_filepath = os.path.join(archive_folder, f"{base}_{timestamp}{ext}")
+            
+        shutil.move(input_file, archive_filepath)
+        self.log_message(f"已成功归档文件 {os.path.basename(input_file)}")
+        
+    def process_group_data(self, group_name, group_data, year_month, year_month_folder, header_rows, tax_rate,
+                           group_key=None, group_hash=None):
+        """处理每个分组的数据，给出group_key时把分组的内容哈希、对账单路径和合计金额记入group_records"""
         supplier_account = group_name
         
         # 定义红色文字格式
@@ -385,150 +1275,123 @@ class BldBuyApp:
         sanitized_supplier_account = ''.join([c if c.isalnum() or c in (' ', '.') else '_' for c in str(supplier_account)])
         sanitized_supplier_account = sanitized_supplier_account.strip('_')
         output_filename = '_'.join(filter(None, [year_month, sanitized_supplier_account, tax_rate])) + '.xlsx'
+        if self.hotel_profile is not None:
+            # 命名酒店配置生成的对账单带上配置名称
+            output_filename = self.hotel_profile.tag_file_name(output_filename)
         output_filepath = os.path.join(year_month_folder, output_filename)
         
-        # 创建Excel文件
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Statement"
-        
-        # 插入header
-        for row in header_rows:
-            ws.append(row)
-            
-        # 写入表头和数据
-        ws.append(self.expected_headers)
-        yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-        
-        # 创建一个列表来存储所有行的数据，包括退货行
-        all_rows = []
-        subtotal_amount = 0
-        tax_amount = 0
-        total_amount = 0
-        
-        for row in dataframe_to_rows(group_data, index=False, header=False):
-            # 只保留expected_headers中定义的列
-            formatted_row = [row[group_data.columns.get_loc(col)] if col in group_data.columns else '' for col in self.expected_headers]
-            
-            # 处理税率格式
-            tax_rate_idx = self.expected_headers.index('税率')
-            if len(formatted_row) > tax_rate_idx:
-                tax_rate_value = formatted_row[tax_rate_idx]
-                if pd.notna(tax_rate_value):
-                    # 税率值已经是百分比格式，直接使用
-                    formatted_row[tax_rate_idx] = str(tax_rate_value)
-                else:
-                    formatted_row[tax_rate_idx] = '0%'
-            
-            # 添加原始行
-            all_rows.append((formatted_row, False))  # False表示不是退货行
-            
-            # 更新合计金额
-            subtotal_idx = self.expected_headers.index('小计金额(结算)')
-            tax_idx = self.expected_headers.index('税额(结算)')
-            total_idx = self.expected_headers.index('小计价税(结算)')
-            
-            if len(formatted_row) > max(subtotal_idx, tax_idx, total_idx):
-                if pd.notna(formatted_row[subtotal_idx]):
-                    subtotal_amount += float(formatted_row[subtotal_idx])
-                if pd.notna(formatted_row[tax_idx]):
-                    tax_amount += float(formatted_row[tax_idx])
-                if pd.notna(formatted_row[total_idx]):
-                    total_amount += float(formatted_row[total_idx])
+        group_label = f"{supplier_account}|{tax_rate}"
+        with self.stages.span("render", group=group_label):
+            body, return_mask, totals = self.build_statement_rows(group_data)
             
-            # 检查是否为退货数据并创建退货行
-            if '退货' in group_data.columns and pd.notna(row[group_data.columns.get_loc('退货')]) and row[group_data.columns.get_loc('退货')] == '是':
-                return_row = formatted_row.copy()
-                
-                # 设置退货数量（负数）
-                if '合计退货数量' in group_data.columns:
-                    return_value = -float(row[group_data.columns.get_loc('合计退货数量')])
-                    return_row[self.expected_headers.index('实收数量')] = return_value
-                
-                # 设置退货金额（负数）
-                if '退货合计金额(结算)' in group_data.columns:
-                    return_value = -float(row[group_data.columns.get_loc('退货合计金额(结算)')])
-                    return_row[self.expected_headers.index('小计金额(结算)')] = return_value
-                    subtotal_amount += return_value
-                
-                # 设置退货税额（负数）
-                if '退货合计税额(结算)' in group_data.columns:
-                    return_value = -float(row[group_data.columns.get_loc('退货合计税额(结算)')])
-                    return_row[self.expected_headers.index('税额(结算)')] = return_value
-                    tax_amount += return_value
-                
-                # 设置退货价税合计（负数）
-                if '退货合计价税(结算)' in group_data.columns:
-                    return_value = -float(row[group_data.columns.get_loc('退货合计价税(结算)')])
-                    return_row[self.expected_headers.index('小计价税(结算)')] = return_value
-                    total_amount += return_value
-                
-                all_rows.append((return_row, True))  # True表示是退货行
-        
-        # 写入所有行并设置样式
-        for row_data, is_return in all_rows:
-            ws.append(row_data)
-            if is_return:  # 如果是退货行，设置黄色背景
-                for cell in ws[ws.max_row]:
-                    cell.fill = yellow_fill
-        
-        # 添加合计行
-        last_row = ws.max_row + 1
-        ws.cell(row=last_row, column=self.expected_headers.index("单价(结算)") + 1, value="合计")
-        ws.cell(row=last_row, column=self.expected_headers.index("小计金额(结算)") + 1, value="{:.2f}".format(subtotal_amount))
-        ws.cell(row=last_row, column=self.expected_headers.index("税额(结算)") + 1, value="{:.2f}".format(tax_amount))
-        ws.cell(row=last_row, column=self.expected_headers.index("小计价税(结算)") + 1, value="{:.2f}".format(total_amount))
-        
-        # 设置样式
-        self.apply_styles(ws)
-        
-        # 保存文件
-        wb.save(output_filepath)
+            # 添加合计行
+            total_row = [None] * len(self.expected_headers)
+            total_row[self.expected_headers.index("单价(结算)")] = "合计"
+            for col in TOTAL_AMOUNT_COLUMNS:
+                total_row[self.expected_headers.index(col)] = "{:.2f}".format(totals[col])
+        
+        # 写出对账单，退货行以黄色背景显示
+        if self.confirmation_pipeline:
+            self.write_statement_with_confirmation(output_filepath, header_rows, body, return_mask, total_row,
+                                                   year_month, group_label)
+        else:
+            with self.stages.span("save", group=group_label):
+                self.statement_writer.write(output_filepath, header_rows, body, return_mask, total_row)
         self.log_message(f"已成功创建 {output_filename}")
         
-    def apply_styles(self, ws):
-        """应用样式到工作表"""
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if cell.row >= 6 and (cell.value is not None and len(str(cell.value)) > max_length):
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 8)
-            ws.column_dimensions[column_letter].width = adjusted_width
-            
-        # 设置页面布局
-        ws.page_setup.paperSize = ws.PAPERSIZE_A4
-        ws.page_margins = PageMargins(top=0.25, left=0.2, right=0, bottom=1.05, header=0, footer=0.5)
-        ws.page_setup.horizontalCentered = True
-        ws.page_setup.verticalCentered = True
-        ws.sheet_properties.pageSetUpPr.fitToPage = True
-        ws.page_setup.fitToHeight = False
-        ws.page_setup.fitToWidth = 1
-        ws.oddFooter.center.text = "Page &[Page] of &[Pages]"
-        ws.print_title_rows = '1:6'
-        ws.freeze_panes = 'A7'
+        if group_key is not None:
+            self.group_records.append((group_key, {
+                "hash": group_hash,
+                "output": f"{year_month}/{output_filename}",
+                "rows": len(group_data),
+                "untaxed": round(float(totals["小计金额(结算)"]), 2),
+                "tax": round(float(totals["税额(结算)"]), 2),
+                "total": round(float(totals["小计价税(结算)"]), 2),
+            }))
+        
+    def get_confirmation_app(self):
+        """同时生成确认函时使用的确认函工具（不创建窗口），本次运行中共用品类索引"""
+        if self.confirmation_app is None:
+            from Product_Classification_Tool_ByTAX import ProductClassificationApp
+            self.confirmation_app = ProductClassificationApp()
+        self.confirmation_app.stages = self.stages
+        self.confirmation_app.hotel_profile = self.hotel_profile
+        return self.confirmation_app
+        
+    def write_statement_with_confirmation(self, output_filepath, header_rows, body, return_mask, total_row,
+                                          year_month, group_label):
+        """写出同时包含Statement和确认函sheet的对账单
+        
+        内存中的对账单数据直接做品类标记和汇总，结果与确认函工具读取保存后的对账单再处理时相同，
+        但每个供应商的文件只写一次，不需要重新读取。
+        """
+        from Product_Classification_Tool_ByTAX import (confirmation_columns, is_warning_message,
+                                                       CLASSIFICATION_COLUMN)
+        confirmation_app = self.get_confirmation_app()
+        confirmation_app.log_messages = []
+        
+        rows = self.statement_writer.data_rows(body)
+        # 与确认函工具读取对账单时相同：表头以下的各数据行和合计行
+        df = frame_from_rows(self.expected_headers, rows + [total_row], confirmation_columns)
+        pivot = confirmation_app.classify_statement(df, df.attrs["source_columns"][12])
+        
+        # 供应商名称和税率取第一行数据（对账单的L7、K7单元格）
+        first_row = rows[0] if rows else [None] * len(self.expected_headers)
+        supplier_name = first_row[self.expected_headers.index("供应商/备用金报销账户")]
+        tax_rate = first_row[self.expected_headers.index("税率")]
+        
+        with self.stages.span("render", group=group_label, part="confirmation"):
+            wb = self.statement_writer.build(header_rows, body, return_mask, total_row, rows=rows,
+                                             extra_column=(CLASSIFICATION_COLUMN, df[CLASSIFICATION_COLUMN].tolist()),
+                                             write_only=False)
+            confirmation_app.add_confirmation_sheet(wb, pivot, supplier_name, tax_rate, year_month)
+        with self.stages.span("save", group=group_label):
+            wb.save(output_filepath)
+        
+        # 确认函生成过程中的问题作为警告输出
+        for message in confirmation_app.log_messages:
+            if is_warning_message(message):
+                if not message.startswith("警告："):
+                    message = f"警告：{os.path.basename(output_filepath)} 生成确认函时{message}"
+                self.log_message(message)
+        
+    def build_statement_rows(self, group_data):
+        """向量化构建一个分组的对账单数据行
+        
+        每条退货行（退货为"是"）之后插入一行退货记录，数量和金额取退货数据的负数。
+        返回(数据行, 退货行标记, 各金额列合计)。
+        """
+        # 只保留expected_headers中定义的列，紧凑类型还原为写出时的普通类型
+        group_data = restore_report_columns(group_data)
+        base = group_data.reindex(columns=self.expected_headers, fill_value='')
+        base['税率'] = base['税率'].fillna('0%').astype(str)
+        
+        if '退货' in group_data.columns:
+            is_returned = (group_data['退货'] == '是').to_numpy()
+        else:
+            is_returned = np.zeros(len(group_data), dtype=bool)
+        
+        # 退货的原始行重复一次，重复出的行紧跟在原始行之后
+        repeats = 1 + is_returned.astype(int)
+        body = base.iloc[np.repeat(np.arange(len(base)), repeats)].reset_index(drop=True)
+        return_mask = np.zeros(len(body), dtype=bool)
+        return_mask[np.cumsum(repeats)[is_returned] - 1] = True
+        
+        # 退货行的数量和金额取负数
+        for source_col, target_col in RETURN_VALUE_COLUMNS.items():
+            if source_col in group_data.columns:
+                return_values = np.full(len(body), np.nan)
+                return_values[return_mask] = -pd.to_numeric(group_data[source_col], errors='coerce').to_numpy(dtype=float)[is_returned]
+                body[target_col] = body[target_col].where(~return_mask, return_values)
+        
+        # 缺少退货数据的金额列，退货行保留的是原始金额，不计入合计
+        amounts = body[TOTAL_AMOUNT_COLUMNS].apply(pd.to_numeric, errors='coerce')
+        for source_col, target_col in RETURN_VALUE_COLUMNS.items():
+            if target_col in amounts.columns and source_col not in group_data.columns:
+                amounts.loc[return_mask, target_col] = np.nan
+        totals = amounts.sum()
+        return body, return_mask, totals
         
-        # 设置单元格样式
-        for row in ws.iter_rows(min_row=1, max_col=len(self.expected_headers), max_row=ws.max_row):
-            for cell in row:
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                if cell.row <= 5:
-                    cell.fill = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
-                    cell.font = Font(color='FFFFFF', size=18, name='微软雅黑', bold=True)
-                elif cell.row == 6:
-                    cell.fill = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
-                    cell.font = Font(color='FFFFFF', size=10, name='微软雅黑', bold=True)
-                elif cell.row == ws.max_row:
-                    cell.fill = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
-                    cell.font = Font(color='FFFFFF', size=10, name='微软雅黑', bold=True)
-                else:
-                    cell.font = Font(size=11, name='微软雅黑')
-                    
     def bring_to_front(self):
         """将窗口带到前台"""
         self.root.lift()
@@ -548,7 +1411,35 @@ class BldBuyApp:
         )
         developer_label.pack(side=BOTTOM, pady=5)
         
+def _render_group_in_worker(task, confirmation_pipeline=False, hotel_profile=None):
+    """在工作进程中生成并保存一个分组的对账单，返回日志、分组记录和阶段耗时"""
+    app = BldBuyApp()
+    app.confirmation_pipeline = confirmation_pipeline
+    app.hotel_profile = hotel_profile
+    app.process_group_data(*task)
+    return {"messages": app.log_messages, "group_records": app.group_records, "spans": app.stages.spans}
+
+def _process_file_in_worker(input_file, output_folder, manifest, confirmation_pipeline=False, hotel_profile=None,
+                            memory_budget=None):
+    """在工作进程中处理单个报表，返回是否成功、日志、统计、分组记录和阶段耗时"""
+    app = BldBuyApp()
+    app.manifest = manifest
+    app.confirmation_pipeline = confirmation_pipeline
+    app.hotel_profile = hotel_profile
+    app.memory_budget = memory_budget
+    success = app.process_file_safely(input_file, output_folder)
+    return {
+        "success": success,
+        "messages": app.log_messages,
+        "row_count": app.row_count,
+        "group_count": app.group_count,
+        "group_records": app.group_records,
+        "spans": app.stages.spans,
+    }
+
 if __name__ == "__main__":
+    # 打包后的程序启动工作进程时需要
+    multiprocessing.freeze_support()
     root = Tk()
     app = BldBuyApp(root)
     root.mainloop()
@@ -6,6 +6,20 @@ import subprocess
 from datetime import datetime
 import importlib.util
 import logging
+import multiprocessing
+import threading
+import time
+
+# 程序启动时间，用于记录启动各阶段的耗时
+_start_time = time.perf_counter()
+
+# 已加载的子工具模块（模块名 -> 模块），每个模块只执行一次
+_loaded_modules = {}
+_module_lock = threading.Lock()
+
+# 后台预先导入的模块，按顺序导入
+WARM_UP_MODULES = ["numpy", "pandas", "openpyxl"]
+SUB_TOOL_MODULES = ["Bldbuy_Recon_ByTAX", "Product_Classification_Tool_ByTAX"]
 
 def get_config_path():
     """获取配置文件路径"""
@@ -71,6 +85,28 @@ class IntegratedTool:
         # 添加开发者信息
         self.dev_label = ttk.Label(self.main_frame, text="Powered By Cayman Fu @ Sofitel HAIKOU 2025 Ver 2.4")
         self.dev_label.pack(side=tk.BOTTOM, pady=10)
+        
+        # 窗口显示后再在后台导入pandas、openpyxl和子工具模块
+        self.root.after(100, self.start_warm_up)
+    
+    def start_warm_up(self):
+        """窗口已显示，启动后台预加载线程"""
+        logging.info(f"主窗口已显示，启动耗时 {time.perf_counter() - _start_time:.2f} 秒")
+        threading.Thread(target=self.warm_up_imports, daemon=True).start()
+    
+    def warm_up_imports(self):
+        """后台线程：依次导入耗时的第三方库和子工具模块，记录各阶段耗时"""
+        try:
+            for module_name in WARM_UP_MODULES:
+                started = time.perf_counter()
+                __import__(module_name)
+                logging.info(f"后台导入 {module_name} 耗时 {time.perf_counter() - started:.2f} 秒")
+            for module_name in SUB_TOOL_MODULES:
+                self._import_module(module_name)
+            logging.info(f"后台预加载完成，启动后共 {time.perf_counter() - _start_time:.2f} 秒")
+        except Exception as e:
+            # 预加载失败不影响使用，点击按钮时会再次导入并提示错误
+            logging.warning(f"后台预加载失败：{str(e)}")
     
     def set_window_geometry(self, width, height):
         """设置窗口大小并居中"""
@@ -83,7 +119,18 @@ class IntegratedTool:
         self.root.geometry(f"{width}x{height}+{x}+{y}")
     
     def _import_module(self, module_name):
-        """导入模块，支持打包环境"""
+        """导入模块，支持打包环境；已加载的模块直接复用"""
+        with _module_lock:
+            module = _loaded_modules.get(module_name)
+            if module is None:
+                started = time.perf_counter()
+                module = self._load_module(module_name)
+                _loaded_modules[module_name] = module
+                logging.info(f"导入模块 {module_name} 耗时 {time.perf_counter() - started:.2f} 秒")
+            return module
+    
+    def _load_module(self, module_name):
+        """从程序目录或已打包的模块中加载模块"""
         try:
             # 首先尝试从当前目录导入
             module_path = os.path.join(get_base_path(), f"{module_name}.py")
@@ -92,7 +139,11 @@ class IntegratedTool:
                 spec = importlib.util.spec_from_file_location(module_name, module_path)
                 module = importlib.util.module_from_spec(spec)
                 sys.modules[module_name] = module  # 将模块添加到 sys.modules
-                spec.loader.exec_module(module)
+                try:
+                    spec.loader.exec_module(module)
+                except Exception:
+                    sys.modules.pop(module_name, None)
+                    raise
                 return module
             else:
                 # 如果文件不存在，尝试直接导入
@@ -175,13 +226,19 @@ class IntegratedTool:
             logging.error(error_msg, exc_info=True)
             messagebox.showerror("错误", error_msg)
     
-def check_expiration_time():
-    """检查时间是否到期"""
+# 到期后的提示信息
+EXPIRATION_MESSAGE = "DLL注册失败，请联系Cayman更新"
+
+def is_expired():
+    """检查时间是否到期（不涉及界面），命令行模式也使用"""
     current_date = datetime.now()
     expiration_date = datetime(2025, 12, 31)  # 2025年底到期
-    
-    if current_date > expiration_date:
-        messagebox.showerror("错误", "DLL注册失败，请联系Cayman更新")
+    return current_date > expiration_date
+
+def check_expiration_time():
+    """检查时间是否到期，到期时提示并退出"""
+    if is_expired():
+        messagebox.showerror("错误", EXPIRATION_MESSAGE)
         sys.exit(1)
 
 def get_base_path():
@@ -193,16 +250,33 @@ def get_base_path():
         # 如果是开发环境
         return os.path.dirname(os.path.abspath(__file__))
 
+def setup_logging():
+    """把日志写入程序目录的error.log，返回程序基础路径"""
+    base_path = get_base_path()
+    log_path = os.path.join(base_path, 'error.log')
+    logging.basicConfig(
+        filename=log_path,
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    return base_path
+
 if __name__ == "__main__":
+    # 打包后的程序启动工作进程时需要，必须最先调用
+    multiprocessing.freeze_support()
+    
+    # 带参数运行时进入命令行批处理模式，不创建任何窗口（同样记录日志和检查到期时间）
+    if len(sys.argv) > 1:
+        setup_logging()
+        if is_expired():
+            print(f"错误：{EXPIRATION_MESSAGE}", file=sys.stderr)
+            sys.exit(1)
+        from Recon_CLI_ByTAX import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
     try:
         # 设置日志文件
-        base_path = get_base_path()
-        log_path = os.path.join(base_path, 'error.log')
-        logging.basicConfig(
-            filename=log_path,
-            level=logging.DEBUG,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        base_path = setup_logging()
         
         logging.info(f"程序基础路径：{base_path}")
         
@@ -1,7 +1,8 @@
 import pandas as pd
+import numpy as np
 import warnings
 from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.worksheet.page import PageMargins
 from datetime import datetime, timedelta
@@ -13,6 +14,19 @@ from tkinter import ttk, filedialog, messagebox
 import threading
 import subprocess
 import sys
+import json
+import csv
+import hashlib
+import sqlite3
+import unicodedata
+import multiprocessing
+from concurrent.futures import as_completed
+from collections import OrderedDict
+from copy import copy
+from Recon_Common_ByTAX import (dedupe_by_content, UIEventChannel, get_process_pool, warm_up_process_pool,
+                                StageRecorder, RunProfiler, report_stages, read_excel_table, table_from_rows,
+                                get_frame_cache, frame_cache_kind, get_hotel_profile, hotel_profile_choices,
+                                DEFAULT_HOTEL_PROFILE_LABEL)
 
 # 导入中文大写数字转换函数
 def num_to_chinese(num):
@@ -102,9 +116,496 @@ def num_to_chinese(num):
 # 忽略来自openpyxl.styles.stylesheet的UserWarning
 warnings.filterwarnings("ignore", category=UserWarning, module='openpyxl.styles.stylesheet')
 
+# 默认的品类标记规则表，priority越小越先匹配
+# keyword：包含任一关键词；exact：内容与任一关键词完全相同；regex：匹配任一正则表达式
+DEFAULT_CLASSIFICATION_RULES = [
+    # 1. 干货：M列内容有"鱼虾蟹干及瑶柱干"，"海参鲍鱼鱼翅干及肚干"，"其他水产干货"，"燕窝"将被标记为干货
+    {"priority": 10, "type": "keyword", "label": "干货", "patterns": ["鱼虾蟹干及瑶柱干", "海参鲍鱼鱼翅干及肚干", "其他水产干货", "燕窝"]},
+    # 2. 海鲜：M列内容包含"活鲜"2个字，即被标记为海鲜
+    {"priority": 20, "type": "keyword", "label": "海鲜", "patterns": ["活鲜"]},
+    # 3. 酒类：M列内容包含"酒"1个字，将被标记为酒类
+    {"priority": 30, "type": "keyword", "label": "酒类", "patterns": ["酒"]},
+    # 4. 饮料：M列内容包含"饮料"2个字，即被标记为饮料
+    {"priority": 40, "type": "keyword", "label": "饮料", "patterns": ["饮料"]},
+    # 5. 水：M列内容只有"水"这个字，即被标记为水
+    {"priority": 50, "type": "exact", "label": "水", "patterns": ["水"]},
+]
+# 6. 其他：所有未被以上规则标记的商品，将被标记为其他
+DEFAULT_CLASSIFICATION_LABEL = "其他"
+
+class ClassificationEngine:
+    """品类标记引擎
+    
+    按优先级依次用规则表匹配整列的商品分类。每个不同的值只分类一次，
+    同一规则的多个关键词合并为一个正则表达式一次匹配，结果再映射回各行。
+    """
+
+    RULE_TYPES = ("keyword", "exact", "regex")
+
+    def __init__(self, rules=None, default_label=DEFAULT_CLASSIFICATION_LABEL):
+        if rules is None:
+            rules = DEFAULT_CLASSIFICATION_RULES
+        self.default_label = default_label
+        # 规则表版本，规则变化后品类索引中自动分类的结果随之失效
+        self.version = hashlib.md5(json.dumps([rules, default_label], ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.rules = []
+        # 按优先级排序，优先级相同的保持规则表中的顺序
+        for rule in sorted(rules, key=lambda r: r.get("priority", 0)):
+            rule_type = rule.get("type", "keyword")
+            patterns = rule.get("patterns") or []
+            if rule_type not in self.RULE_TYPES:
+                raise ValueError(f"不支持的规则类型: {rule_type}")
+            if not rule.get("label") or not patterns:
+                raise ValueError(f"规则缺少label或patterns: {rule}")
+            if rule_type == "exact":
+                matcher = set(patterns)
+            elif rule_type == "keyword":
+                matcher = re.compile("|".join(re.escape(p) for p in patterns))
+            else:
+                matcher = re.compile("|".join(f"(?:{p})" for p in patterns))
+            self.rules.append((rule_type, matcher, rule["label"]))
+
+    @classmethod
+    def from_file(cls, rules_path):
+        """从JSON规则文件加载，格式为{"default_label": "其他", "rules": [{"priority": 10, "type": "keyword", "label": "干货", "patterns": [...]}, ...]}"""
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get("rules"), config.get("default_label", DEFAULT_CLASSIFICATION_LABEL))
+
+    def classify_values(self, values):
+        """对一组不重复的文字分类，返回对应的标记数组，空文字标记为空"""
+        values = pd.Series(values, dtype=object)
+        labels = np.full(len(values), self.default_label, dtype=object)
+        pending = (values != "").to_numpy(copy=True)
+        labels[~pending] = ""
+        
+        for rule_type, matcher, label in self.rules:
+            if not pending.any():
+                break
+            candidates = values[pending]
+            if rule_type == "exact":
+                hits = candidates.isin(matcher).to_numpy()
+            else:
+                hits = candidates.str.contains(matcher, regex=True).to_numpy()
+            matched = np.flatnonzero(pending)[hits]
+            labels[matched] = label
+            pending[matched] = False
+        return labels
+
+    def classify(self, column):
+        """对整列分类，空值不标记"""
+        codes, uniques = pd.factorize(column)
+        labels = self.classify_values([str(value) for value in uniques])
+        # 空值的编码为-1，对应追加在末尾的空标记
+        return np.append(labels, "")[codes]
+
+class CategoryIndex:
+    """品类标记索引
+    
+    把商品分类（kind为category）或商品名称（kind为product）映射到品类标记，
+    保存在本地SQLite数据库中，前面有一个内存LRU缓存，跨次运行共享。
+    - auto：规则引擎对原始文字的分类结果，按原始文字和规则表版本保存，规则表变化后不再使用
+    - manual：人工指定的标记，按规范化后的文字保存，优先级最高，商品名称的人工标记优先于商品分类
+    索引可以导出为CSV，修改标记并把来源改为manual后再导入，也可以导入其他酒店导出的文件。
+    """
+
+    LRU_SIZE = 4096
+    CSV_FIELDS = ["kind", "key", "label", "source", "rules_version"]
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lru = OrderedDict()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS category_index ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, label TEXT NOT NULL, "
+                "source TEXT NOT NULL, rules_version TEXT NOT NULL DEFAULT '', "
+                "PRIMARY KEY (kind, key, source))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def normalize(value):
+        """规范化文字：全角转半角、去掉首尾空白并合并连续空白"""
+        return " ".join(unicodedata.normalize("NFKC", str(value)).split())
+
+    def _cache_get(self, cache_key):
+        if cache_key in self._lru:
+            self._lru.move_to_end(cache_key)
+            return True, self._lru[cache_key]
+        return False, None
+
+    def _cache_put(self, cache_key, label):
+        self._lru[cache_key] = label
+        self._lru.move_to_end(cache_key)
+        if len(self._lru) > self.LRU_SIZE:
+            self._lru.popitem(last=False)
+
+    def lookup(self, kind, keys, source, rules_version=""):
+        """批量查询某一来源的标记，返回{key: label}，auto只使用rules_version相同的记录，没有记录的key不出现在结果中"""
+        found = {}
+        missing = []
+        for key in keys:
+            hit, label = self._cache_get((kind, source, rules_version, key))
+            if not hit:
+                missing.append(key)
+            elif label is not None:
+                found[key] = label
+        
+        if missing:
+            rows = {}
+            with self._connect() as conn:
+                # 分批查询，避免超过SQLite的参数数量上限
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    for key, label, version in conn.execute(
+                            f"SELECT key, label, rules_version FROM category_index "
+                            f"WHERE kind = ? AND source = ? AND key IN ({placeholders})", [kind, source] + chunk):
+                        if source == "manual" or version == rules_version:
+                            rows[key] = label
+            for key in missing:
+                label = rows.get(key)
+                # 没有记录的key也缓存下来，避免重复查询数据库
+                self._cache_put((kind, source, rules_version, key), label)
+                if label is not None:
+                    found[key] = label
+        return found
+
+    def store(self, kind, labels, source, rules_version=""):
+        """保存一批{key: label}"""
+        if not labels:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO category_index (kind, key, label, source, rules_version) VALUES (?, ?, ?, ?, ?)",
+                [(kind, key, label, source, rules_version) for key, label in labels.items()]
+            )
+        if source == "manual":
+            self._lru.clear()
+        else:
+            for key, label in labels.items():
+                self._cache_put((kind, source, rules_version, key), label)
+
+    def classify(self, engine, categories, products=None):
+        """对整列分类：只有索引中没有的商品分类才交给规则引擎，返回(标记数组, 新分类的数量)
+        
+        规则引擎和ClassificationEngine.classify一样对原始文字分类，规范化后的文字只用来查找人工标记。
+        """
+        codes, uniques = pd.factorize(categories)
+        keys = [str(value) for value in uniques]
+        known = self.lookup("category", [key for key in keys if key], "auto", engine.version)
+        
+        unseen = sorted({key for key in keys if key and key not in known})
+        if unseen:
+            learned = dict(zip(unseen, engine.classify_values(unseen)))
+            self.store("category", learned, "auto", engine.version)
+            known.update(learned)
+        
+        normalized_keys = [self.normalize(key) for key in keys]
+        manual = self.lookup("category", sorted({key for key in normalized_keys if key}), "manual")
+        labels = np.array(
+            [manual.get(normalized, known.get(key, "")) for key, normalized in zip(keys, normalized_keys)] + [""],
+            dtype=object
+        )[codes]
+        
+        # 商品名称的人工标记优先
+        if products is not None:
+            product_codes, product_uniques = pd.factorize(products)
+            product_keys = [self.normalize(value) for value in product_uniques]
+            overrides = self.lookup("product", [key for key in product_keys if key], "manual")
+            if overrides:
+                override_labels = np.array([overrides.get(key) for key in product_keys] + [None], dtype=object)[product_codes]
+                has_override = pd.notna(override_labels)
+                labels[has_override] = override_labels[has_override]
+        return labels, len(unseen)
+
+    def export_csv(self, csv_path):
+        """导出全部索引记录，返回导出的条数"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT kind, key, label, source, rules_version FROM category_index ORDER BY kind, key, source"
+            ).fetchall()
+        with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.CSV_FIELDS)
+            writer.writerows(rows)
+        return len(rows)
+
+    def import_csv(self, csv_path):
+        """导入索引记录（同一商品的同类来源记录会被覆盖），返回导入的条数"""
+        rows = []
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for record in csv.DictReader(f):
+                label = (record.get("label") or "").strip()
+                kind = (record.get("kind") or "category").strip()
+                source = (record.get("source") or "manual").strip()
+                # 自动分类的记录按原始文字保存，人工标记按规范化后的文字保存
+                key = record.get("key") or ""
+                if source == "manual":
+                    key = self.normalize(key)
+                if not key or not label or kind not in ("category", "product") or source not in ("auto", "manual"):
+                    continue
+                rows.append((kind, key, label, source, (record.get("rules_version") or "").strip()))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO category_index (kind, key, label, source, rules_version) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        self._lru.clear()
+        return len(rows)
+
+# 确认函中按顺序显示的品类
+CONFIRMATION_CATEGORIES = ["干货", "海鲜", "酒类", "饮料", "水", "其他"]
+
+# 默认的员餐部门，可在config.txt中用 employee_departments:员工餐厅,员工食堂 修改
+DEFAULT_EMPLOYEE_DEPARTMENTS = ["员工餐厅", "员工食堂"]
+
+def build_category_pivot(df, classification_column, employee_departments):
+    """按 品类 × 员餐/非员餐 一次分组汇总未税金额、税额和条数
+    
+    返回以CONFIRMATION_CATEGORIES为索引的DataFrame，列为
+    employee_untaxed/employee_tax/employee_count/other_untaxed/other_tax/other_count，
+    没有数据的品类填0。
+    """
+    is_employee = df["部门"].isin(employee_departments).to_numpy()
+    grouped = df.groupby(
+        [df[classification_column].to_numpy(), np.where(is_employee, "employee", "other")]
+    ).agg(
+        untaxed=("小计金额(结算)", "sum"),
+        tax=("税额(结算)", "sum"),
+        count=("小计金额(结算)", "size")
+    )
+    pivot = grouped.unstack()
+    pivot.columns = [f"{group}_{value}" for value, group in pivot.columns]
+    columns = [f"{group}_{value}" for group in ("employee", "other") for value in ("untaxed", "tax", "count")]
+    pivot = pivot.reindex(index=CONFIRMATION_CATEGORIES, columns=columns, fill_value=0).fillna(0)
+    for group in ("employee", "other"):
+        pivot[f"{group}_count"] = pivot[f"{group}_count"].astype(int)
+    return pivot
+
+# 供货明细表的表头在第6行（从0开始为5）
+STATEMENT_HEADER_ROW = 5
+# 品类标记结果的列名，写在供货明细表的N列
+CLASSIFICATION_COLUMN = "品类标记"
+# 生成确认函用到的列，另外按位置读取M列（商品分类）
+CONFIRMATION_SOURCE_COLUMNS = ["商品名称", "部门", "小计金额(结算)", "税额(结算)"]
+
+def confirmation_columns(columns):
+    """生成确认函需要读取的列：M列（第13列）和CONFIRMATION_SOURCE_COLUMNS"""
+    selected = list(columns[12:13])
+    selected.extend(col for col in CONFIRMATION_SOURCE_COLUMNS if col in columns and col not in selected)
+    return selected
+
+# 已加载的品类标记引擎：规则文件路径 -> (文件大小, 修改时间, ClassificationEngine)，没有规则文件时大小和修改时间为None
+_classification_engines = {}
+_classification_engines_lock = threading.Lock()
+
+def load_classification_engine(rules_path):
+    """加载品类标记引擎：存在规则文件时使用酒店自己的规则表，否则使用默认规则；规则文件没有变化时直接使用已编译的引擎"""
+    try:
+        stat = os.stat(rules_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        signature = (None, None)
+    with _classification_engines_lock:
+        cached = _classification_engines.get(rules_path)
+        if cached is not None and cached[:2] == signature:
+            return cached[2]
+    engine = ClassificationEngine() if signature[0] is None else ClassificationEngine.from_file(rules_path)
+    with _classification_engines_lock:
+        _classification_engines[rules_path] = signature + (engine,)
+    return engine
+
+# 确认函各类单元格的样式：样式名 -> 字体、填充、边框、对齐和数字格式（没有给出的使用默认值）
+_THIN_SIDE = Side(style='thin')
+_THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+_DOUBLE_BOTTOM_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=Side(style='double'))
+_HEADER_FILL = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+_SHADED_FILL = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")
+_TOTAL_FILL = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
+_AMOUNT_FORMAT = '#,##0.00'
+
+CONFIRMATION_STYLES = {
+    "title": {"font": Font(bold=True, size=16), "alignment": Alignment(horizontal='center', vertical='center')},
+    "table_header": {"font": Font(bold=True), "fill": _HEADER_FILL, "border": _THIN_BORDER,
+                     "alignment": Alignment(horizontal='center', vertical='center')},
+    "table_header_amount": {"font": Font(bold=True), "fill": _HEADER_FILL, "border": _THIN_BORDER,
+                            "alignment": Alignment(horizontal='center', vertical='center'),
+                            "number_format": _AMOUNT_FORMAT},
+    "category": {"border": _THIN_BORDER, "alignment": Alignment(horizontal='left', vertical='center')},
+    "category_shaded": {"fill": _SHADED_FILL, "border": _THIN_BORDER,
+                        "alignment": Alignment(horizontal='left', vertical='center')},
+    "amount": {"border": _THIN_BORDER, "alignment": Alignment(horizontal='right', vertical='center'),
+               "number_format": _AMOUNT_FORMAT},
+    "amount_shaded": {"fill": _SHADED_FILL, "border": _THIN_BORDER,
+                      "alignment": Alignment(horizontal='right', vertical='center'), "number_format": _AMOUNT_FORMAT},
+    "total_label": {"font": Font(bold=True, size=12), "fill": _TOTAL_FILL, "border": _THIN_BORDER,
+                    "alignment": Alignment(horizontal='left', vertical='center')},
+    "total_amount": {"font": Font(bold=True, size=12), "fill": _TOTAL_FILL, "border": _THIN_BORDER,
+                     "alignment": Alignment(horizontal='right', vertical='center'), "number_format": _AMOUNT_FORMAT},
+    "grand_total_amount": {"font": Font(bold=True, size=12), "fill": _TOTAL_FILL, "border": _DOUBLE_BOTTOM_BORDER,
+                           "alignment": Alignment(horizontal='right', vertical='center'),
+                           "number_format": _AMOUNT_FORMAT},
+    "remark_title": {"font": Font(bold=True)},
+    "remark": {"font": Font(size=11), "alignment": Alignment(horizontal='left', vertical='center', wrap_text=True)},
+    "confirm_date": {"font": Font(size=11), "alignment": Alignment(horizontal='left', vertical='center')},
+    "stamp": {"font": Font(size=13, underline="single"), "alignment": Alignment(horizontal='center', vertical='center')},
+}
+
+# 确认函中品类表的位置：表头占第14-15行，从第16行开始为各品类，之后是合计行
+CONFIRMATION_TABLE_ROW = 14
+CONFIRMATION_FIRST_CATEGORY_ROW = 16
+# 使用浅色背景的品类行（品类、员餐和非员餐金额列）
+CONFIRMATION_SHADED_CATEGORIES = ["海鲜", "饮料"]
+
+CONFIRMATION_REMARKS = [
+    "1. 品类根据供应商实际送货的情况填写，不适用的可留空",
+    "2. 员餐货款的不含税金额，如零税率，酒店需要根据实际收货记录的总金额去换算含税及不含税填写",
+    "3. 本函由双方核对原始收货单据后填写，供应商当月供货数据与酒店当月应付账款金额一致",
+    "4. 供应商根据核对后确认的金额开具相关增值税发票给酒店",
+    "5. 请供应商在确认后，需加盖公章或财务专用章，扫描后邮件回传酒店做存档",
+    "6. 建议随确认函发送增值税发票号和发票金额以及发票复印件",
+    "7. 电子邮件发送至：",
+    "8. 本函请在收到后 2 个工作日内返回",
+    "9. 扫描件需清晰显示：金额、盖章、日期三要素，模糊文件视为无效"
+]
+
+def build_confirmation_layout():
+    """确认函sheet的固定版式
+    
+    cells为(行, 列, 固定文字, 样式名)，固定文字为None的单元格在生成每个文件时填写，
+    样式名为None时使用默认样式。
+    """
+    cells = [(1, 1, "供应商对账确认函", "title")]
+    labels = ["由酒店（酒店全称）：", "地址：", "财务部联系人：", "致供应商（供应商全称）：", "税务登记号码：", "对账联系人：",
+              "经酒店与供应商共同核对，确认产生如下交易货款：", "➢ 含税总金额人民币大写：", "➢ 不含税金额：",
+              "➢ 增值税税款：", "货款所属期间：", "明细对账信息如下："]
+    cells.extend((row, 1, label, None) for row, label in enumerate(labels, start=2))
+    merges = ["A1:F1"]
+    merges.extend(f"B{row}:F{row}" for row in list(range(2, 8)) + list(range(9, 14)))
+    
+    # 品类表：两行表头，员餐和非员餐金额列（B-D）的表头使用金额格式
+    header_texts = {(14, 1): "品类", (14, 2): "员餐", (14, 4): "其他餐饮点 - 非员餐", (14, 6): "当月总应付账款金额",
+                    (15, 2): "不含税金额", (15, 3): "税费", (15, 4): "不含税金额", (15, 5): "税费"}
+    for row in (CONFIRMATION_TABLE_ROW, CONFIRMATION_TABLE_ROW + 1):
+        for col in range(1, 7):
+            style = "table_header_amount" if 2 <= col <= 4 else "table_header"
+            cells.append((row, col, header_texts.get((row, col)), style))
+    merges.extend(["A14:A15", "B14:C14", "D14:E14", "F14:F15"])
+    
+    # 各品类行和合计行，金额在生成时填写
+    for row, category in enumerate(CONFIRMATION_CATEGORIES, start=CONFIRMATION_FIRST_CATEGORY_ROW):
+        suffix = "_shaded" if category in CONFIRMATION_SHADED_CATEGORIES else ""
+        cells.append((row, 1, None, "category" + suffix))
+        cells.extend((row, col, None, "amount" + suffix) for col in range(2, 5))
+        cells.extend((row, col, None, "amount") for col in range(5, 7))
+    total_row = CONFIRMATION_FIRST_CATEGORY_ROW + len(CONFIRMATION_CATEGORIES)
+    cells.append((total_row, 1, "合计", "total_label"))
+    cells.extend((total_row, col, None, "total_amount") for col in range(2, 5))
+    cells.extend((total_row, col, None, "grand_total_amount") for col in range(5, 7))
+    
+    # 备注，第32行B-F列填写邮箱地址
+    cells.append((25, 1, "备注：", "remark_title"))
+    merges.append("A25:F25")
+    for row, remark in enumerate(CONFIRMATION_REMARKS, start=26):
+        cells.append((row, 1, remark, "remark"))
+        merges.append(f"B{row}:F{row}" if row == 32 else f"A{row}:F{row}")
+    cells.append((32, 2, None, "remark"))
+    
+    cells.append((36, 1, "供应商确认日期：_______年_______月_______日", "confirm_date"))
+    cells.append((39, 1, "供应商盖章确认", "stamp"))
+    merges.extend(["A36:F36", "A39:F39"])
+    
+    return {
+        "cells": cells,
+        "merges": merges,
+        "column_widths": {"A": 28, "B": 15, "C": 12, "D": 12, "E": 12, "F": 20},
+        "row_heights": {2: 30, 5: 30, 8: 30, 13: 30},
+        # 页面边距（单位：厘米）
+        "margins_cm": {"top": 0.5, "left": 1.5, "right": 0.5, "bottom": 0.5, "header": 0, "footer": 0},
+    }
+
+class ConfirmationTemplate:
+    """编译后的确认函版式
+    
+    版式在启动时编译一次：单元格按样式分组，每个样式只在每个工作簿中注册一次，
+    之后直接复制样式索引给同样式的其他单元格。生成确认函时先克隆固定部分，再由调用方填写可变单元格。
+    """
+    
+    def __init__(self, layout, styles):
+        self.styles = styles
+        self.cells = sorted(layout["cells"])
+        self.merges = list(layout["merges"])
+        self.column_widths = dict(layout["column_widths"])
+        self.row_heights = dict(layout["row_heights"])
+        self.margins = {name: value / 2.54 for name, value in layout["margins_cm"].items()}
+    
+    def render(self, ws):
+        """把固定版式写入工作表（先合并单元格，再写入文字和样式）"""
+        for cell_range in self.merges:
+            ws.merge_cells(cell_range)
+        
+        style_arrays = {}
+        for row, col, value, style_name in self.cells:
+            cell = ws.cell(row=row, column=col)
+            if value is not None:
+                cell.value = value
+            if style_name is None:
+                continue
+            style_array = style_arrays.get(style_name)
+            if style_array is None:
+                for attribute, style in self.styles[style_name].items():
+                    setattr(cell, attribute, style)
+                style_arrays[style_name] = copy(cell._style)
+            else:
+                cell._style = copy(style_array)
+        
+        for column, width in self.column_widths.items():
+            ws.column_dimensions[column].width = width
+        for row, height in self.row_heights.items():
+            ws.row_dimensions[row].height = height
+        ws.page_margins = PageMargins(**self.margins)
+        ws.page_setup.horizontalCentered = True
+
+CONFIRMATION_TEMPLATE = ConfirmationTemplate(build_confirmation_layout(), CONFIRMATION_STYLES)
+
+# 日志中表示警告、错误或其他问题的关键词
+WARNING_KEYWORDS = ["警告", "失败", "错误", "出错", "无法", "异常", "Exception", "[失败]", "不存在"]
+
+def is_warning_message(message):
+    """判断日志消息是否表示警告、错误或其他问题"""
+    return any(keyword in message for keyword in WARNING_KEYWORDS)
+
 class ProductClassificationApp:
-    def __init__(self, root):
+    def __init__(self, root=None):
         self.root = root
+        
+        # 初始化状态
+        self.processing = False
+        self.log_messages = []
+        # 是否直接在原文件上操作（开始处理时从界面选项读取）
+        self.edit_in_place = False
+        # 本次处理的数据行数，用于统计处理速度
+        self.row_count = 0
+        # 各处理阶段的耗时记录；profile_run为True时同时保存cProfile结果并记录内存峰值
+        self.stages = StageRecorder()
+        self.profile_run = False
+        # 是否把文件分发到多个工作进程并行处理（开始处理时从界面选项读取）
+        self.parallel = False
+        # 多进程时即使只有一个文件也交给工作进程处理（多酒店批处理时本进程只负责记录）
+        self.files_in_pool = False
+        # 使用的酒店配置，为None时使用程序目录的config.txt
+        self.hotel_profile = None
+        # 品类标记索引，第一次使用时打开
+        self.category_index = None
+        
+        # 没有窗口时（命令行模式）只初始化处理数据所需的状态
+        if root is None:
+            return
+        
         self.root.title("供应商对帐确认函")
         
         # 设置窗口大小并居中
@@ -129,8 +630,11 @@ class ProductClassificationApp:
         # 创建日志显示区域
         self.create_log_area()
         
-        # 初始化状态
-        self.processing = False
+        # 处理线程通过事件通道更新日志和进度，由主线程定时批量刷新界面
+        self.ui_events = UIEventChannel(self.root, self.append_log_lines, self.set_progress_value)
+        
+        # 预先启动工作进程，使第一个文件无需等待进程启动和导入
+        warm_up_process_pool()
         
         # 创建开发者信息标签
         self.create_developer_label()
@@ -182,6 +686,26 @@ class ProductClassificationApp:
                                              variable=self.edit_in_place_var)
         edit_in_place_check.pack(side=LEFT, padx=5)
         
+        # 性能分析选项：保存cProfile结果并记录各阶段内存峰值，会使处理变慢
+        self.profile_var = BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="记录性能分析", variable=self.profile_var).pack(side=LEFT, padx=5)
+        
+        # 多进程并行处理选项：各文件互不相关，可分发到多个工作进程同时处理
+        self.parallel_var = BooleanVar(value=True)
+        ttk.Checkbutton(option_frame, text="多进程并行处理", variable=self.parallel_var).pack(side=LEFT, padx=5)
+        
+        # 酒店配置选项：默认使用config.txt，profiles文件夹中的每个<名称>.txt是一个酒店的配置
+        hotel_frame = ttk.Frame(control_frame)
+        hotel_frame.pack(fill=X, pady=5)
+        ttk.Label(hotel_frame, text="酒店配置:").pack(side=LEFT, padx=5)
+        self.hotel_var = StringVar(value=DEFAULT_HOTEL_PROFILE_LABEL)
+        ttk.Combobox(hotel_frame, textvariable=self.hotel_var, values=hotel_profile_choices(self.get_base_path()),
+                     state="readonly", width=25).pack(side=LEFT, padx=5)
+        
+        # 品类索引的导入导出
+        ttk.Button(option_frame, text="导入品类索引", command=self.import_category_index).pack(side=RIGHT, padx=5)
+        ttk.Button(option_frame, text="导出品类索引", command=self.export_category_index).pack(side=RIGHT, padx=5)
+        
         # 文件选择框架
         self.file_selection_frame = ttk.Frame(control_frame)
         self.file_selection_frame.pack(fill=X, pady=5)
@@ -247,27 +771,32 @@ class ProductClassificationApp:
     
     def log_message(self, message):
         """添加消息到日志区域"""
+        self.log_messages.append(message)
+        
+        # 命令行模式没有日志窗口，日志由调用方统一输出
+        if self.root is None:
+            return
+        
+        # 检查消息是否包含警告、失败、错误或其他问题关键词，交给界面线程显示
+        self.ui_events.post_log(message, "warning" if is_warning_message(message) else None)
+    
+    def append_log_lines(self, entries):
+        """在界面线程中批量显示日志，entries为[(消息, 标签)]"""
         self.log_text.config(state=NORMAL)
         # 配置警告和错误标签为红色
         self.log_text.tag_config("warning", foreground="red")
-        
-        # 检查消息是否包含警告、失败、错误或其他问题关键词
-        error_keywords = ["警告", "失败", "错误", "出错", "无法", "异常", "Exception", "[失败]", "不存在"]
-        is_error = False
-        
-        # 检查消息中是否包含任何错误关键词
-        for keyword in error_keywords:
-            if keyword in message:
-                is_error = True
-                break
-        
-        if is_error:
-            self.log_text.insert(END, message + "\n", "warning")
-        else:
-            self.log_text.insert(END, message + "\n")
+        for message, tag in entries:
+            if tag:
+                self.log_text.insert(END, message + "\n", tag)
+            else:
+                self.log_text.insert(END, message + "\n")
         self.log_text.see(END)
         self.log_text.config(state=DISABLED)
     
+    def set_progress_value(self, value):
+        """在界面线程中更新进度条"""
+        self.progress['value'] = value
+    
     def start_processing(self):
         if self.processing:
             return
@@ -297,9 +826,13 @@ class ProductClassificationApp:
                 messagebox.showwarning("警告", f"在文件夹 '{input_folder}' 中没有找到Excel文件")
                 return
         
-        # 去除重复文件
-        files_to_process = list(set(files_to_process))
+        # 去除重复路径（内容相同的文件在run_batch中跳过）
+        files_to_process = list(dict.fromkeys(files_to_process))
         
+        self.edit_in_place = self.edit_in_place_var.get()
+        self.profile_run = self.profile_var.get()
+        self.parallel = self.parallel_var.get()
+        self.hotel_profile = get_hotel_profile(self.get_base_path(), self.hotel_var.get())
         self.processing = True
         self.process_btn.config(state=DISABLED)
         self.log_text.config(state=NORMAL)
@@ -313,53 +846,22 @@ class ProductClassificationApp:
     def process_multiple_files(self, file_paths):
         """处理多个文件"""
         try:
-            total_files = len(file_paths)
-            self.log_message(f"共找到 {total_files} 个文件需要处理")
-            
-            # 初始化统计信息
-            successful_files = 0
-            failed_files = 0
-            
-            # 处理每个文件
-            for i, file_path in enumerate(file_paths):
-                # 更新总体进度
-                overall_progress = int((i / total_files) * 100)
-                self.progress['value'] = overall_progress
-                self.root.update_idletasks()
-                
-                # 处理单个文件
-                self.log_message(f"\n[{i+1}/{total_files}] 开始处理文件: {os.path.basename(file_path)}")
-                
-                # 调用处理单个文件的方法
-                success = self.process_file(file_path, is_batch=True)
-                
-                if success:
-                    successful_files += 1
-                    self.log_message(f"[成功] 文件 {os.path.basename(file_path)} 处理完成")
-                else:
-                    failed_files += 1
-                    self.log_message(f"[失败] 文件 {os.path.basename(file_path)} 处理失败")
-            
-            # 更新进度条到100%
-            self.progress['value'] = 100
-            
-            # 显示处理汇总信息
-            self.log_message(f"\n处理完成汇总:")
-            self.log_message(f"总文件数: {total_files}")
-            self.log_message(f"成功处理: {successful_files}")
-            self.log_message(f"处理失败: {failed_files}")
+            file_results = self.run_batch(file_paths)
+            total_files = len(file_results)
+            successful_files = sum(1 for _, success, _ in file_results if success)
+            failed_files = total_files - successful_files
             
             if successful_files > 0:
                 # 获取输出目录（假设所有文件都在同一个目录）
                 output_dir = os.path.dirname(file_paths[0])
                 
                 message = f"共处理 {total_files} 个文件，成功 {successful_files} 个，失败 {failed_files} 个。"
-                if self.edit_in_place_var.get():
+                if self.edit_in_place:
                     message += "\n\n已直接在原文件上操作。"
                 else:
                     message += "\n\n已保存为新文件。"
                 
-                if messagebox.askyesno("处理完成", f"{message}\n\n是否打开输出文件夹？"):
+                if self.ui_events.invoke(messagebox.askyesno, "处理完成", f"{message}\n\n是否打开输出文件夹？"):
                     try:
                         if sys.platform == "win32":
                             os.startfile(output_dir)
@@ -369,16 +871,329 @@ class ProductClassificationApp:
                             subprocess.call(["xdg-open", output_dir])
                     except Exception as e:
                         self.log_message(f"无法打开文件夹: {str(e)}")
-                        messagebox.showerror("错误", f"无法打开文件夹:\n{str(e)}")
+                        self.ui_events.post_call(messagebox.showerror, "错误", f"无法打开文件夹:\n{str(e)}")
             else:
-                messagebox.showwarning("处理失败", "所有文件处理失败，请检查文件格式是否正确")
+                self.ui_events.post_call(messagebox.showwarning, "处理失败", "所有文件处理失败，请检查文件格式是否正确")
                 
         except Exception as e:
             self.log_message(f"批量处理文件时出错: {str(e)}")
-            messagebox.showerror("错误", f"批量处理文件时出错:\n{str(e)}")
+            self.ui_events.post_call(messagebox.showerror, "错误", f"批量处理文件时出错:\n{str(e)}")
         finally:
             self.processing = False
-            self.process_btn.config(state=NORMAL)
+            self.ui_events.post_call(self.process_btn.config, state=NORMAL)
+    
+    def run_batch(self, file_paths):
+        """逐个处理文件（不涉及界面），返回每个文件的(路径, 是否成功, 警告列表)"""
+        self.log_messages = []
+        self.row_count = 0
+        self.stages = StageRecorder()
+        
+        # 阶段耗时明细和性能分析结果保存在程序目录的logs文件夹
+        log_folder = os.path.join(self.get_base_path(), "logs")
+        parallel = self.parallel
+        if self.profile_run and parallel:
+            # cProfile只能分析当前进程，性能分析时逐个处理以便看到完整的处理过程
+            self.log_message("性能分析模式：不使用多进程，逐个处理文件")
+            parallel = False
+        with RunProfiler(self.profile_run, log_folder, "confirmations") as profiler:
+            file_results = self.process_batch_files(file_paths, parallel)
+        report_stages(self.stages, log_folder, "confirmations", self.log_message, profiler.path)
+        return file_results
+    
+    def process_batch_files(self, file_paths, parallel=False):
+        # 内容相同的文件（包括改名后的副本）只处理第一个
+        file_paths, duplicates = dedupe_by_content(file_paths)
+        
+        total_files = len(file_paths)
+        self.log_message(f"共找到 {total_files} 个文件需要处理")
+        for duplicate, original in duplicates:
+            self.log_message(f"跳过文件 {os.path.basename(duplicate)}：内容与 {os.path.basename(original)} 相同")
+        
+        # 处理每个文件
+        if parallel and (total_files > 1 or (total_files and self.files_in_pool)):
+            file_results = self.process_files_in_pool(file_paths)
+        else:
+            file_results = self.process_files_serially(file_paths)
+        
+        # 更新进度条到100%
+        self.update_progress(100)
+        
+        # 显示处理汇总信息
+        successful_files = sum(1 for _, success, _ in file_results if success)
+        self.log_message(f"\n处理完成汇总:")
+        self.log_message(f"总文件数: {total_files}")
+        self.log_message(f"成功处理: {successful_files}")
+        self.log_message(f"处理失败: {total_files - successful_files}")
+        return file_results
+    
+    def process_files_serially(self, file_paths):
+        """在当前进程中逐个处理文件，返回每个文件的(路径, 是否成功, 警告列表)"""
+        total_files = len(file_paths)
+        file_results = []
+        for i, file_path in enumerate(file_paths):
+            # 更新总体进度
+            self.update_progress(int((i / total_files) * 100))
+            
+            # 处理单个文件
+            self.log_message(f"\n[{i+1}/{total_files}] 开始处理文件: {os.path.basename(file_path)}")
+            first_message = len(self.log_messages)
+            self.stages.labels = {"file": os.path.basename(file_path)}
+            
+            # 调用处理单个文件的方法
+            success = self.process_file(file_path, is_batch=True)
+            file_warnings = [msg for msg in self.log_messages[first_message:] if is_warning_message(msg)]
+            file_results.append((file_path, success, file_warnings))
+            
+            if success:
+                self.log_message(f"[成功] 文件 {os.path.basename(file_path)} 处理完成")
+            else:
+                self.log_message(f"[失败] 文件 {os.path.basename(file_path)} 处理失败")
+        return file_results
+    
+    def process_files_in_pool(self, file_paths):
+        """把每个文件分发到工作进程池处理，返回按选择顺序排列的每个文件的(路径, 是否成功, 警告列表)
+        
+        每完成一个文件就输出它的日志并更新进度，各文件的日志不会互相穿插。
+        """
+        total_files = len(file_paths)
+        pool = get_process_pool()
+        futures = {pool.submit(_process_file_in_worker, file_path, self.edit_in_place, self.hotel_profile): file_path
+                   for file_path in file_paths}
+        
+        results = {}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"success": False, "messages": [f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}"]}
+            
+            self.log_message(f"\n[{completed}/{total_files}] 已处理文件: {os.path.basename(file_path)}")
+            first_message = len(self.log_messages)
+            for message in result["messages"]:
+                self.log_message(message)
+            self.row_count += result.get("row_count", 0)
+            self.stages.extend(result.get("spans", []), file=os.path.basename(file_path))
+            
+            success = result["success"]
+            file_warnings = [msg for msg in self.log_messages[first_message:] if is_warning_message(msg)]
+            results[file_path] = (file_path, success, file_warnings)
+            if success:
+                self.log_message(f"[成功] 文件 {os.path.basename(file_path)} 处理完成")
+            else:
+                self.log_message(f"[失败] 文件 {os.path.basename(file_path)} 处理失败")
+            self.update_progress(int((completed / total_files) * 100))
+        return [results[file_path] for file_path in file_paths]
+    
+    def classify_statement(self, df, m_column_name):
+        """对供货明细数据进行品类标记（写入品类标记列），返回按品类和员餐/非员餐的汇总结果"""
+        # 进行分类标记，已分类过的商品分类直接使用品类索引中的标记
+        engine = self.get_classification_engine()
+        products = df["商品名称"] if "商品名称" in df.columns else None
+        with self.stages.span("classification"):
+            labels, new_count = self.get_category_index().classify(engine, df[m_column_name], products)
+        df[CLASSIFICATION_COLUMN] = labels
+        self.log_message(f"品类标记完成，新分类的商品分类 {new_count} 个")
+        
+        # 一次分组汇总，确认函汇总表、B9-B11合计和统计日志都使用这个结果
+        with self.stages.span("summary"):
+            return build_category_pivot(df, CLASSIFICATION_COLUMN, self.get_employee_departments())
+    
+    def read_statement_tax_rate(self, wb):
+        """读取Statement sheet中的税率（K7单元格）"""
+        self.log_message(f"工作表列表: {wb.sheetnames}")
+        if "Statement" not in wb.sheetnames:
+            return None
+        tax_rate = wb["Statement"].cell(row=7, column=11).value  # K7单元格
+        if tax_rate is not None:
+            self.log_message(f"获取到税率值: {tax_rate}")
+        else:
+            self.log_message("未获取到税率值")
+        return tax_rate
+    
+    def statement_period(self, wb, file_path):
+        """确定货款所属年月：先查找Statement Sheet的A列，其次从文件名获取，都没有时使用当前年月"""
+        # 获取年月数据
+        year_month = ""
+        # 检查是否存在名为"Statement Sheet"的工作表
+        if "Statement Sheet" in wb.sheetnames:
+            statement_sheet = wb["Statement Sheet"]
+            # 尝试从A列获取年月数据（通常在A1或其他位置）
+            for row in range(1, 10):  # 检查前10行
+                cell_value = statement_sheet.cell(row=row, column=1).value
+                if cell_value and isinstance(cell_value, str) and re.search(r'\d{4}[-年]\d{1,2}', cell_value):
+                    year_month = cell_value
+                    break
+        
+        # 如果没有找到年月数据，尝试从文件名获取
+        if not year_month:
+            file_name = os.path.basename(file_path)
+            match = re.match(r'(\d{4}-\d{2})_(.+?)(_分类)?\.xlsx', file_name)
+            if match:
+                year_month = match.group(1)
+        
+        # 如果仍然没有找到年月数据，使用当前年月
+        if not year_month:
+            now = datetime.now()
+            year_month = now.strftime('%Y-%m')
+        
+        return year_month
+    
+    def add_confirmation_sheet(self, wb, pivot, supplier_name, tax_rate, year_month):
+        """在工作簿中添加确认函sheet，pivot为build_category_pivot的汇总结果，year_month为货款所属年月（如2025-06）
+        
+        固定版式由CONFIRMATION_TEMPLATE克隆，这里只填写酒店、供应商、金额、期间、邮箱和各品类金额。
+        """
+        # 创建汇总sheet
+        if "汇总" not in wb.sheetnames:
+            summary_sheet = wb.create_sheet(title="汇总")
+        else:
+            summary_sheet = wb["汇总"]
+        CONFIRMATION_TEMPLATE.render(summary_sheet)
+        
+        # 酒店信息来自酒店配置（配置文件只解析一次）
+        profile = self.get_hotel_profile()
+        hotel_name = hotel_address = contact_person = email_address = ""
+        if profile is not None:
+            hotel_name, hotel_address = profile.hotel_name, profile.hotel_address
+            contact_person, email_address = profile.contact_person, profile.email_address
+            self.log_message(f"已从{os.path.basename(profile.path)}读取酒店信息")
+        
+        summary_sheet.cell(row=2, column=2, value=hotel_name)
+        summary_sheet.cell(row=3, column=2, value=hotel_address)
+        summary_sheet.cell(row=4, column=2, value=contact_person)
+        # 将从Statement Sheet读取的供应商名称写入B5单元格
+        summary_sheet.cell(row=5, column=2, value=supplier_name)
+        # 在B32单元格中添加邮箱地址
+        summary_sheet.cell(row=32, column=2, value=email_address)
+        
+        # 填充各分类金额，为0的金额显示为"-"
+        row_idx = CONFIRMATION_FIRST_CATEGORY_ROW
+        for category, amounts in pivot.iterrows():
+            values = [amounts["employee_untaxed"], amounts["employee_tax"], amounts["other_untaxed"], amounts["other_tax"]]
+            # 计算当月总应付账款金额
+            values.append(sum(values))
+            summary_sheet.cell(row=row_idx, column=1, value=category)
+            for col, value in enumerate(values, start=2):
+                summary_sheet.cell(row=row_idx, column=col, value="-" if value == 0 else value)
+            row_idx += 1
+        
+        # 各列总计
+        total_employee_untaxed = sum(pivot["employee_untaxed"].tolist())
+        total_employee_tax = sum(pivot["employee_tax"].tolist())
+        total_other_untaxed = sum(pivot["other_untaxed"].tolist())
+        total_other_tax = sum(pivot["other_tax"].tolist())
+        total_amount = total_employee_untaxed + total_employee_tax + total_other_untaxed + total_other_tax
+        
+        # 总计行（"合计"文字和样式来自版式）
+        totals = [total_employee_untaxed, total_employee_tax, total_other_untaxed, total_other_tax, total_amount]
+        for col, value in enumerate(totals, start=2):
+            summary_sheet.cell(row=row_idx, column=col, value="-" if value == 0 else value)
+        
+        # 读取总计行的第6列（总金额）并转换为中文大写写入B9单元格
+        try:
+            # total_amount已在前面计算
+            if total_amount is not None:
+                # 转换为中文大写（函数内部已添加"圆"字）
+                chinese_amount = num_to_chinese(total_amount)
+                # 转换为小写
+                lowercase_amount = f"{total_amount:.2f}元"
+                # 写入B9单元格（含税总金额人民币大写）
+                summary_sheet.cell(row=9, column=2, value=f"{chinese_amount}（小写：{lowercase_amount}）")
+                self.log_message(f"已将总金额 {total_amount} 转换为大写 {chinese_amount} 并写入B9单元格")
+            else:
+                self.log_message("总金额为空，无法转换为中文大写")
+        except Exception as e:
+            self.log_message(f"转换总金额为中文大写时出错: {str(e)}")
+            # 如果出错，尝试直接写入原始值
+            try:
+                if total_amount is not None:
+                    summary_sheet.cell(row=9, column=2, value=f"{total_amount:.2f}元")
+            except:
+                pass
+        
+        # 读取总计行的数据并写入B10和B11单元格
+        try:
+            # 使用当前总计行的数据
+            total_untaxed = total_employee_untaxed + total_other_untaxed
+            total_tax = total_employee_tax + total_other_tax
+            
+            if total_untaxed is not None:
+                # 写入B10单元格，前面加上"小写"，后面加上"元"
+                summary_sheet.cell(row=10, column=2, value=f"小写{total_untaxed:.2f}元")
+                self.log_message(f"已将未税总金额 {total_untaxed} 写入B10单元格")
+            else:
+                self.log_message("未税总金额为空，无法写入B10单元格")
+                
+            if total_tax is not None:
+                # 写入B11单元格，包含税率信息
+                tax_rate_text = "" if tax_rate is None else str(tax_rate)
+                summary_sheet.cell(row=11, column=2, value=f"小写{total_tax:.2f}元 (税率：{tax_rate_text})")                            
+                self.log_message(f"已将税额总金额 {total_tax} 和税率信息写入B11单元格")
+            else:
+                self.log_message("税额总金额为空，无法写入B11单元格")
+        except Exception as e:
+            self.log_message(f"读取总计行数据并写入B10和B11单元格时出错: {str(e)}")
+            # 如果出错，记录错误但继续执行
+        
+        # 把货款所属年月转换格式写入B12单元格
+        try:
+            # 解析年月数据
+            if '-' in year_month:
+                year, month = year_month.split('-')
+            elif '年' in year_month:
+                match = re.search(r'(\d{4})年(\d{1,2})', year_month)
+                if match:
+                    year, month = match.group(1), match.group(2)
+                else:
+                    raise ValueError(f"无法解析年月格式: {year_month}")
+            else:
+                raise ValueError(f"无法解析年月格式: {year_month}")
+            
+            # 获取月份的最后一天
+            if int(month) == 12:
+                next_month = datetime(int(year) + 1, 1, 1)
+            else:
+                next_month = datetime(int(year), int(month) + 1, 1)
+            
+            last_day = (next_month - timedelta(days=1)).day
+            
+            # 格式化为"2025年6月1日至2025年6月30日"格式
+            formatted_date = f"{year}年{month}月1日至{year}年{month}月{last_day}日"
+            
+            # 写入B12单元格
+            summary_sheet.cell(row=12, column=2, value=formatted_date)
+            self.log_message(f"已将年月数据转换为 {formatted_date} 并写入B12单元格")
+        except Exception as e:
+            self.log_message(f"读取年月数据并转换格式写入B12单元格时出错: {str(e)}")
+            # 如果出错，记录错误但继续执行
+        
+        # 将"汇总"sheet更名为"确认函"
+        summary_sheet.title = "确认函"
+    
+    def read_statement(self, file_path, wb=None):
+        """读取供货明细表中生成确认函需要的列；wb为已加载的工作簿时直接由其第一个工作表构造，不再重新读取文件"""
+        frame_cache = get_frame_cache(os.path.join(self.get_base_path(), "frame_cache"))
+        cache_kind = frame_cache_kind("confirmations", STATEMENT_HEADER_ROW, CONFIRMATION_SOURCE_COLUMNS)
+        df = frame_cache.get(file_path, cache_kind)
+        if df is not None:
+            self.log_message("文件内容未变化，使用缓存的解析结果")
+            return df
+        df = self.read_statement_table(file_path, wb, confirmation_columns)
+        frame_cache.put(file_path, cache_kind, df)
+        return df
+    
+    def read_statement_table(self, file_path, wb=None, usecols=None):
+        """读取供货明细表（表头在第6行），wb为已加载的工作簿时使用其第一个工作表"""
+        if wb is None:
+            return read_excel_table(file_path, STATEMENT_HEADER_ROW, usecols)
+        return table_from_rows(wb.worksheets[0].iter_rows(values_only=True), STATEMENT_HEADER_ROW, usecols)
+    
+    def update_progress(self, value):
+        """更新进度条（没有窗口时忽略）"""
+        if self.root is None:
+            return
+        self.ui_events.post_progress(value)
     
     def process_file(self, file_path, is_batch=False):
         """处理单个文件，返回是否成功。当is_batch=True时，作为批处理模式的一部分运行，不显示单独的消息框"""
@@ -390,78 +1205,51 @@ class ProductClassificationApp:
             if not os.path.exists(file_path):
                 self.log_message("警告：文件不存在")
                 if not is_batch:
-                    messagebox.showerror("错误", "选择的文件不存在")
+                    self.ui_events.post_call(messagebox.showerror, "错误", "选择的文件不存在")
                     self.processing = False
-                    self.process_btn.config(state=NORMAL)
+                    self.ui_events.post_call(self.process_btn.config, state=NORMAL)
                 return False
             
-            # 读取Excel文件
+            # 读取Excel文件：工作簿只加载一次，既用于读取数据，也用于保留原始格式保存
             self.log_message("读取Excel文件...")
             try:
-                # 表头在第6行，所以跳过前5行
-                df = pd.read_excel(file_path, header=5)
+                # 表头在第6行，只读取生成确认函需要的列；内容未变化的文件直接使用缓存的解析结果
+                with self.stages.span("read"):
+                    try:
+                        wb = load_workbook(file_path)
+                    except Exception as e:
+                        # openpyxl无法打开（如.xls文件）时只读取数据，保存时使用标准方式
+                        wb, workbook_error = None, e
+                    df = self.read_statement(file_path, wb)
                 self.log_message(f"成功读取文件，共 {len(df)} 行数据")
+                self.row_count += len(df)
             except Exception as e:
                 self.log_message(f"警告：读取Excel文件失败: {str(e)}")
                 if not is_batch:
-                    messagebox.showerror("错误", f"无法读取Excel文件:\n{str(e)}")
+                    self.ui_events.post_call(messagebox.showerror, "错误", f"无法读取Excel文件:\n{str(e)}")
                     self.processing = False
-                    self.process_btn.config(state=NORMAL)
+                    self.ui_events.post_call(self.process_btn.config, state=NORMAL)
                 return False
             
             # 检查是否存在M列（Excel中的第13列）
-            if len(df.columns) < 13:  # 假设M列是第13列（索引为12）
+            source_columns = df.attrs["source_columns"]
+            if len(source_columns) < 13:  # 假设M列是第13列（索引为12）
                 self.log_message("警告：文件中没有足够的列，无法找到M列")
                 if not is_batch:
                     self.processing = False
-                    self.process_btn.config(state=NORMAL)
+                    self.ui_events.post_call(self.process_btn.config, state=NORMAL)
                 return False
             
             # 获取M列的列名和数据
-            m_column_name = df.columns[12]  # 索引为12的列（M列）
+            m_column_name = source_columns[12]  # 索引为12的列（M列）
             self.log_message(f"找到M列: {m_column_name}")
             
-            # 添加新列用于存储分类结果（在M列旁边）
-            classification_column = "品类标记"
-            df.insert(13, classification_column, "")  # 在M列后插入新列，默认为空
-            
-            # 进行分类标记
-            total_rows = len(df)
-            for i, row in df.iterrows():
-                # 更新进度条
-                progress_value = int((i + 1) / total_rows * 100)
-                self.progress['value'] = progress_value
-                self.root.update_idletasks()  # 强制更新UI
-                
-                # 获取M列内容
-                m_value = str(row[m_column_name]) if pd.notna(row[m_column_name]) else ""
-                
-                # 如果M列内容为空，则不进行标记
-                if not m_value:
-                    continue
-                
-                # 应用分类规则
-                # 1. 干货：准确查找M列内容有"鱼虾蟹干及瑶柱干"，"海参鲍鱼鱼翅干及肚干"，"其他水产干货"。"燕窝"将被标记为干货。
-                if any(keyword in m_value for keyword in ["鱼虾蟹干及瑶柱干", "海参鲍鱼鱼翅干及肚干", "其他水产干货"]) or "燕窝" in m_value:
-                    df.at[i, classification_column] = "干货"
-                # 2. 海鲜：M列内容包含"活鲜"2个字，即被标记为海鲜
-                elif "活鲜" in m_value:
-                    df.at[i, classification_column] = "海鲜"
-                # 3. 酒类：M列内容包含"酒"1个字，将被标记为酒类
-                elif "酒" in m_value:
-                    df.at[i, classification_column] = "酒类"
-                # 4. 饮料：M列内容包含"饮料"2个字，即被标记为饮料
-                elif "饮料" in m_value:
-                    df.at[i, classification_column] = "饮料"
-                # 5. 水：M列内容只有"水"这个字，即被标记为水
-                elif m_value == "水":
-                    df.at[i, classification_column] = "水"
-                # 6. 其他：所有未被以上标记的商品，将被标记为其他。
-                else:
-                    df.at[i, classification_column] = "其他"
+            # 新列用于存储分类结果（保存时写在M列旁边）
+            classification_column = CLASSIFICATION_COLUMN
+            pivot = self.classify_statement(df, m_column_name)
             
             # 根据用户选择决定是保存到新文件还是直接修改原文件
-            if self.edit_in_place_var.get():
+            if self.edit_in_place:
                 output_file = file_path
                 self.log_message("将直接在原文件上操作...")
             else:
@@ -469,6 +1257,9 @@ class ProductClassificationApp:
                 # 确保Confirmed文件夹存在
                 os.makedirs(output_dir, exist_ok=True)
                 file_name, file_ext = os.path.splitext(os.path.basename(file_path))
+                if self.hotel_profile is not None:
+                    # 命名酒店配置生成的确认函带上配置名称
+                    file_name = os.path.splitext(self.hotel_profile.tag_file_name(f"{file_name}{file_ext}"))[0]
                 # 如果文件名已经包含"_分类"，则替换为"_确认函"，否则直接添加"_确认函"
                 if "_分类" in file_name:
                     file_name = file_name.replace("_分类", "_确认函")
@@ -479,9 +1270,9 @@ class ProductClassificationApp:
             
             try:
                 # 尝试使用openpyxl保存，保留原始格式
-                # 先读取原始文件以保留格式
                 try:
-                    wb = load_workbook(file_path)
+                    if wb is None:
+                        raise workbook_error
                     ws = wb.active
                     
                     # 尝试读取Statement Sheet中的L7单元格数据（供应商名称）
@@ -510,491 +1301,33 @@ class ProductClassificationApp:
                     header_row = 6  # 表头在第6行
                     ws.cell(row=header_row, column=14, value=classification_column)
                     
-                    # 添加分类结果
-                    for i, row in df.iterrows():
-                        ws.cell(row=i+7, column=14, value=row[classification_column])  # +7是因为Excel行从1开始，且表头在第6行
-                    
-                    # 创建汇总sheet
-                    if "汇总" not in wb.sheetnames:
-                        summary_sheet = wb.create_sheet(title="汇总")
-                    else:
-                        summary_sheet = wb["汇总"]
-                    
-                    # 设置页面边距和页眉页脚（单位：厘米）
-                    summary_sheet.page_margins = PageMargins(top=0.5/2.54, left=1.5/2.54, right=0.5/2.54, bottom=0.5/2.54, header=0, footer=0)
-                    summary_sheet.page_setup.horizontalCentered = True
-                    
-                    # 设置汇总sheet的标题
-                    summary_sheet.cell(row=1, column=1, value="供应商对账确认函")
-                    summary_sheet.cell(row=1, column=1).font = Font(bold=True, size=16)
-                    summary_sheet.cell(row=1, column=1).alignment = Alignment(horizontal='center', vertical='center')
-                    # 合并标题单元格
-                    summary_sheet.merge_cells('A1:F1')
-                    
-                    # 读取config.txt文件获取酒店信息
-                    import sys
-                    config_path = os.path.join(os.path.dirname(sys.executable if getattr(sys, 'frozen', False) else os.path.abspath(__file__)), "config.txt")
-                    hotel_name = ""
-                    hotel_address = ""
-                    contact_person = ""
-                    email_address = ""
-                    
-                    if os.path.exists(config_path):
-                        try:
-                            with open(config_path, 'r', encoding='utf-8') as f:
-                                for line in f:
-                                    line = line.strip()
-                                    if line.startswith("B2:"):
-                                        hotel_name = line.replace("B2:", "").strip()
-                                    elif line.startswith("D2:"):
-                                        hotel_address = line.replace("D2:", "").strip()
-                                    elif line.startswith("E2:"):
-                                        contact_person = line.replace("E2:", "").strip()
-                                    elif line.startswith("B32:"):
-                                        email_address = line.replace("B32:", "").strip()
-                            self.log_message(f"已从config.txt读取酒店信息")
-                        except Exception as e:
-                            self.log_message(f"读取config.txt失败: {str(e)}")
-                    
-                    # 在第二行开始插入文字
-                    summary_sheet.cell(row=2, column=1, value="由酒店（酒店全称）：")
-                    summary_sheet.cell(row=2, column=2, value=hotel_name)
-                    summary_sheet.cell(row=3, column=1, value="地址：")
-                    summary_sheet.cell(row=3, column=2, value=hotel_address)
-                    summary_sheet.cell(row=4, column=1, value="财务部联系人：")
-                    summary_sheet.cell(row=4, column=2, value=contact_person)
-                    summary_sheet.cell(row=5, column=1, value="致供应商（供应商全称）：")
-                    # 将从Statement Sheet读取的供应商名称写入B5单元格
-                    summary_sheet.cell(row=5, column=2, value=supplier_name)
-                    summary_sheet.cell(row=6, column=1, value="税务登记号码：")
-                    summary_sheet.cell(row=7, column=1, value="对账联系人：")
-                    summary_sheet.cell(row=8, column=1, value="经酒店与供应商共同核对，确认产生如下交易货款：")
-                    summary_sheet.cell(row=9, column=1, value="➢ 含税总金额人民币大写：")
-                    summary_sheet.cell(row=10, column=1, value="➢ 不含税金额：")
-                    summary_sheet.cell(row=11, column=1, value="➢ 增值税税款：")
-                    summary_sheet.cell(row=12, column=1, value="货款所属期间：")
-                    summary_sheet.cell(row=13, column=1, value="明细对账信息如下：")
-                    
-                    # 合并第2-7行的B-D列
-                    for row in range(2, 8):
-                        summary_sheet.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-                        # 移除背景色
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.fill = PatternFill(fill_type=None)
-                    
-                    # 合并第9-13行的B-D列
-                    for row in range(9, 14):
-                        summary_sheet.merge_cells(start_row=row, start_column=2, end_row=row, end_column=6)
-                        # 移除背景色
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.fill = PatternFill(fill_type=None)
-                    
-                    # 创建新的表格结构，与图片中的表格结构一致
-                    # 表头第一行
-                    summary_sheet.cell(row=14, column=1, value="")
-                    summary_sheet.merge_cells(start_row=14, start_column=1, end_row=15, end_column=1)
-                    
-                    summary_sheet.cell(row=14, column=2, value="员餐")
-                    summary_sheet.merge_cells(start_row=14, start_column=2, end_row=14, end_column=3)
-                    
-                    summary_sheet.cell(row=14, column=4, value="其他餐饮点 - 非员餐")
-                    summary_sheet.merge_cells(start_row=14, start_column=4, end_row=14, end_column=5)
-                    
-                    summary_sheet.cell(row=14, column=6, value="当月总应付账款金额")
-                    summary_sheet.merge_cells(start_row=14, start_column=6, end_row=15, end_column=6)
-                    
-                    # 表头第二行
-                    summary_sheet.cell(row=15, column=2, value="不含税金额")
-                    summary_sheet.cell(row=15, column=3, value="税费")
-                    summary_sheet.cell(row=15, column=4, value="不含税金额")
-                    summary_sheet.cell(row=15, column=5, value="税费")
-                    
-                    # 设置品类列标题
-                    summary_sheet.cell(row=14, column=1, value="品类")
-
-                    
-                    # 设置表头样式
-                    header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-                    for row in range(14, 16):  # 修改为只包含第14-15行
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.font = Font(bold=True)
-                            cell.alignment = Alignment(horizontal='center', vertical='center')
-                            cell.fill = header_fill
-                            
-                            # 添加边框
-                            from openpyxl.styles import Border, Side
-                            thin_border = Border(
-                                left=Side(style='thin'),
-                                right=Side(style='thin'),
-                                top=Side(style='thin'),
-                                bottom=Side(style='thin')
-                            )
-                            cell.border = thin_border
-                    
-                    # 按用户要求的顺序显示所有分类
-                    ordered_categories = ["干货", "海鲜", "酒类", "饮料", "水", "其他"]
-                    row_idx = 16  # 从第16行开始填充数据（表头占据14-15行）
-                    
-                    # 定义员工餐厅和其他餐厅（营业点）
-                    employee_restaurants = ["员工餐厅", "员工食堂"]
+                    # 添加分类结果，整列取出后依次写入（+7是因为Excel行从1开始，且表头在第6行）
+                    for i, label in zip(df.index.tolist(), df[classification_column].tolist()):
+                        ws.cell(row=i + 7, column=14, value=label)
                     
-                    # 初始化总计变量
-                    total_employee_untaxed = 0
-                    total_employee_tax = 0
-                    total_other_untaxed = 0
-                    total_other_tax = 0
+                    # 读取Statement sheet中的税率和货款所属年月
+                    tax_rate = self.read_statement_tax_rate(wb)
+                    year_month = self.statement_period(wb, file_path)
                     
-                    # 直接填充各分类数据到新表格结构
-                    for category in ordered_categories:
-                        # 筛选该分类的员工餐厅数据
-                        employee_df = df[(df[classification_column] == category) & 
-                                         (df["部门"].isin(employee_restaurants))]
-                        
-                        # 计算员工餐厅未税金额和税额
-                        employee_untaxed = employee_df["小计金额(结算)"].sum() if not employee_df.empty else 0
-                        employee_tax = employee_df["税额(结算)"].sum() if not employee_df.empty else 0
-                        
-                        # 更新员工餐厅总计
-                        total_employee_untaxed += employee_untaxed
-                        total_employee_tax += employee_tax
-                        
-                        # 筛选该分类的其他餐厅（非员餐）数据
-                        other_df = df[(df[classification_column] == category) & 
-                                      (~df["部门"].isin(employee_restaurants))]
-                        
-                        # 计算其他餐厅未税金额和税额
-                        other_untaxed = other_df["小计金额(结算)"].sum() if not other_df.empty else 0
-                        other_tax = other_df["税额(结算)"].sum() if not other_df.empty else 0
-                        
-                        # 更新其他餐厅总计
-                        total_other_untaxed += other_untaxed
-                        total_other_tax += other_tax
-                        
-                        # 计算当月总应付账款金额
-                        total_row_amount = employee_untaxed + employee_tax + other_untaxed + other_tax
-                        
-                        # 写入汇总数据
-                        summary_sheet.cell(row=row_idx, column=1, value=category)
-                        summary_sheet.cell(row=row_idx, column=2, value="-" if employee_untaxed == 0 else employee_untaxed)
-                        summary_sheet.cell(row=row_idx, column=3, value="-" if employee_tax == 0 else employee_tax)
-                        summary_sheet.cell(row=row_idx, column=4, value="-" if other_untaxed == 0 else other_untaxed)
-                        summary_sheet.cell(row=row_idx, column=5, value="-" if other_tax == 0 else other_tax)
-                        summary_sheet.cell(row=row_idx, column=6, value="-" if total_row_amount == 0 else total_row_amount)
-                        
-                        # 设置单元格样式
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row_idx, column=col)
-                            if col > 1:  # 数字列设置数字格式
-                                cell.number_format = '#,##0.00'
-                                cell.alignment = Alignment(horizontal='right', vertical='center')
-                            else:  # 品类列左对齐
-                                cell.alignment = Alignment(horizontal='left', vertical='center')
-                            
-                            # 添加边框
-                            thin_border = Border(
-                                left=Side(style='thin'),
-                                right=Side(style='thin'),
-                                top=Side(style='thin'),
-                                bottom=Side(style='thin')
-                            )
-                            cell.border = thin_border
-                        
-                        row_idx += 1
-                        
-                    # 添加总计行
-                    summary_sheet.cell(row=row_idx, column=1, value="合计")
-                    summary_sheet.cell(row=row_idx, column=2, value="-" if total_employee_untaxed == 0 else total_employee_untaxed)
-                    summary_sheet.cell(row=row_idx, column=3, value="-" if total_employee_tax == 0 else total_employee_tax)
-                    summary_sheet.cell(row=row_idx, column=4, value="-" if total_other_untaxed == 0 else total_other_untaxed)
-                    summary_sheet.cell(row=row_idx, column=5, value="-" if total_other_tax == 0 else total_other_tax)
-                    
-                    # 计算总金额
-                    total_amount = total_employee_untaxed + total_employee_tax + total_other_untaxed + total_other_tax
-                    summary_sheet.cell(row=row_idx, column=6, value="-" if total_amount == 0 else total_amount)
-                    
-                    # 设置总计行样式
-                    total_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
-                    for col in range(1, 7):
-                        cell = summary_sheet.cell(row=row_idx, column=col)
-                        cell.font = Font(bold=True, size=12)
-                        cell.fill = total_fill
-                        
-                        # 设置底部双边框
-                        from openpyxl.styles import Border, Side
-                        double_bottom_border = Border(
-                            left=Side(style='thin'),
-                            right=Side(style='thin'),
-                            top=Side(style='thin'),
-                            bottom=Side(style='double')
-                        )
-                        cell.border = double_bottom_border
-                        
-                        if col == 1:
-                            cell.alignment = Alignment(horizontal='left', vertical='center')
-                        else:
-                            cell.alignment = Alignment(horizontal='right', vertical='center')
-                            cell.number_format = '#,##0.00'
-                    
-                    # 读取总计行的第6列（总金额）并转换为中文大写写入B9单元格
-                    try:
-                        # total_amount已在前面计算
-                        if total_amount is not None:
-                            # 转换为中文大写（函数内部已添加"圆"字）
-                            chinese_amount = num_to_chinese(total_amount)
-                            # 转换为小写
-                            lowercase_amount = f"{total_amount:.2f}元"
-                            # 写入B9单元格（含税总金额人民币大写）
-                            summary_sheet.cell(row=9, column=2, value=f"{chinese_amount}（小写：{lowercase_amount}）")
-                            self.log_message(f"已将总金额 {total_amount} 转换为大写 {chinese_amount} 并写入B9单元格")
-                        else:
-                            self.log_message("总金额为空，无法转换为中文大写")
-                    except Exception as e:
-                        self.log_message(f"转换总金额为中文大写时出错: {str(e)}")
-                        # 如果出错，尝试直接写入原始值
-                        try:
-                            if total_amount is not None:
-                                summary_sheet.cell(row=9, column=2, value=f"{total_amount:.2f}元")
-                        except:
-                            pass
-                    
-                    # 读取总计行的数据并写入B10和B11单元格
-                    try:
-                        # 使用当前总计行的数据
-                        total_untaxed = total_employee_untaxed + total_other_untaxed
-                        total_tax = total_employee_tax + total_other_tax
-                        
-                        if total_untaxed is not None:
-                            # 写入B10单元格，前面加上"小写"，后面加上"元"
-                            summary_sheet.cell(row=10, column=2, value=f"小写{total_untaxed:.2f}元")
-                            self.log_message(f"已将未税总金额 {total_untaxed} 写入B10单元格")
-                        else:
-                            self.log_message("未税总金额为空，无法写入B10单元格")
-                            
-                        if total_tax is not None:
-                            # 获取Statement sheet中的税率信息
-                            tax_rate_text = ""
-                            self.log_message(f"工作表列表: {wb.sheetnames}")
-                            if "Statement" in wb.sheetnames:
-                                statement_sheet = wb["Statement"]
-                                tax_rate = statement_sheet.cell(row=7, column=11).value  # K7单元格
-                                if tax_rate is not None:
-                                    tax_rate_text = str(tax_rate)
-                                    self.log_message(f"获取到税率值: {tax_rate}")
-                                else:
-                                    self.log_message("未获取到税率值")
-                            
-                            # 写入B11单元格，包含税率信息
-                            summary_sheet.cell(row=11, column=2, value=f"小写{total_tax:.2f}元 (税率：{tax_rate_text})")                            
-                            self.log_message(f"已将税额总金额 {total_tax} 和税率信息写入B11单元格")
-                        else:
-                            self.log_message("税额总金额为空，无法写入B11单元格")
-                    except Exception as e:
-                        self.log_message(f"读取总计行数据并写入B10和B11单元格时出错: {str(e)}")
-                        # 如果出错，记录错误但继续执行
-                    
-                    # 读取Statement sheet中的A列年月数据并转换格式写入B12单元格
-                    try:
-                        # 获取年月数据
-                        year_month = ""
-                        # 检查是否存在名为"Statement Sheet"的工作表
-                        if "Statement Sheet" in wb.sheetnames:
-                            statement_sheet = wb["Statement Sheet"]
-                            # 尝试从A列获取年月数据（通常在A1或其他位置）
-                            for row in range(1, 10):  # 检查前10行
-                                cell_value = statement_sheet.cell(row=row, column=1).value
-                                if cell_value and isinstance(cell_value, str) and re.search(r'\d{4}[-年]\d{1,2}', cell_value):
-                                    year_month = cell_value
-                                    break
-                        
-                        # 如果没有找到年月数据，尝试从文件名获取
-                        if not year_month:
-                            file_name = os.path.basename(file_path)
-                            match = re.match(r'(\d{4}-\d{2})_(.+?)(_分类)?\.xlsx', file_name)
-                            if match:
-                                year_month = match.group(1)
-                        
-                        # 如果仍然没有找到年月数据，使用当前年月
-                        if not year_month:
-                            now = datetime.now()
-                            year_month = now.strftime('%Y-%m')
-                        
-                        # 解析年月数据
-                        if '-' in year_month:
-                            year, month = year_month.split('-')
-                        elif '年' in year_month:
-                            match = re.search(r'(\d{4})年(\d{1,2})', year_month)
-                            if match:
-                                year, month = match.group(1), match.group(2)
-                            else:
-                                raise ValueError(f"无法解析年月格式: {year_month}")
-                        else:
-                            raise ValueError(f"无法解析年月格式: {year_month}")
-                        
-                        # 获取月份的最后一天
-                        if int(month) == 12:
-                            next_month = datetime(int(year) + 1, 1, 1)
-                        else:
-                            next_month = datetime(int(year), int(month) + 1, 1)
-                        
-                        last_day = (next_month - timedelta(days=1)).day
-                        
-                        # 格式化为"2025年6月1日至2025年6月30日"格式
-                        formatted_date = f"{year}年{month}月1日至{year}年{month}月{last_day}日"
-                        
-                        # 写入B12单元格
-                        summary_sheet.cell(row=12, column=2, value=formatted_date)
-                        self.log_message(f"已将年月数据转换为 {formatted_date} 并写入B12单元格")
-                    except Exception as e:
-                        self.log_message(f"读取年月数据并转换格式写入B12单元格时出错: {str(e)}")
-                        # 如果出错，记录错误但继续执行
-                    
-                    # 调整列宽
-                    summary_sheet.column_dimensions["A"].width = 28
-                    summary_sheet.column_dimensions["B"].width = 15
-                    summary_sheet.column_dimensions["C"].width = 12
-                    summary_sheet.column_dimensions["D"].width = 12
-                    summary_sheet.column_dimensions["E"].width = 12
-                    summary_sheet.column_dimensions["F"].width = 20
-                    # 在A25单元格开始插入备注文字
-                    summary_sheet.cell(row=25, column=1, value="备注：")
-                    summary_sheet.cell(row=25, column=1).font = Font(bold=True)
-                    # 合并A25-F25单元格
-                    summary_sheet.merge_cells(start_row=25, start_column=1, end_row=25, end_column=6)
-                    
-                    # 设置备注文字的样式
-                    remark_font = Font(size=11)
-                    remark_alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-                    
-                    # 添加备注内容
-                    remarks = [
-                        "1. 品类根据供应商实际送货的情况填写，不适用的可留空",
-                        "2. 员餐货款的不含税金额，如零税率，酒店需要根据实际收货记录的总金额去换算含税及不含税填写",
-                        "3. 本函由双方核对原始收货单据后填写，供应商当月供货数据与酒店当月应付账款金额一致",
-                        "4. 供应商根据核对后确认的金额开具相关增值税发票给酒店",
-                        "5. 请供应商在确认后，需加盖公章或财务专用章，扫描后邮件回传酒店做存档",
-                        "6. 建议随确认函发送增值税发票号和发票金额以及发票复印件",
-                        "7. 电子邮件发送至：",
-                        "8. 本函请在收到后 2 个工作日内返回",
-                        "9. 扫描件需清晰显示：金额、盖章、日期三要素，模糊文件视为无效"
-                    ]
-                    
-                    for i, remark in enumerate(remarks):
-                        cell = summary_sheet.cell(row=26+i, column=1, value=remark)
-                        cell.font = remark_font
-                        cell.alignment = remark_alignment
-                        # 合并每行的A至F列，但跳过第32行（26+6）
-                        if 26+i != 32:
-                            summary_sheet.merge_cells(start_row=26+i, start_column=1, end_row=26+i, end_column=6)
-                    
-                    # 在B32单元格中添加邮箱地址
-                    email_cell = summary_sheet.cell(row=32, column=2, value=email_address)
-                    email_cell.font = remark_font
-                    email_cell.alignment = remark_alignment
-                    # 合并B32到F32单元格
-                    summary_sheet.merge_cells(start_row=32, start_column=2, end_row=32, end_column=6)
-                    
-                    # 在第36行A列插入供应商确认日期文字
-                    date_font = Font(size=11)
-                    date_alignment = Alignment(horizontal='left', vertical='center')
-                    
-                    date_cell = summary_sheet.cell(row=36, column=1, value="供应商确认日期：_______年_______月_______日")
-                    date_cell.font = date_font
-                    date_cell.alignment = date_alignment
-                    # 合并供应商确认日期行的A至F列
-                    summary_sheet.merge_cells(start_row=36, start_column=1, end_row=36, end_column=6)
-                    # 合并第39行的A至F列
-                    summary_sheet.merge_cells(start_row=39, start_column=1, end_row=39, end_column=6)
-                    
-                    # 在第38行插入供应商盖章确认文字
-                    stamp_font = Font(size=13, underline="single")
-                    stamp_alignment = Alignment(horizontal='center', vertical='center')
-                    
-                    stamp_cell = summary_sheet.cell(row=39, column=1, value="供应商盖章确认")
-                    stamp_cell.font = stamp_font
-                    stamp_cell.alignment = stamp_alignment
-                    # 合并第39行的A至F列
-                    summary_sheet.merge_cells(start_row=39, start_column=1, end_row=39, end_column=6)
-                    
-                    # 设置所有数据单元格的边框和对齐方式
-                    from openpyxl.styles import Border, Side
-                    thin_border = Border(
-                        left=Side(style='thin'),
-                        right=Side(style='thin'),
-                        top=Side(style='thin'),
-                        bottom=Side(style='thin')
-                    )
-                    
-                    # 设置所有单元格的边框和格式
-                    for row in range(14, row_idx + 1):
-                        for col in range(1, 5):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.border = thin_border
-                            
-                            # 为数字列设置对齐方式和数字格式
-                            if col > 1:  # 金额列
-                                cell.alignment = Alignment(horizontal='right', vertical='center')
-                                cell.number_format = '#,##0.00'
-                            else:  # 分类列
-                                cell.alignment = Alignment(horizontal='left', vertical='center')
-                    
-                    # 为分类行添加交替背景色
-                    light_fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")
-                    
-                    # 员工餐厅分类行
-                    start_row = 5  # 员工餐厅分类开始行
-                    for i, _ in enumerate(ordered_categories):
-                        if i % 2 == 1:  # 偶数行添加浅色背景
-                            for col in range(1, 5):
-                                summary_sheet.cell(row=start_row + i, column=col).fill = light_fill
-                    
-                    # 其他餐厅（营业点）分类行
-                    start_row = 5 + len(ordered_categories) + 3  # 其他餐厅（营业点）分类开始行
-                    for i, _ in enumerate(ordered_categories):
-                        if i % 2 == 1:  # 偶数行添加浅色背景
-                            for col in range(1, 5):
-                                summary_sheet.cell(row=start_row + i, column=col).fill = light_fill
-                    
-                    # 将"汇总"sheet更名为"确认函"
-                    summary_sheet.title = "确认函"
-                    self.log_message(f"已将汇总sheet更名为确认函")
-                    
-                    # 重新设置第14行和第15行居中对齐，浅蓝色背景色
-                    light_blue_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-                    for row in range(14, 16):
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.alignment = Alignment(horizontal='center', vertical='center')
-                            cell.fill = light_blue_fill
-                    self.log_message(f"已重新设置第14行和第15行居中对齐，浅蓝色背景色")
-                    
-                    # 设置第2行到第12行无背景色
-                    for row in range(2, 13):
-                        for col in range(1, 7):
-                            cell = summary_sheet.cell(row=row, column=col)
-                            cell.fill = PatternFill(fill_type=None)
-                    self.log_message(f"已设置第2行到第12行无背景色")
-                    
-                    # 设置第2行、第5行、第8行和第13行的行高为30
-                    for row_num in [2, 5, 8, 13]:
-                        summary_sheet.row_dimensions[row_num].height = 30
-                    self.log_message(f"已设置第2行、第5行、第8行和第13行的行高为30")
+                    # 创建确认函sheet
+                    self.add_confirmation_sheet(wb, pivot, supplier_name, tax_rate, year_month)
                     
                     # 保存文件
-                    wb.save(output_file)
-                    if self.edit_in_place_var.get():
+                    with self.stages.span("save"):
+                        wb.save(output_file)
+                    if self.edit_in_place:
                         self.log_message(f"已保留原始格式直接修改原文件")
                     else:
                         self.log_message(f"已保留原始格式保存文件到: {output_file}")
                     self.log_message(f"已创建供应商对账确认函sheet")
                 except Exception as e:
                     self.log_message(f"保留格式保存失败，将使用标准方式保存: {str(e)}")
-                    # 如果上面的方法失败，使用pandas直接保存
-                    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                        df.to_excel(writer, index=False)
-                    if self.edit_in_place_var.get():
+                    # 如果上面的方法失败，读取全部列并在M列后插入分类结果，使用pandas直接保存
+                    full_df = self.read_statement_table(file_path, wb)
+                    full_df.insert(13, classification_column, df[classification_column].to_numpy())
+                    with self.stages.span("save"), pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+                        full_df.to_excel(writer, index=False)
+                    if self.edit_in_place:
                         self.log_message(f"已使用标准方式直接修改原文件")
                     else:
                         self.log_message(f"已使用标准方式保存文件到: {output_file}")
@@ -1002,7 +1335,7 @@ class ProductClassificationApp:
                 self.log_message(f"保存文件时出错: {str(e)}")
                 return False
             
-            if self.edit_in_place_var.get():
+            if self.edit_in_place:
                 self.log_message(f"分类完成，已直接修改原文件")
                 self.log_message(f"文件路径: {output_file}")
             else:
@@ -1013,81 +1346,39 @@ class ProductClassificationApp:
             self.log_message("\n分类统计结果:")
             total_items = len(df)
             
-            # 按财务标记分类统计，按指定顺序显示
-            ordered_categories = ["干货", "海鲜", "酒类", "饮料", "水", "其他"]
-            
-            # 定义员工餐厅和其他餐厅（营业点）
-            employee_restaurants = ["员工餐厅", "员工食堂"]
-            
-            # 初始化总计变量
-            total_employee_untaxed = 0
-            total_employee_tax = 0
-            total_other_untaxed = 0
-            total_other_tax = 0
-            
-            # 员工餐厅统计
-            self.log_message("\n员工餐厅:")
-            employee_items = len(df[df["部门"].isin(employee_restaurants)])
-            
-            for category in ordered_categories:
-                # 筛选该分类的员工餐厅数据
-                category_df = df[(df[classification_column] == category) & 
-                                 (df["部门"].isin(employee_restaurants))]
-                count = len(category_df)
-                
-                # 计算未税金额和税额
-                untaxed_amount = category_df["小计金额(结算)"].sum() if not category_df.empty else 0
-                tax_amount = category_df["税额(结算)"].sum() if not category_df.empty else 0
-                total_amount = untaxed_amount + tax_amount
-                
-                # 更新员工餐厅总计
-                total_employee_untaxed += untaxed_amount
-                total_employee_tax += tax_amount
-                
-                # 输出统计信息
-                percentage = (count / employee_items) * 100 if employee_items > 0 else 0
-                self.log_message(f"{category}: {count}项 ({percentage:.1f}%)")
-                self.log_message(f"  未税金额: {untaxed_amount:.2f}")
-                self.log_message(f"  税额: {tax_amount:.2f}")
-                self.log_message(f"  总金额: {total_amount:.2f}")
-            
-            # 员工餐厅小计
-            self.log_message("\n员工餐厅小计:")
-            self.log_message(f"未税金额: {total_employee_untaxed:.2f}")
-            self.log_message(f"税额: {total_employee_tax:.2f}")
-            self.log_message(f"总金额: {(total_employee_untaxed + total_employee_tax):.2f}")
+            # 按财务标记分类统计，按指定顺序显示（来自前面的分组汇总结果）
+            group_titles = [("employee", "员工餐厅"), ("other", "其他餐厅（营业点）")]
+            group_totals = {}
             
-            # 其他餐厅（营业点）统计
-            self.log_message("\n其他餐厅（营业点）:")
-            other_items = len(df[~df["部门"].isin(employee_restaurants)])
-            
-            for category in ordered_categories:
-                # 筛选该分类的其他餐厅（营业点）数据
-                category_df = df[(df[classification_column] == category) & 
-                                 (~df["部门"].isin(employee_restaurants))]
-                count = len(category_df)
-                
-                # 计算未税金额和税额
-                untaxed_amount = category_df["小计金额(结算)"].sum() if not category_df.empty else 0
-                tax_amount = category_df["税额(结算)"].sum() if not category_df.empty else 0
-                total_amount = untaxed_amount + tax_amount
+            for group, title in group_titles:
+                self.log_message(f"\n{title}:")
+                # 占比按该组已标记品类的条数计算（不含合计行）
+                group_items = int(pivot[f"{group}_count"].sum())
                 
-                # 更新其他餐厅（营业点）总计
-                total_other_untaxed += untaxed_amount
-                total_other_tax += tax_amount
+                for category, amounts in pivot.iterrows():
+                    count = int(amounts[f"{group}_count"])
+                    untaxed_amount = amounts[f"{group}_untaxed"]
+                    tax_amount = amounts[f"{group}_tax"]
+                    total_amount = untaxed_amount + tax_amount
+                    
+                    # 输出统计信息
+                    percentage = (count / group_items) * 100 if group_items > 0 else 0
+                    self.log_message(f"{category}: {count}项 ({percentage:.1f}%)")
+                    self.log_message(f"  未税金额: {untaxed_amount:.2f}")
+                    self.log_message(f"  税额: {tax_amount:.2f}")
+                    self.log_message(f"  总金额: {total_amount:.2f}")
                 
-                # 输出统计信息
-                percentage = (count / other_items) * 100 if other_items > 0 else 0
-                self.log_message(f"{category}: {count}项 ({percentage:.1f}%)")
-                self.log_message(f"  未税金额: {untaxed_amount:.2f}")
-                self.log_message(f"  税额: {tax_amount:.2f}")
-                self.log_message(f"  总金额: {total_amount:.2f}")
+                # 小计
+                group_untaxed = sum(pivot[f"{group}_untaxed"].tolist())
+                group_tax = sum(pivot[f"{group}_tax"].tolist())
+                group_totals[group] = (group_untaxed, group_tax)
+                self.log_message(f"\n{title}小计:")
+                self.log_message(f"未税金额: {group_untaxed:.2f}")
+                self.log_message(f"税额: {group_tax:.2f}")
+                self.log_message(f"总金额: {(group_untaxed + group_tax):.2f}")
             
-            # 其他餐厅（营业点）小计
-            self.log_message("\n其他餐厅（营业点）小计:")
-            self.log_message(f"未税金额: {total_other_untaxed:.2f}")
-            self.log_message(f"税额: {total_other_tax:.2f}")
-            self.log_message(f"总金额: {(total_other_untaxed + total_other_tax):.2f}")
+            total_employee_untaxed, total_employee_tax = group_totals["employee"]
+            total_other_untaxed, total_other_tax = group_totals["other"]
             
             # 输出总计信息
             total_untaxed = total_employee_untaxed + total_other_untaxed
@@ -1102,8 +1393,8 @@ class ProductClassificationApp:
             if is_batch:
                 return True
             # 非批处理模式下，询问用户是否打开文件夹
-            message = "文件处理完成，" + ("已直接修改原文件" if self.edit_in_place_var.get() else f"已保存到:\n{output_file}")
-            if messagebox.askyesno("处理完成", f"{message}\n\n是否打开文件所在文件夹？"):
+            message = "文件处理完成，" + ("已直接修改原文件" if self.edit_in_place else f"已保存到:\n{output_file}")
+            if self.ui_events.invoke(messagebox.askyesno, "处理完成", f"{message}\n\n是否打开文件所在文件夹？"):
                 try:
                     output_dir = os.path.dirname(output_file)
                     if sys.platform == "win32":
@@ -1114,7 +1405,7 @@ class ProductClassificationApp:
                         subprocess.call(["xdg-open", output_dir])
                 except Exception as e:
                     self.log_message(f"无法打开文件夹: {str(e)}")
-                    messagebox.showerror("错误", f"无法打开文件夹:\n{str(e)}")
+                    self.ui_events.post_call(messagebox.showerror, "错误", f"无法打开文件夹:\n{str(e)}")
             
             return True
             
@@ -1124,8 +1415,64 @@ class ProductClassificationApp:
         finally:
             if not is_batch:
                 self.processing = False
-                self.process_btn.config(state=NORMAL)
-                self.progress['value'] = 100
+                self.ui_events.post_call(self.process_btn.config, state=NORMAL)
+                self.update_progress(100)
+    
+    def get_base_path(self):
+        """获取程序运行路径（config.txt所在目录）"""
+        return os.path.dirname(sys.executable if getattr(sys, 'frozen', False) else os.path.abspath(__file__))
+    
+    def get_hotel_profile(self):
+        """获取酒店配置：指定了hotel_profile时使用它，否则使用程序目录的config.txt（不存在或无法读取时返回None）"""
+        if self.hotel_profile is not None:
+            return self.hotel_profile
+        try:
+            return get_hotel_profile(self.get_base_path())
+        except Exception as e:
+            self.log_message(f"读取config.txt失败: {str(e)}")
+            return None
+    
+    def get_employee_departments(self):
+        """获取员餐部门列表，酒店配置中的 employee_departments: 行可以覆盖默认值（用逗号或顿号分隔）"""
+        profile = self.get_hotel_profile()
+        if profile is not None and profile.employee_departments:
+            return list(profile.employee_departments)
+        return list(DEFAULT_EMPLOYEE_DEPARTMENTS)
+    
+    def get_classification_engine(self):
+        """获取品类标记引擎，规则文件classification_rules.json与config.txt放在同一目录"""
+        return load_classification_engine(os.path.join(self.get_base_path(), "classification_rules.json"))
+    
+    def get_category_index(self):
+        """获取品类标记索引（本次运行期间共用同一个内存缓存）"""
+        if self.category_index is None:
+            self.category_index = CategoryIndex(os.path.join(self.get_base_path(), "category_index.db"))
+        return self.category_index
+    
+    def export_category_index(self):
+        """导出品类索引到CSV文件"""
+        csv_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")],
+                                                initialfile="品类索引.csv")
+        if not csv_path:
+            return
+        try:
+            count = self.get_category_index().export_csv(csv_path)
+            self.log_message(f"已导出品类索引 {count} 条到: {csv_path}")
+        except Exception as e:
+            self.log_message(f"导出品类索引失败: {str(e)}")
+            messagebox.showerror("错误", f"导出品类索引失败:\n{str(e)}")
+    
+    def import_category_index(self):
+        """从CSV文件导入品类索引"""
+        csv_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+        if not csv_path:
+            return
+        try:
+            count = self.get_category_index().import_csv(csv_path)
+            self.log_message(f"已导入品类索引 {count} 条")
+        except Exception as e:
+            self.log_message(f"导入品类索引失败: {str(e)}")
+            messagebox.showerror("错误", f"导入品类索引失败:\n{str(e)}")
     
     def bring_to_front(self):
         """将窗口带到前台"""
@@ -1144,7 +1491,22 @@ class ProductClassificationApp:
         )
         developer_label.pack(side=BOTTOM, pady=5)
 
+def _process_file_in_worker(file_path, edit_in_place, hotel_profile=None):
+    """在工作进程中为单个供货明细表生成确认函，返回是否成功、日志、数据行数和阶段耗时"""
+    app = ProductClassificationApp()
+    app.edit_in_place = edit_in_place
+    app.hotel_profile = hotel_profile
+    success = app.process_file(file_path, is_batch=True)
+    return {
+        "success": success,
+        "messages": app.log_messages,
+        "row_count": app.row_count,
+        "spans": app.stages.spans,
+    }
+
 if __name__ == "__main__":
+    # 打包后的程序启动工作进程时需要
+    multiprocessing.freeze_support()
     root = Tk()
     app = ProductClassificationApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,490 @@
+"""供应商对账工具集的命令行批处理入口（不创建任何Tk窗口，可在没有图形界面的服务器上定时运行）
+
+用法示例：
+    python Recon_CLI_ByTAX.py statements 收货单商品明细.xlsx --parallel
+    python Recon_CLI_ByTAX.py confirm export/2025-06 --parallel
+    python Recon_CLI_ByTAX.py all 报表文件夹 --parallel --log-file run.log
+    python Recon_CLI_ByTAX.py watch inbox --parallel --confirm
+    python Recon_CLI_ByTAX.py statements 收货单商品明细.xlsx --with-confirmation
+    python Recon_CLI_ByTAX.py hotels --parallel --confirm
+    python Recon_CLI_ByTAX.py statements 全年收货明细.xlsx --memory-budget 256
+
+statements 生成供应商对账单，confirm 生成对账确认函，all 先生成对账单再为本次处理的报表对应的对账单生成确认函，
+watch 持续监视收件文件夹，新报表写入完成后自动生成对账单并归档。
+加 --with-confirmation 时对账单中直接包含品类标记和确认函sheet，all 不再单独生成确认函。
+--hotel 名称 使用profiles文件夹中的命名酒店配置（默认使用config.txt）；hotels 一次处理各酒店配置的收件文件夹，
+生成的文件名带有酒店配置名称。
+--memory-budget MB 使用低内存模式：分块读取超大报表并按供应商和税率暂存到磁盘分区，内存占用由预算决定。
+任一文件处理失败时退出码为1，全部成功但有警告时退出码为3。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import zipfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_WARNINGS = 3
+
+def is_excel_file(path):
+    """是否为需要处理的Excel文件（跳过Excel打开文件时产生的临时文件）"""
+    name = os.path.basename(path)
+    return name.lower().endswith((".xlsx", ".xls")) and not name.startswith("~$")
+
+def collect_excel_files(paths):
+    """展开命令行中的文件和文件夹，返回(Excel文件列表, 不存在的路径列表)"""
+    files = []
+    missing = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, "*.xlsx")) + glob.glob(os.path.join(path, "*.xls"))
+            files.extend(sorted(f for f in found if is_excel_file(f)))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            missing.append(path)
+    # 去除重复文件，保持顺序
+    return list(dict.fromkeys(os.path.abspath(f) for f in files)), missing
+
+class StageReport:
+    """一个处理阶段的结果和处理速度"""
+
+    def __init__(self, name, file_results, elapsed, row_count, group_count=None, outputs=()):
+        self.name = name
+        # 本阶段生成的文件
+        self.outputs = list(outputs)
+        self.file_results = file_results
+        self.elapsed = elapsed
+        self.row_count = row_count
+        self.group_count = group_count
+
+    @property
+    def failed_files(self):
+        return [path for path, success, _ in self.file_results if not success]
+
+    @property
+    def warning_count(self):
+        return sum(len(warnings) for _, _, warnings in self.file_results)
+
+    def summary(self):
+        """返回一行阶段汇总，包括文件/行/对账单的处理速度"""
+        seconds = max(self.elapsed, 1e-6)
+        total = len(self.file_results)
+        parts = [
+            f"[{self.name}] 文件 {total} 个，成功 {total - len(self.failed_files)} 个，"
+            f"失败 {len(self.failed_files)} 个，警告 {self.warning_count} 条，耗时 {self.elapsed:.2f} 秒",
+            f"{total / seconds:.2f} 文件/秒",
+            f"{self.row_count / seconds:.1f} 行/秒",
+        ]
+        if self.group_count is not None:
+            parts.append(f"{self.group_count / seconds:.2f} 对账单/秒")
+        return " | ".join(parts)
+
+def run_statements(input_files, output_folder, archive_folder, parallel, profile=False, merge=False,
+                   with_confirmation=False, hotel_profile=None, files_in_pool=False, memory_budget=None):
+    """生成供应商对账单，返回(阶段结果, 日志列表)"""
+    from Bldbuy_Recon_ByTAX import BldBuyApp
+
+    app = BldBuyApp()
+    app.profile_run = profile
+    app.merge_batch = merge
+    app.confirmation_pipeline = with_confirmation
+    app.hotel_profile = hotel_profile
+    app.files_in_pool = files_in_pool
+    app.memory_budget = memory_budget
+    start = time.perf_counter()
+    file_results = app.run_batch(input_files, parallel, output_folder, archive_folder)
+    elapsed = time.perf_counter() - start
+    outputs = statement_paths(output_folder, app.group_records)
+    return StageReport("statements", file_results, elapsed, app.row_count, app.group_count, outputs), app.log_messages
+
+def run_confirmations(input_files, edit_in_place, profile=False, parallel=False, hotel_profile=None,
+                      files_in_pool=False):
+    """生成对账确认函，返回(阶段结果, 日志列表)"""
+    from Product_Classification_Tool_ByTAX import ProductClassificationApp
+
+    app = ProductClassificationApp()
+    app.edit_in_place = edit_in_place
+    app.profile_run = profile
+    app.parallel = parallel
+    app.hotel_profile = hotel_profile
+    app.files_in_pool = files_in_pool
+    start = time.perf_counter()
+    file_results = app.run_batch(input_files)
+    elapsed = time.perf_counter() - start
+    return StageReport("confirm", file_results, elapsed, app.row_count), app.log_messages
+
+def statement_paths(output_folder, group_records):
+    """本次运行处理的各分组对账单的路径（去掉重复和已不存在的文件），取自分组记录中的output"""
+    paths = (os.path.join(output_folder, *entry["output"].split("/")) for _, entry in group_records)
+    return [path for path in dict.fromkeys(paths) if os.path.isfile(path)]
+
+class InboxWatcher:
+    """轮询方式监视收件文件夹，返回已写入完成的新文件或已修改的文件
+    
+    - 文件大小和修改时间在settle_time秒内不再变化才认为写入完成，
+      .xlsx还要求能作为完整的zip文件打开
+    - 一批文件陆续到达时，等到最后一个文件也写入完成后一起返回（去抖动），
+      仍在写入的文件中最早的一个等待超过max_wait秒时不再等待它们
+    - 写入完成但超过max_wait秒仍不是完整文件的，给出警告并按处理失败记录
+    - 处理失败的文件在内容变化之前不会再次返回
+    """
+
+    def __init__(self, inbox, settle_time=3.0, max_wait=60.0):
+        self.inbox = inbox
+        self.settle_time = settle_time
+        self.max_wait = max_wait
+        # 等待处理的文件：路径 -> [文件签名, 最后变化时间, 首次发现时间]
+        self.pending = {}
+        # 已处理失败的文件：路径 -> 失败时的文件签名
+        self.failed = {}
+
+    def scan(self):
+        """返回收件文件夹中所有Excel文件的(大小, 修改时间)"""
+        signatures = {}
+        try:
+            entries = list(os.scandir(self.inbox))
+        except FileNotFoundError:
+            return signatures
+        for entry in entries:
+            if not entry.is_file() or not is_excel_file(entry.path):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # 扫描过程中文件已被移走
+            signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def is_complete(self, path):
+        """检查文件是否可以读取（.xlsx需要是完整的zip文件）"""
+        try:
+            if path.lower().endswith(".xlsx"):
+                return zipfile.is_zipfile(path)
+            with open(path, "rb"):
+                return True
+        except OSError:
+            return False
+
+    def poll(self, now):
+        """扫描一次收件文件夹，有可以处理的一批文件时按到达顺序返回，否则返回空列表"""
+        signatures = self.scan()
+        
+        # 已移走的文件不再等待
+        for path in list(self.pending):
+            if path not in signatures:
+                del self.pending[path]
+        for path in list(self.failed):
+            if signatures.get(path) != self.failed[path]:
+                del self.failed[path]
+        
+        for path, signature in signatures.items():
+            if path in self.failed:
+                continue
+            state = self.pending.get(path)
+            if state is None:
+                self.pending[path] = [signature, now, now]
+            elif state[0] != signature:
+                state[0] = signature
+                state[1] = now
+        
+        if not self.pending:
+            return []
+        
+        settled = [path for path, (_, changed, _) in self.pending.items() if now - changed >= self.settle_time]
+        unsettled = [state for path, state in self.pending.items() if path not in settled]
+        waited_too_long = bool(unsettled) and now - min(first_seen for _, _, first_seen in unsettled) >= self.max_wait
+        if unsettled and not waited_too_long:
+            return []
+        
+        batch = []
+        for path in settled:
+            if self.is_complete(path):
+                batch.append(path)
+                del self.pending[path]
+            elif now - self.pending[path][1] >= self.max_wait:
+                # 不再变化却一直无法打开的文件不会再完整，不再等待
+                print(f"警告：文件超过 {self.max_wait:g} 秒仍不是完整的Excel文件，跳过: {path}", file=sys.stderr, flush=True)
+                del self.pending[path]
+                self.mark_failed(path)
+        return sorted(batch, key=lambda path: signatures[path][1])
+
+    def mark_failed(self, path):
+        """记录处理失败的文件，内容变化之前不再处理"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self.failed[path] = (stat.st_size, stat.st_mtime_ns)
+
+def print_reports(reports, log_messages, args):
+    """输出日志、失败的文件、警告和各阶段汇总"""
+    if args.log_file:
+        with open(args.log_file, "a" if args.command == "watch" else "w", encoding="utf-8") as f:
+            f.write("\n".join(log_messages) + "\n")
+    if args.verbose:
+        print("\n".join(log_messages))
+
+    for report in reports:
+        for path, success, warnings in report.file_results:
+            if not success:
+                print(f"[{report.name}] 处理失败: {path}", file=sys.stderr)
+            for warning in warnings:
+                print(f"[{report.name}] {os.path.basename(path)}: {warning.strip()}", file=sys.stderr)
+    for report in reports:
+        print(report.summary(), flush=True)
+
+def run_pipeline(command, input_files, args):
+    """执行一次处理，返回(各阶段结果, 日志列表)"""
+    reports = []
+    log_messages = []
+    if command in ("statements", "all"):
+        report, messages = run_statements(input_files, args.output_dir, args.archive_dir, args.parallel,
+                                         args.profile, args.merge, args.with_confirmation,
+                                         args.hotel_profile, args.files_in_pool, args.memory_budget)
+        reports.append(report)
+        log_messages.extend(messages)
+        if command == "all" and not args.with_confirmation:
+            # 只为本次处理的报表对应的对账单生成确认函
+            report, messages = run_confirmations(report.outputs, edit_in_place=False, profile=args.profile,
+                                                 parallel=args.parallel, hotel_profile=args.hotel_profile,
+                                                 files_in_pool=args.files_in_pool)
+            reports.append(report)
+            log_messages.extend(messages)
+    else:
+        report, messages = run_confirmations(input_files, args.edit_in_place, args.profile, args.parallel,
+                                             args.hotel_profile, args.files_in_pool)
+        reports.append(report)
+        log_messages.extend(messages)
+    return reports, log_messages
+
+def run_hotels(args):
+    """处理各酒店配置收件文件夹中的报表，返回(各阶段结果, 日志列表, 不存在的配置或文件夹)
+    
+    使用多进程时各酒店同时处理：所有酒店的报表都在同一个进程池中处理，
+    本进程中每个酒店一个线程，只负责记录结果、移动输出文件和归档。
+    """
+    from Bldbuy_Recon_ByTAX import get_application_path
+    from Recon_Common_ByTAX import get_hotel_profile, list_hotel_profiles
+
+    base_path = get_application_path()
+    jobs = []
+    missing = []
+    for name in args.names or list_hotel_profiles(base_path):
+        profile = get_hotel_profile(base_path, name)
+        if profile is None:
+            print(f"警告：找不到酒店配置: {name}", file=sys.stderr)
+            missing.append(name)
+            continue
+        input_files, missing_paths = collect_excel_files([profile.inbox])
+        for path in missing_paths:
+            print(f"警告：酒店配置 {name} 的收件文件夹不存在: {path}", file=sys.stderr)
+        missing.extend(missing_paths)
+        if input_files:
+            hotel_args = argparse.Namespace(**vars(args))
+            hotel_args.hotel_profile = profile
+            hotel_args.output_dir = profile.output_dir
+            hotel_args.archive_dir = profile.archive_dir
+            jobs.append((profile, input_files, hotel_args))
+
+    # 性能分析和合并模式需要在本进程中读取报表，这时逐个酒店处理
+    concurrent = args.parallel and not args.profile and not args.merge and len(jobs) > 1
+    command = "all" if args.confirm else "statements"
+
+    def run_job(job):
+        _, input_files, hotel_args = job
+        hotel_args.files_in_pool = concurrent
+        if concurrent and args.memory_budget:
+            # 各酒店同时处理时平分内存预算
+            hotel_args.memory_budget = args.memory_budget / len(jobs)
+        return run_pipeline(command, input_files, hotel_args)
+
+    if concurrent:
+        from Recon_Common_ByTAX import warm_up_process_pool
+        warm_up_process_pool()
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(run_job, jobs))
+    else:
+        results = [run_job(job) for job in jobs]
+
+    reports = []
+    log_messages = []
+    for (profile, _, _), (hotel_reports, messages) in zip(jobs, results):
+        for report in hotel_reports:
+            report.name = f"{profile.name}/{report.name}"
+        reports.extend(hotel_reports)
+        log_messages.append(f"===== 酒店配置 {profile.name} =====")
+        log_messages.extend(messages)
+    return reports, log_messages, missing
+
+def result_code(reports, missing=()):
+    """根据各阶段结果计算退出码"""
+    if any(report.failed_files for report in reports) or missing:
+        return EXIT_FAILED
+    if any(report.warning_count for report in reports):
+        return EXIT_WARNINGS
+    return EXIT_OK
+
+def watch_inbox(args):
+    """持续监视收件文件夹，按批生成对账单并归档（Ctrl+C退出）"""
+    if args.parallel:
+        from Recon_Common_ByTAX import warm_up_process_pool
+        warm_up_process_pool()
+    
+    command = "all" if args.confirm else "statements"
+    watcher = InboxWatcher(args.inbox, args.settle_time, args.max_wait)
+    print(f"正在监视文件夹: {os.path.abspath(args.inbox)}（每 {args.poll_interval} 秒检查一次）", flush=True)
+    exit_code = EXIT_OK
+    try:
+        while True:
+            batch = watcher.poll(time.monotonic())
+            if batch:
+                print(f"\n{time.strftime('%Y-%m-%d %H:%M:%S')} 发现 {len(batch)} 个新报表", flush=True)
+                reports, log_messages = run_pipeline(command, batch, args)
+                print_reports(reports, log_messages, args)
+                for path, success, _ in reports[0].file_results:
+                    if not success:
+                        watcher.mark_failed(path)
+                exit_code = max(exit_code, result_code(reports))
+                if args.once:
+                    break
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("已停止监视")
+    return exit_code
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="Recon_CLI_ByTAX",
+        description="供应商对账工具集命令行批处理（无图形界面）"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common_arguments(subparser):
+        subparser.add_argument("paths", nargs="+", help="要处理的Excel文件或文件夹")
+        subparser.add_argument("--verbose", action="store_true", help="输出完整处理日志")
+        subparser.add_argument("--log-file", help="把完整处理日志写入该文件")
+        subparser.add_argument("--profile", action="store_true",
+                               help="性能分析：在logs文件夹保存cProfile结果并记录各阶段内存峰值")
+        subparser.add_argument("--hotel", help="使用profiles文件夹中的命名酒店配置（默认使用config.txt）")
+
+    def add_statement_arguments(subparser):
+        subparser.add_argument("--output-dir", default="export", help="对账单输出文件夹（默认 export）")
+        subparser.add_argument("--archive-dir", default="archive", help="已处理报表的归档文件夹（默认 archive）")
+        subparser.add_argument("--parallel", action="store_true", help="使用多进程并行处理")
+        subparser.add_argument("--merge", action="store_true",
+                               help="合并本批报表后再分组，每个供应商每月每个税率只生成一份对账单")
+        subparser.add_argument("--with-confirmation", action="store_true",
+                               help="生成对账单时直接做品类标记并添加确认函sheet（不再单独生成确认函文件）")
+        add_memory_argument(subparser)
+
+    def add_memory_argument(subparser):
+        subparser.add_argument("--memory-budget", type=int, metavar="MB",
+                               help="低内存模式：分块读取报表并暂存到磁盘分区，MB为内存预算（如256）")
+
+    statements_parser = subparsers.add_parser("statements", help="由收货单商品明细报表生成供应商对账单")
+    add_common_arguments(statements_parser)
+    add_statement_arguments(statements_parser)
+
+    confirm_parser = subparsers.add_parser("confirm", help="由供应商对账单生成对账确认函")
+    add_common_arguments(confirm_parser)
+    confirm_parser.add_argument("--edit-in-place", action="store_true", help="直接在原文件上操作")
+    confirm_parser.add_argument("--parallel", action="store_true", help="使用多进程并行处理")
+
+    all_parser = subparsers.add_parser("all", help="生成对账单后再为本次生成的对账单生成确认函")
+    add_common_arguments(all_parser)
+    add_statement_arguments(all_parser)
+
+    watch_parser = subparsers.add_parser("watch", help="监视收件文件夹，自动处理新到达的报表")
+    watch_parser.add_argument("inbox", help="收件文件夹")
+    watch_parser.add_argument("--verbose", action="store_true", help="输出完整处理日志")
+    watch_parser.add_argument("--log-file", help="把完整处理日志追加到该文件")
+    watch_parser.add_argument("--profile", action="store_true",
+                              help="性能分析：在logs文件夹保存cProfile结果并记录各阶段内存峰值")
+    watch_parser.add_argument("--hotel", help="使用profiles文件夹中的命名酒店配置（默认使用config.txt）")
+    add_statement_arguments(watch_parser)
+    watch_parser.add_argument("--confirm", action="store_true", help="同时为新生成的对账单生成确认函")
+    watch_parser.add_argument("--poll-interval", type=float, default=2.0, help="检查间隔秒数（默认2）")
+    watch_parser.add_argument("--settle-time", type=float, default=3.0,
+                              help="文件大小和修改时间保持不变多少秒后认为写入完成（默认3）")
+    watch_parser.add_argument("--max-wait", type=float, default=60.0,
+                              help="一批文件最多等待多少秒后开始处理已写入完成的文件（默认60）")
+    watch_parser.add_argument("--once", action="store_true", help="处理完一批文件后退出")
+
+    hotels_parser = subparsers.add_parser("hotels", help="一次处理各酒店配置收件文件夹中的报表")
+    hotels_parser.add_argument("names", nargs="*", help="要处理的酒店配置名称（默认为profiles文件夹中的全部配置）")
+    hotels_parser.add_argument("--verbose", action="store_true", help="输出完整处理日志")
+    hotels_parser.add_argument("--log-file", help="把完整处理日志写入该文件")
+    hotels_parser.add_argument("--profile", action="store_true",
+                               help="性能分析：在logs文件夹保存cProfile结果并记录各阶段内存峰值")
+    hotels_parser.add_argument("--parallel", action="store_true", help="使用多进程并行处理（各酒店同时处理）")
+    hotels_parser.add_argument("--merge", action="store_true",
+                               help="合并每个酒店本批的报表后再分组，每个供应商每月每个税率只生成一份对账单")
+    hotels_parser.add_argument("--with-confirmation", action="store_true",
+                               help="生成对账单时直接做品类标记并添加确认函sheet（不再单独生成确认函文件）")
+    hotels_parser.add_argument("--confirm", action="store_true", help="同时为新生成的对账单生成确认函")
+    add_memory_argument(hotels_parser)
+
+    # 各酒店的参数由run_hotels设置，其他命令使用--hotel指定的配置
+    parser.set_defaults(hotel=None, hotel_profile=None, files_in_pool=False)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # 与界面版本使用相同的到期检查（不弹出对话框）
+    from Bldbuy_Recon_ByTAX import BldBuyApp, get_application_path
+    if not BldBuyApp().check_expiration():
+        print("错误：Dll注册失败，请联系开发者Cayman 13111986898", file=sys.stderr)
+        return EXIT_FAILED
+
+    if args.command == "hotels":
+        try:
+            reports, log_messages, missing = run_hotels(args)
+        finally:
+            from Recon_Common_ByTAX import shutdown_process_pool
+            shutdown_process_pool()
+        if not reports and not missing:
+            print("各酒店配置的收件文件夹中没有要处理的Excel文件")
+        print_reports(reports, log_messages, args)
+        return result_code(reports, missing)
+
+    if args.hotel:
+        from Recon_Common_ByTAX import get_hotel_profile
+        args.hotel_profile = get_hotel_profile(get_application_path(), args.hotel)
+        if args.hotel_profile is None:
+            print(f"错误：找不到酒店配置: {args.hotel}", file=sys.stderr)
+            return EXIT_FAILED
+
+    if args.command == "watch":
+        try:
+            return watch_inbox(args)
+        finally:
+            from Recon_Common_ByTAX import shutdown_process_pool
+            shutdown_process_pool()
+
+    input_files, missing = collect_excel_files(args.paths)
+    for path in missing:
+        print(f"警告：路径不存在: {path}", file=sys.stderr)
+    if not input_files:
+        print("警告：没有找到要处理的Excel文件", file=sys.stderr)
+        return EXIT_FAILED
+
+    try:
+        reports, log_messages = run_pipeline(args.command, input_files, args)
+    finally:
+        from Recon_Common_ByTAX import shutdown_process_pool
+        shutdown_process_pool()
+
+    print_reports(reports, log_messages, args)
+    return result_code(reports, missing)
+
+if __name__ == "__main__":
+    # 打包后的程序启动工作进程时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,934 @@
+"""供应商对账工具集的公共组件"""
+import os
+import re
+import json
+import logging
+import hashlib
+import time
+import queue
+import cProfile
+import threading
+import tracemalloc
+import pickle
+import shutil
+import tempfile
+import importlib.util
+from itertools import chain, islice
+from collections import OrderedDict
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+# 全局的工作进程池
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_worker_count():
+    """获取工作进程数量（与CPU核心数一致）"""
+    return max(1, os.cpu_count() or 1)
+
+def _init_worker():
+    """工作进程初始化：预先导入pandas和openpyxl，避免第一个任务等待导入"""
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+
+def _worker_ready():
+    """预热任务，返回工作进程的PID"""
+    return os.getpid()
+
+def get_process_pool():
+    """获取全局工作进程池，进程池损坏时重新创建"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None or getattr(_process_pool, '_broken', False):
+            # 统一使用spawn方式启动，避免在带有Tk线程的进程中fork
+            _process_pool = ProcessPoolExecutor(
+                max_workers=get_worker_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _process_pool
+
+def warm_up_process_pool():
+    """预先启动所有工作进程（不阻塞调用线程）"""
+    pool = get_process_pool()
+    return [pool.submit(_worker_ready) for _ in range(get_worker_count())]
+
+def shutdown_process_pool():
+    """关闭全局工作进程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+class UIEventChannel:
+    """工作线程与Tk界面之间的事件通道
+    
+    工作线程只把日志、进度和界面调用放入队列，不直接操作Tk；Tk主线程用after()定时
+    批量取出并处理。进度只保留最新值，每个刷新周期最多更新一次。
+    """
+
+    # 每个刷新周期最多处理的日志条数，避免大量日志时界面长时间没有响应
+    MAX_LOGS_PER_FRAME = 500
+
+    def __init__(self, root, on_logs, on_progress, interval_ms=50):
+        """on_logs接收[(消息, 标签)]列表，on_progress接收最新的进度值，均在Tk主线程中调用"""
+        self.root = root
+        self.on_logs = on_logs
+        self.on_progress = on_progress
+        self.interval_ms = interval_ms
+        self._events = queue.SimpleQueue()
+        self._progress = None
+        self._progress_lock = threading.Lock()
+        self._main_thread = threading.current_thread()
+        self.root.after(self.interval_ms, self._drain)
+
+    def post_log(self, message, tag=None):
+        self._events.put(("log", (message, tag)))
+
+    def post_progress(self, value):
+        """记录最新进度，同一刷新周期内的多次更新合并为一次"""
+        with self._progress_lock:
+            self._progress = value
+
+    def post_call(self, func, *args, **kwargs):
+        """在Tk主线程中执行func（不等待结果）"""
+        self._events.put(("call", (func, args, kwargs, None)))
+
+    def invoke(self, func, *args, **kwargs):
+        """在Tk主线程中执行func并等待返回结果（例如弹出对话框询问用户）"""
+        if threading.current_thread() is self._main_thread:
+            return func(*args, **kwargs)
+        done = threading.Event()
+        result = {}
+        self._events.put(("call", (func, args, kwargs, (done, result))))
+        done.wait()
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+    def _drain(self):
+        try:
+            logs = []
+            while True:
+                try:
+                    kind, payload = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "log":
+                    logs.append(payload)
+                    if len(logs) >= self.MAX_LOGS_PER_FRAME:
+                        break
+                    continue
+                # 先输出此前的日志，保持日志和界面调用的先后顺序
+                if logs:
+                    self.on_logs(logs)
+                    logs = []
+                self._run_call(*payload)
+            if logs:
+                self.on_logs(logs)
+            
+            with self._progress_lock:
+                progress, self._progress = self._progress, None
+            if progress is not None:
+                self.on_progress(progress)
+        finally:
+            try:
+                self.root.after(self.interval_ms, self._drain)
+            except Exception:
+                pass  # 窗口已关闭
+
+    @staticmethod
+    def _run_call(func, args, kwargs, waiter):
+        try:
+            value = func(*args, **kwargs)
+        except Exception as e:
+            if waiter is None:
+                # 不等待结果的调用没有调用方接收异常，记录到日志
+                logging.exception(f"界面调用 {getattr(func, '__name__', func)} 出错")
+                return
+            waiter[1]["error"] = e
+        else:
+            if waiter is not None:
+                waiter[1]["value"] = value
+        if waiter is not None:
+            waiter[0].set()
+
+class StageRecorder:
+    """记录处理各阶段的耗时和内存峰值
+    
+    每个阶段记录为一个字典：stage、seconds、peak_mb以及file、group等标签。
+    内存峰值只在tracemalloc开启时记录（性能分析模式），否则为None。
+    阶段可以嵌套（例如read包含header_detection），汇总时各阶段分别统计。
+    """
+
+    def __init__(self):
+        self.spans = []
+        # 当前的公共标签（例如正在处理的文件），记入之后的每个阶段
+        self.labels = {}
+        self._peaks = []
+
+    @contextmanager
+    def span(self, stage, **labels):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # 嵌套阶段开始前，把目前的峰值记到外层阶段，再重新统计
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = self._peaks.pop()
+            peak_mb = None
+            if tracing and tracemalloc.is_tracing():
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                peak_mb = round(peak / (1024 * 1024), 2)
+            record = {"stage": stage, "seconds": round(seconds, 6), "peak_mb": peak_mb}
+            record.update(self.labels)
+            record.update(labels)
+            self.spans.append(record)
+
+    def extend(self, spans, **labels):
+        """合并工作进程返回的阶段记录，labels作为缺省标签"""
+        for span in spans:
+            record = dict(labels)
+            record.update(span)
+            self.spans.append(record)
+
+    def summary(self):
+        """按阶段汇总：次数、总耗时、最长耗时和内存峰值"""
+        stages = {}
+        for span in self.spans:
+            stats = stages.setdefault(span["stage"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_mb": None})
+            stats["count"] += 1
+            stats["seconds"] += span["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], span["seconds"])
+            if span.get("peak_mb") is not None:
+                stats["peak_mb"] = max(stats["peak_mb"] or 0, span["peak_mb"])
+        return stages
+
+    def summary_lines(self):
+        lines = []
+        for stage, stats in self.summary().items():
+            line = f"{stage}: {stats['count']} 次，共 {stats['seconds']:.2f} 秒，最长 {stats['max_seconds']:.2f} 秒"
+            if stats["peak_mb"] is not None:
+                line += f"，内存峰值 {stats['peak_mb']:.1f} MB"
+            lines.append(line)
+        return lines
+
+    def export_jsonl(self, path):
+        """每个阶段一行JSON"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in self.spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+def report_stages(stages, log_folder, name, log_message, profile_path=None):
+    """在日志中输出各阶段耗时汇总，保存JSON lines明细，并把汇总写入程序日志（error.log）"""
+    if not stages.spans:
+        return
+    log_message("\n各阶段耗时汇总：")
+    for line in stages.summary_lines():
+        log_message(line)
+    logging.getLogger(__name__).info(json.dumps({"run": name, "stages": stages.summary()}, ensure_ascii=False))
+    
+    spans_path = os.path.join(log_folder, f"stages_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    try:
+        stages.export_jsonl(spans_path)
+        log_message(f"阶段耗时明细已保存到: {spans_path}")
+    except OSError as e:
+        log_message(f"警告：保存阶段耗时明细失败: {str(e)}")
+    if profile_path:
+        log_message(f"性能分析结果已保存到: {profile_path}")
+
+class RunProfiler:
+    """可选的性能分析：运行期间开启cProfile（只分析当前线程）和tracemalloc，结束时保存.prof文件
+    
+    保存的文件可用 python -m pstats 或 snakeviz 查看。
+    """
+
+    def __init__(self, enabled, output_folder, name):
+        self.enabled = enabled
+        self.output_folder = output_folder
+        self.name = name
+        self.path = None
+        self._profile = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profile is None:
+            return False
+        self._profile.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.path = os.path.join(self.output_folder, f"profile_{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        self._profile.dump_stats(self.path)
+        return False
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_frame(df, *extra):
+    """计算DataFrame各行内容（连同列名和附加信息）的SHA-256"""
+    import pandas as pd
+    
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, df.columns)), extra], ensure_ascii=False, default=str).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def dedupe_by_content(file_paths):
+    """按文件内容去重（保持顺序），返回(不重复的文件, [(重复的文件, 内容相同的文件)])"""
+    unique_files = []
+    duplicates = []
+    seen = {}
+    for file_path in dict.fromkeys(file_paths):
+        try:
+            content_hash = file_sha256(file_path)
+        except OSError:
+            # 无法读取的文件交给后续处理报告错误
+            unique_files.append(file_path)
+            continue
+        if content_hash in seen:
+            duplicates.append((file_path, seen[content_hash]))
+        else:
+            seen[content_hash] = file_path
+            unique_files.append(file_path)
+    return unique_files, duplicates
+
+class RunManifest:
+    """处理记录，保存在输出文件夹旁边的run_manifest.json中
+    
+    - files：已处理的输入文件，按内容哈希记录文件名、配置哈希和生成的各分组
+    - groups：每个(年月, 供应商, 税率)分组的行内容哈希、对账单路径（相对输出文件夹）和合计金额
+    """
+
+    FILE_NAME = "run_manifest.json"
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(os.path.dirname(os.path.abspath(output_folder)), self.FILE_NAME)
+        self.files = {}
+        self.groups = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.groups = data.get("groups", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def group_key(year_month, supplier_account, tax_rate):
+        return f"{year_month}|{supplier_account}|{tax_rate}"
+
+    def output_exists(self, entry):
+        return os.path.exists(os.path.join(self.output_folder, entry["output"]))
+
+    def is_group_current(self, key, group_hash):
+        """分组内容没有变化且对账单仍然存在"""
+        entry = self.groups.get(key)
+        return entry is not None and entry.get("hash") == group_hash and self.output_exists(entry)
+
+    def find_processed_file(self, content_hash, settings_hash):
+        """内容相同的文件已处理过且生成的对账单都未被替换时，返回当时的记录"""
+        entry = self.files.get(content_hash)
+        if entry is None or entry.get("settings") != settings_hash:
+            return None
+        for key, group_hash in entry.get("groups", {}).items():
+            if not self.is_group_current(key, group_hash):
+                return None
+        return entry
+
+    def record_file(self, content_hash, file_name, settings_hash, group_records):
+        self.files[content_hash] = {
+            "name": file_name,
+            "settings": settings_hash,
+            "processed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "groups": {key: entry["hash"] for key, entry in group_records},
+        }
+        self.record_groups(group_records)
+
+    def record_groups(self, group_records):
+        for key, entry in group_records:
+            self.groups[key] = entry
+
+    def save(self):
+        """写入临时文件后替换，避免中途退出时损坏记录"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.files, "groups": self.groups}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+# 酒店配置文件中各行的键和对应的HotelProfile属性
+HOTEL_PROFILE_FIELDS = {
+    "B2": "hotel_name",               # 确认函中的酒店全称
+    "D2": "hotel_address",            # 确认函中的酒店地址
+    "E2": "contact_person",           # 确认函中的财务部联系人
+    "B32": "email_address",           # 确认函回传邮箱
+    "hotelname": "statement_hotel_name",  # 对账单标题中的酒店名称
+    "Sheet_tittle": "sheet_title",    # 对账单标题
+    "inbox": "inbox",                 # 多酒店批处理时的收件文件夹
+    "output_dir": "output_dir",       # 多酒店批处理时的对账单输出文件夹
+    "archive_dir": "archive_dir",     # 多酒店批处理时的归档文件夹
+}
+# 命名酒店配置放在程序目录的profiles文件夹中，每个酒店一个与config.txt格式相同的<名称>.txt
+HOTEL_PROFILES_FOLDER = "profiles"
+# 界面中表示默认配置（config.txt）的选项
+DEFAULT_HOTEL_PROFILE_LABEL = "默认（config.txt）"
+
+class HotelProfile:
+    """一个酒店的配置，由config.txt或profiles文件夹中的<名称>.txt解析而来
+    
+    name为空表示默认配置（config.txt）；命名配置生成的文件名会带上配置名称，
+    收件、输出和归档文件夹没有配置时为当前目录下的<名称>/inbox、<名称>/export和<名称>/archive。
+    content_hash为配置文件内容的SHA-256，配置变化后已处理过的报表会重新生成。
+    """
+
+    def __init__(self, name, path, values, content_hash):
+        self.name = name
+        self.path = path
+        self.content_hash = content_hash
+        for key, attribute in HOTEL_PROFILE_FIELDS.items():
+            setattr(self, attribute, values.get(key, ""))
+        # 员餐部门，没有配置时为None（使用默认值）
+        departments = [d.strip() for d in re.split(r"[,，、]", values.get("employee_departments", "")) if d.strip()]
+        self.employee_departments = departments or None
+        if name:
+            self.inbox = self.inbox or os.path.join(name, "inbox")
+            self.output_dir = self.output_dir or os.path.join(name, "export")
+            self.archive_dir = self.archive_dir or os.path.join(name, "archive")
+
+    @classmethod
+    def from_file(cls, path, name=""):
+        """解析配置文件，每行为 键:值"""
+        with open(path, 'rb') as f:
+            content = f.read()
+        values = {}
+        for line in content.decode('utf-8').splitlines():
+            key, sep, value = line.strip().partition(':')
+            if sep:
+                values[key.strip()] = value.strip()
+        return cls(name, path, values, hashlib.sha256(content).hexdigest())
+
+    @property
+    def label(self):
+        """日志和界面中显示的配置名称"""
+        return self.name or os.path.basename(self.path)
+
+    def tag_file_name(self, file_name):
+        """在文件名（不含扩展名）后加上配置名称；默认配置或文件名已带有配置名称时不变"""
+        base, ext = os.path.splitext(file_name)
+        if not self.name or base.endswith(f"_{self.name}"):
+            return file_name
+        return f"{base}_{self.name}{ext}"
+
+# 已解析的酒店配置：路径 -> (文件大小, 修改时间, HotelProfile)
+_hotel_profiles = {}
+_hotel_profiles_lock = threading.Lock()
+
+def load_hotel_profile(path, name=""):
+    """读取酒店配置，文件不存在时返回None；文件没有变化时直接使用已解析的结果"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    with _hotel_profiles_lock:
+        cached = _hotel_profiles.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns) and cached[2].name == name:
+            return cached[2]
+    profile = HotelProfile.from_file(path, name)
+    with _hotel_profiles_lock:
+        _hotel_profiles[path] = (stat.st_size, stat.st_mtime_ns, profile)
+    return profile
+
+def list_hotel_profiles(base_path):
+    """返回profiles文件夹中命名酒店配置的名称（按名称排序）"""
+    folder = os.path.join(base_path, HOTEL_PROFILES_FOLDER)
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.splitext(n)[0] for n in names
+                  if n.lower().endswith('.txt') and os.path.isfile(os.path.join(folder, n)))
+
+def hotel_profile_choices(base_path):
+    """界面中可选择的酒店配置：默认配置和各命名配置"""
+    return [DEFAULT_HOTEL_PROFILE_LABEL] + list_hotel_profiles(base_path)
+
+def get_hotel_profile(base_path, name=None):
+    """按名称读取酒店配置，名称为空或为默认选项时读取程序目录的config.txt；文件不存在时返回None"""
+    if not name or name == DEFAULT_HOTEL_PROFILE_LABEL:
+        return load_hotel_profile(os.path.join(base_path, "config.txt"))
+    return load_hotel_profile(os.path.join(base_path, HOTEL_PROFILES_FOLDER, f"{name}.txt"), name)
+
+# Excel读取引擎：安装了python-calamine时使用，否则使用openpyxl只读模式流式读取；.xls文件使用xlrd
+READER_ENGINES = ("calamine", "openpyxl")
+
+def get_reader_engine():
+    """返回默认的读取引擎"""
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    return "openpyxl"
+
+def normalize_cell(value):
+    """与pandas读取Excel时一致：整数值的浮点数转为int，空字符串视为空值"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value == '':
+        return None
+    return value
+
+def _iter_xls_rows(file_path):
+    import xlrd
+    book = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for row_idx in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(row_idx):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    row.append(xlrd.xldate.xldate_as_datetime(cell.value, book.datemode))
+                elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                    row.append(bool(cell.value))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    row.append(None)
+                else:
+                    row.append(cell.value)
+            yield tuple(row)
+    finally:
+        book.release_resources()
+
+def _iter_openpyxl_rows(file_path):
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def _to_datetime(value):
+    """calamine对只有日期的单元格返回date，openpyxl返回datetime，统一为datetime"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+def _iter_calamine_rows(file_path):
+    from python_calamine import CalamineWorkbook
+    wb = CalamineWorkbook.from_path(file_path)
+    # 保留表格前面的空行和空列，行列位置与openpyxl一致
+    for row in wb.get_sheet_by_index(0).to_python(skip_empty_area=False):
+        yield tuple(_to_datetime(value) for value in row)
+
+def iter_excel_rows(file_path, engine=None):
+    """逐行读取Excel第一个工作表，每次返回一行单元格原始值的元组（未经normalize_cell处理）"""
+    if file_path.lower().endswith('.xls'):
+        return _iter_xls_rows(file_path)
+    if (engine or get_reader_engine()) == "calamine":
+        return _iter_calamine_rows(file_path)
+    return _iter_openpyxl_rows(file_path)
+
+def make_unique_columns(header_values):
+    """按pandas的规则生成列名：空表头为Unnamed: n，重复表头追加.1、.2"""
+    columns = []
+    seen = {}
+    for i, value in enumerate(header_values):
+        value = normalize_cell(value)
+        name = f"Unnamed: {i}" if value is None else value
+        if name in seen:
+            seen[name] += 1
+            while f"{name}.{seen[name]}" in seen:
+                seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        columns.append(name)
+    return columns
+
+def select_columns(header_values, usecols=None):
+    """确定要取出的列，返回(表中的全部列名, 取出的列名, 取出的列在行中的位置)
+    
+    usecols为要取出的列名列表，None表示全部列；表中没有的列不在取出的列名中。
+    """
+    columns = make_unique_columns(header_values)
+    if usecols is None:
+        return columns, columns, list(range(len(columns)))
+    position = {}
+    for i, name in enumerate(columns):
+        position.setdefault(name, i)
+    names = [name for name in usecols if name in position]
+    return columns, names, [position[name] for name in names]
+
+def select_cells(rows, width, indices):
+    """逐行取出indices位置的单元格值（经normalize_cell处理），每行返回一个列表"""
+    for row in rows:
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        yield [normalize_cell(row[i]) for i in indices]
+
+def parse_cells(names, cells, usecols=None, dtype=None):
+    """用取出的单元格值生成DataFrame，与pd.read_excel相同地推断各列类型
+    
+    dtype为{列名: 类型}时按指定类型转换这些列（分块读取时用整表推断出的类型）。
+    usecols不为None时按usecols的顺序排列各列，表中没有的列为空值。
+    """
+    import pandas as pd
+    from pandas.io.parsers import TextParser
+    
+    data = [names] + cells
+    # 与pd.read_excel相同，去掉末尾的空行
+    while len(data) > 1 and all(value is None for value in data[-1]):
+        data.pop()
+    
+    # 与pd.read_excel相同，用TextParser推断各列类型（数字文本转为数字等）
+    if names:
+        with TextParser(data, header=0, dtype=dtype) as parser:
+            df = parser.read()
+    else:
+        df = pd.DataFrame()
+    if usecols is not None and len(names) < len(usecols):
+        df = df.reindex(columns=list(usecols))
+    return df
+
+def frame_from_rows(header_values, rows, usecols=None):
+    """用表头和数据行生成DataFrame
+    
+    usecols为要保留的列名（按usecols的顺序），只有这些列的单元格会被取出和转换，
+    表中没有的列为空值；usecols为None时保留全部列。usecols也可以是函数，
+    参数为表中的全部列名，返回要保留的列名。
+    表中的全部列名保存在返回结果的attrs["source_columns"]中。
+    """
+    if callable(usecols):
+        usecols = usecols(make_unique_columns(header_values))
+    columns, names, indices = select_columns(header_values, usecols)
+    df = parse_cells(names, list(select_cells(rows, len(columns), indices)), usecols)
+    df.attrs["source_columns"] = columns
+    return df
+
+def table_from_rows(rows, header_row, usecols=None):
+    """由逐行的单元格原始值（如已打开工作表的iter_rows(values_only=True)）构造DataFrame，
+    header_row（从0开始）为表头行，只保留usecols中的列"""
+    rows = iter(rows)
+    head = list(islice(rows, header_row + 1))
+    if len(head) <= header_row:
+        return frame_from_rows((), (), usecols)
+    return frame_from_rows(head[header_row], rows, usecols)
+
+def read_excel_table(file_path, header_row, usecols=None, engine=None):
+    """读取第一个工作表，header_row（从0开始）为表头行，只保留usecols中的列"""
+    rows = iter_excel_rows(file_path, engine)
+    try:
+        return table_from_rows(rows, header_row, usecols)
+    finally:
+        rows.close()
+
+class ColumnTypeTracker:
+    """分块读取时推断各列在整表一次读取时的类型
+    
+    pd.read_excel（TextParser）按整列的值推断类型：某一块全是整数而另一块有空值时，
+    整列是小数；某一块的数字文本在另一块遇到普通文本时整列保持为文本。
+    每块只记录各列出现过的值的种类（每种一个代表值），最后由全部代表值推断出的类型
+    与整表一次读取时相同，parse按这个类型转换各块数据。
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self._samples = {name: {} for name in names}
+        self._dtypes = None
+
+    def update(self, cells, df):
+        """记录一块数据：cells为select_cells取出的各行，df为parse_cells对这些行的转换结果"""
+        self._dtypes = None
+        for position, name in enumerate(self.names):
+            samples = self._samples[name]
+            is_null = df[name].isna().to_numpy()
+            if is_null.any():
+                samples.setdefault("null", None)
+            if is_null.all():
+                continue
+            values = [row[position] for row in cells]
+            # 每种类型的值保留一个代表值
+            by_kind = dict(zip(map(type, values), values))
+            by_kind.pop(type(None), None)
+            text = by_kind.pop(str, None)
+            for kind, value in by_kind.items():
+                samples.setdefault(kind, value)
+            if text is not None:
+                sample = self.text_sample([value for value in values if type(value) is str],
+                                          df[name] if not by_kind else None)
+                if sample is not None:
+                    samples.setdefault((str, sample), sample)
+
+    @staticmethod
+    def text_sample(texts, parsed=None):
+        """文本值的代表值：按整体能否转为数字分类，全是空值文本（如NA）时返回None
+        
+        parsed为这些文本（连同空单元格）已有的转换结果，没有时重新转换。
+        """
+        import pandas as pd
+        
+        if parsed is None:
+            parsed = parse_cells(["v"], [[value] for value in texts])["v"]
+        if not parsed.notna().any():
+            return None
+        kind = parsed.dtype.kind
+        if kind in "iu":
+            return "1"
+        if kind == "f":
+            return "0.5"
+        # 不能转为数字的文本中，取第一个单独转换时也不是数字（或空值）的
+        is_number = pd.to_numeric(pd.Series(texts, dtype=object), errors="coerce").notna().to_numpy()
+        for value, number in zip(texts, is_number):
+            if not number and parse_cells(["v"], [[value]])["v"].dtype.kind not in "iuf":
+                return value
+        return "x"
+
+    def dtypes(self):
+        """各列在整表一次读取时的类型，{列名: 类型}；没有数据的列不在结果中"""
+        if self._dtypes is None:
+            self._dtypes = {}
+            for name, samples in self._samples.items():
+                if samples:
+                    # 加上一列固定的值，避免只有空值的代表行被当作空行去掉
+                    df = parse_cells(["v", "_"], [[value, 0] for value in samples.values()])
+                    self._dtypes[name] = df["v"].dtype
+        return self._dtypes
+
+    def parse(self, cells, usecols=None, names=None):
+        """用parse_cells转换一块数据，各列类型与整表一次读取时相同
+        
+        names为cells中各列的列名，默认为全部列。
+        """
+        if names is None:
+            names = self.names
+        df = parse_cells(names, cells)
+        text_dtypes = {}
+        dtypes = self.dtypes()
+        for name in names:
+            dtype = dtypes.get(name)
+            if dtype is None or df[name].dtype == dtype:
+                continue
+            if dtype.kind in "biufM":
+                # 本块的整数列在整表中是小数列、本块全为空的日期列等，直接转换
+                df[name] = df[name].astype(dtype)
+            else:
+                # 整表中是文本的列，本块的数字文本不能转为数字，按文本重新转换
+                text_dtypes[name] = dtype
+        if text_dtypes:
+            text_df = parse_cells(names, cells, dtype=text_dtypes)
+            for name in text_dtypes:
+                df[name] = text_df[name]
+        if usecols is not None and len(names) < len(usecols):
+            df = df.reindex(columns=list(usecols))
+        return df
+
+class SpillPartitions:
+    """按键分区暂存数据行的磁盘存储（低内存模式使用）
+    
+    追加的行先放在内存缓冲区中，缓冲的行数达到max_buffered_rows时把各分区的行
+    分别追加写入各自的临时文件（每次写入一个pickle块），读取时按写入顺序拼接。
+    临时文件放在folder（默认为系统临时文件夹）中新建的子文件夹里，关闭时全部删除。
+    """
+
+    def __init__(self, max_buffered_rows, folder=None):
+        self.folder = tempfile.mkdtemp(prefix="spill_", dir=folder)
+        self.max_buffered_rows = max_buffered_rows
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._paths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def append(self, key, rows):
+        """把一批行追加到key分区"""
+        self._buffers.setdefault(key, []).extend(rows)
+        self._buffered_rows += len(rows)
+        if self._buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区中的行写入各分区的临时文件"""
+        for key, rows in self._buffers.items():
+            path = self._paths.get(key)
+            if path is None:
+                path = self._paths[key] = os.path.join(self.folder, f"{len(self._paths)}.pkl")
+            with open(path, 'ab') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._buffers = {}
+        self._buffered_rows = 0
+
+    def keys(self):
+        """全部分区的键（按第一次追加的顺序）"""
+        return list(dict.fromkeys(chain(self._paths, self._buffers)))
+
+    def read(self, key):
+        """按追加顺序返回key分区的全部行"""
+        rows = []
+        path = self._paths.get(key)
+        if path is not None:
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        rows.extend(pickle.load(f))
+                    except EOFError:
+                        break
+        rows.extend(self._buffers.get(key, ()))
+        return rows
+
+    def close(self):
+        """删除全部临时文件"""
+        self._buffers = {}
+        self._paths = {}
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+# 解析结果缓存的默认大小上限和内存中保留的报表数量
+DEFAULT_FRAME_CACHE_BYTES = 512 * 1024 * 1024
+DEFAULT_FRAME_CACHE_ITEMS = 8
+# 解析结果的格式变化时增加版本号，使旧的缓存失效
+FRAME_CACHE_VERSION = 1
+
+class FrameCache:
+    """已解析报表的缓存
+    
+    以解析方式（kind）和文件内容的SHA-256为键：磁盘上每个解析结果保存为一个pickle文件，
+    总大小超过上限时删除最久未使用的；内存中保留最近使用的几个DataFrame，本次运行中重新处理时直接使用。
+    文件路径、大小和修改时间没有变化时不重新计算内容哈希。
+    folder为None时只使用内存缓存，memory_items为0时不使用内存缓存。
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_FRAME_CACHE_BYTES, memory_items=DEFAULT_FRAME_CACHE_ITEMS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._frames = OrderedDict()
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def content_hash(self, file_path):
+        """文件内容的SHA-256，按(路径, 大小, 修改时间)记住已计算的结果"""
+        stat = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        content_hash = self._hashes.get(stat_key)
+        if content_hash is None:
+            content_hash = file_sha256(file_path)
+            self._hashes[stat_key] = content_hash
+        return content_hash
+
+    def _entry_path(self, key):
+        return os.path.join(self.folder, f"{key}.pkl")
+
+    def get(self, file_path, kind):
+        """返回缓存的解析结果（副本），没有时返回None"""
+        try:
+            key = f"{kind}-{self.content_hash(file_path)}"
+        except OSError:
+            return None
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self._frames.move_to_end(key)
+                return df.copy()
+        if self.folder is None:
+            return None
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                df = pickle.load(f)
+            # 修改时间作为最近使用时间，清理时先删除最久未使用的
+            os.utime(entry_path)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        self._remember(key, df)
+        return df.copy()
+
+    def put(self, file_path, kind, df):
+        """保存解析结果；缓存写入失败不影响处理"""
+        try:
+            key = f"{kind}-{self.content_hash(file_path)}"
+        except OSError:
+            return
+        self._remember(key, df.copy())
+        if self.folder is None:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            entry_path = self._entry_path(key)
+            # 多个工作进程可能同时写入，先写到各自的临时文件再替换
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+            self.evict()
+        except OSError:
+            pass
+
+    def _remember(self, key, df):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.memory_items:
+                self._frames.popitem(last=False)
+
+    def evict(self):
+        """磁盘缓存超过大小上限时，删除最久未使用的解析结果"""
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+                total -= size
+            except OSError:
+                pass
+
+_frame_cache = None
+
+def get_frame_cache(folder):
+    """获取全局的解析结果缓存（两个工具共用，第一次调用时确定缓存文件夹）"""
+    global _frame_cache
+    if _frame_cache is None:
+        _frame_cache = FrameCache(folder)
+    return _frame_cache
+
+def frame_cache_kind(name, *settings):
+    """解析方式的标识：名称加上影响解析结果的设置（列名等）的哈希"""
+    digest = hashlib.md5(json.dumps([FRAME_CACHE_VERSION, settings], ensure_ascii=False, default=str).encode('utf-8'))
+    return f"{name}-{digest.hexdigest()[:12]}"
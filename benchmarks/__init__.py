@@ -0,0 +1,5 @@
+"""供应商对账工具集的性能基准测试
+
+- report_generator：生成模拟的收货单商品明细报表
+- run_benchmarks：对各处理阶段计时，结果保存为JSON，便于在同一台机器上比较
+"""
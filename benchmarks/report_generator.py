@@ -0,0 +1,114 @@
+"""生成模拟的收货单商品明细报表（与Bldbuy导出的版式一致）
+
+    python -m benchmarks.report_generator 报表.xlsx --rows 30000 --suppliers 200
+"""
+import argparse
+import random
+from datetime import datetime
+
+from openpyxl import Workbook
+
+# 报表列：对账单需要的13列、N-R列（处理时丢弃）和退货相关列
+REPORT_COLUMNS = [
+    "收货日期", "订单号", "商品名称", "实收数量", "基本单位",
+    "单价(结算)", "小计金额(结算)", "税额(结算)", "小计价税(结算)", "部门",
+    "税率", "供应商/备用金报销账户", "商品分类",
+    "备注", "订单状态", "制单人", "审核人",
+    "退货", "合计退货数量", "退货合计金额(结算)", "退货合计税额(结算)", "退货合计价税(结算)",
+]
+
+PRODUCT_CATEGORIES = [
+    "鱼虾蟹干及瑶柱干", "海参鲍鱼鱼翅干及肚干", "其他水产干货", "燕窝", "活鲜",
+    "白酒", "葡萄酒", "碳酸饮料", "果汁饮料", "水", "蔬菜", "肉类", "调料", None,
+]
+DEPARTMENTS = ["员工餐厅", "员工食堂", "中餐厅", "西餐厅", "宴会厨房", "大堂吧"]
+UNITS = ["斤", "箱", "瓶", "件", "袋"]
+
+# 默认税率组合：税率 -> 权重（报表中同时存在小数和百分比两种写法）
+DEFAULT_TAX_MIX = {0.13: 5, 0.09: 2, 0.01: 1, 0: 1, "13%": 1}
+
+def parse_tax_mix(text):
+    """解析 "0.13:5,0.09:2,13%:1" 形式的税率组合"""
+    mix = {}
+    for part in text.split(","):
+        rate, _, weight = part.partition(":")
+        rate = rate.strip()
+        mix[rate if rate.endswith("%") else float(rate)] = float(weight or 1)
+    return mix
+
+def tax_rate_value(rate):
+    """税率的小数值"""
+    if isinstance(rate, str):
+        return float(rate.rstrip("%")) / 100
+    return float(rate)
+
+def generate_report(path, rows=10000, suppliers=100, zipf_exponent=1.1, return_ratio=0.05,
+                    tax_mix=None, junk_rows=3, year=2025, month=6, products=500, seed=1):
+    """生成报表文件
+    
+    供应商的出现次数服从Zipf分布（少数大供应商占大部分行），return_ratio为退货行比例，
+    junk_rows为表头上方的报表条件行数。返回生成的数据行数。
+    """
+    rng = random.Random(seed)
+    tax_mix = tax_mix or DEFAULT_TAX_MIX
+    tax_rates, tax_weights = list(tax_mix), list(tax_mix.values())
+    supplier_names = [f"供应商{index:04d}" for index in range(1, suppliers + 1)]
+    supplier_weights = [1 / (rank ** zipf_exponent) for rank in range(1, suppliers + 1)]
+    # 每个商品固定分类和单位
+    product_info = [(f"商品{index:05d}", rng.choice(PRODUCT_CATEGORIES), rng.choice(UNITS))
+                    for index in range(1, products + 1)]
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("收货单商品明细")
+    for index in range(junk_rows):
+        if index == 1:
+            ws.append([f"报表条件{index}", f"{year}-{month:02d}-01 ~ {year}-{month:02d}-28"])
+        else:
+            ws.append([f"报表条件{index}", "全部"])
+    ws.append(REPORT_COLUMNS)
+    
+    suppliers_by_row = rng.choices(supplier_names, weights=supplier_weights, k=rows)
+    rates_by_row = rng.choices(tax_rates, weights=tax_weights, k=rows)
+    for index in range(rows):
+        product, category, unit = rng.choice(product_info)
+        rate = rates_by_row[index]
+        rate_value = tax_rate_value(rate)
+        quantity = rng.randint(1, 50)
+        price = round(rng.uniform(1, 300), 2)
+        amount = round(quantity * price, 2)
+        tax = round(amount * rate_value, 2)
+        received = datetime(year, month, rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59))
+        row = [received, f"PO{index:07d}", product, quantity, unit, price, amount, tax, round(amount + tax, 2),
+               rng.choice(DEPARTMENTS), rate, suppliers_by_row[index], category,
+               "", "已完成", "制单员", "审核员"]
+        if rng.random() < return_ratio:
+            returned = rng.randint(1, quantity)
+            returned_amount = round(returned * price, 2)
+            returned_tax = round(returned_amount * rate_value, 2)
+            row += ["是", returned, returned_amount, returned_tax, round(returned_amount + returned_tax, 2)]
+        else:
+            row += ["否", None, None, None, None]
+        ws.append(row)
+    wb.save(path)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成模拟的收货单商品明细报表")
+    parser.add_argument("path", help="输出的.xlsx文件")
+    parser.add_argument("--rows", type=int, default=10000, help="数据行数")
+    parser.add_argument("--suppliers", type=int, default=100, help="供应商数量")
+    parser.add_argument("--zipf", type=float, default=1.1, help="供应商分布的Zipf指数")
+    parser.add_argument("--return-ratio", type=float, default=0.05, help="退货行比例")
+    parser.add_argument("--tax-mix", default=None, help='税率组合，例如 "0.13:5,0.09:2,0.01:1,0:1,13%%:1"')
+    parser.add_argument("--junk-rows", type=int, default=3, help="表头上方的报表条件行数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args(argv)
+    
+    generate_report(args.path, rows=args.rows, suppliers=args.suppliers, zipf_exponent=args.zipf,
+                    return_ratio=args.return_ratio,
+                    tax_mix=parse_tax_mix(args.tax_mix) if args.tax_mix else None,
+                    junk_rows=args.junk_rows, seed=args.seed)
+    print(f"已生成 {args.rows} 行数据: {args.path}")
+
+if __name__ == "__main__":
+    main()
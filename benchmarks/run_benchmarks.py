@@ -0,0 +1,244 @@
+"""对各处理阶段计时，结果保存为JSON，便于比较同一台机器上不同版本的处理速度
+
+    python -m benchmarks.run_benchmarks --rows 30000 --repeat 3
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/benchmark_20250701_101500.json
+
+计时的阶段：find_header_row、preprocess_excel（不使用和使用解析结果缓存）、各读取引擎的read_excel_table、分组（split_groups）、
+process_group_data、ProductClassificationApp.process_file 和 num_to_chinese。
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.report_generator import generate_report
+
+DEFAULT_RESULTS_FOLDER = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# 对账单标题行（与config.txt生成的格式一致）
+BENCHMARK_HEADER_ROWS = [
+    [''] * 13,
+    [''] * 5 + ["基准测试酒店"] + [''] * 7,
+    [''] * 5 + ["供货明细表"] + [''] * 7,
+    [''] * 13,
+    [''] * 13,
+]
+
+def time_call(func, repeat, setup=None):
+    """运行repeat次并返回每次的耗时；setup在每次运行前调用且不计时，返回值作为func的参数"""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(timings, items=None, unit=None):
+    """汇总耗时，给出处理量时同时计算每秒处理量（按最快的一次）"""
+    result = {
+        "runs": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+    }
+    if items is not None:
+        result["items"] = items
+        result["unit"] = unit
+        result["per_second"] = items / result["min"] if result["min"] > 0 else None
+    return result
+
+def environment_info():
+    """记录机器和依赖库版本，只有同一环境下的结果才有可比性"""
+    import numpy
+    import openpyxl
+    import pandas
+    
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "openpyxl": openpyxl.__version__,
+        "git_commit": commit,
+    }
+
+def run_benchmarks(work_folder, rows, suppliers, return_ratio, repeat, seed):
+    """生成报表并对各阶段计时，返回{阶段名: 结果}"""
+    import Bldbuy_Recon_ByTAX as recon
+    import Product_Classification_Tool_ByTAX as classification
+    import Recon_Common_ByTAX as common
+    
+    # 表头版式缓存和品类索引都放在临时目录，不影响程序目录中的文件
+    recon._header_layout_cache = recon.HeaderLayoutCache(os.path.join(work_folder, "header_layouts.json"))
+    # 除preprocess_excel_cached外都不使用解析结果缓存，计时的是实际解析
+    common._frame_cache = common.FrameCache(None, memory_items=0)
+    
+    report_path = os.path.join(work_folder, "收货单商品明细.xlsx")
+    generate_report(report_path, rows=rows, suppliers=suppliers, return_ratio=return_ratio, seed=seed)
+    
+    results = {}
+    app = recon.BldBuyApp()
+    
+    results["find_header_row"] = summarize(time_call(lambda: app.find_header_row(report_path), repeat))
+    
+    df = app.preprocess_excel(report_path)
+    results["preprocess_excel"] = summarize(
+        time_call(lambda: app.preprocess_excel(report_path), repeat), len(df), "rows")
+    
+    # 磁盘缓存命中（每次清空内存缓存）
+    disk_cache = common.FrameCache(os.path.join(work_folder, "frame_cache"), memory_items=0)
+    common._frame_cache = disk_cache
+    app.preprocess_excel(report_path)
+    results["preprocess_excel_cached"] = summarize(
+        time_call(lambda: app.preprocess_excel(report_path), repeat), len(df), "rows")
+    common._frame_cache = common.FrameCache(None, memory_items=0)
+    
+    # 已安装的读取引擎都计时，并检查读取结果一致
+    header_row = app.find_header_row(report_path)
+    usecols = app.report_columns
+    frames = {}
+    for engine in common.READER_ENGINES:
+        if engine != "openpyxl" and engine != common.get_reader_engine():
+            continue
+        frames[engine] = common.read_excel_table(report_path, header_row, usecols, engine)
+        results[f"read_excel_table_{engine}"] = summarize(
+            time_call(lambda: common.read_excel_table(report_path, header_row, usecols, engine), repeat),
+            len(frames[engine]), "rows")
+    for engine, frame in frames.items():
+        if not frame.equals(frames["openpyxl"]):
+            raise RuntimeError(f"读取引擎 {engine} 与 openpyxl 的读取结果不一致")
+    
+    groups = app.split_groups(df.copy())
+    results["split_groups"] = summarize(
+        time_call(app.split_groups, repeat, setup=lambda: (df.copy(),)), len(df), "rows")
+    
+    year_month = df['收货日期'].min().strftime('%Y-%m')
+    statements_folder = os.path.join(work_folder, "export", year_month)
+    
+    def write_statements():
+        for (supplier_account, tax_rate), group_data in groups:
+            app.process_group_data(supplier_account, group_data.copy(), year_month, statements_folder,
+                                   BENCHMARK_HEADER_ROWS, tax_rate)
+    
+    def reset_statements_folder():
+        shutil.rmtree(statements_folder, ignore_errors=True)
+        os.makedirs(statements_folder)
+        return ()
+    
+    results["process_group_data"] = summarize(
+        time_call(write_statements, repeat, setup=reset_statements_folder), len(groups), "statements")
+    
+    # 确认函：使用最大的几份对账单，每次运行前复制到新的目录
+    statements = sorted(glob.glob(os.path.join(statements_folder, "*.xlsx")), key=os.path.getsize, reverse=True)[:5]
+    letters_folder = os.path.join(work_folder, "letters")
+    classification_app = classification.ProductClassificationApp()
+    classification_app.category_index = classification.CategoryIndex(os.path.join(work_folder, "category_index.db"))
+    
+    def copy_statements():
+        shutil.rmtree(letters_folder, ignore_errors=True)
+        os.makedirs(letters_folder)
+        return ([shutil.copy(path, letters_folder) for path in statements],)
+    
+    def write_letters(paths):
+        for path in paths:
+            if not classification_app.process_file(path, is_batch=True):
+                raise RuntimeError(f"生成确认函失败: {path}")
+    
+    classification_app.row_count = 0
+    write_letters(copy_statements()[0])  # 预热品类索引，计时的是日常运行的情况
+    letter_rows = classification_app.row_count
+    results["classification_process_file"] = summarize(
+        time_call(write_letters, repeat, setup=copy_statements), letter_rows, "rows")
+    
+    rng = random.Random(seed)
+    amounts = [round(rng.uniform(0, 10_000_000), 2) for _ in range(10000)]
+    
+    def convert_amounts():
+        for amount in amounts:
+            classification.num_to_chinese(amount)
+    
+    results["num_to_chinese"] = summarize(time_call(convert_amounts, repeat), len(amounts), "amounts")
+    return results
+
+def compare_results(previous, current):
+    """按中位数比较两次结果，返回可打印的行"""
+    lines = [f"{'阶段':<28}{'上次(秒)':>12}{'本次(秒)':>12}{'变化':>10}"]
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if old is None:
+            lines.append(f"{name:<30}{'-':>12}{result['median']:>12.4f}{'新增':>10}")
+            continue
+        change = (result["median"] / old["median"] - 1) * 100 if old["median"] else 0
+        lines.append(f"{name:<30}{old['median']:>12.4f}{result['median']:>12.4f}{change:>+9.1f}%")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="供应商对账工具集性能基准测试")
+    parser.add_argument("--rows", type=int, default=30000, help="模拟报表的数据行数")
+    parser.add_argument("--suppliers", type=int, default=200, help="供应商数量")
+    parser.add_argument("--return-ratio", type=float, default=0.05, help="退货行比例")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段运行次数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果JSON文件（默认保存到benchmarks/results/）")
+    parser.add_argument("--compare", help="与之前的结果JSON比较")
+    args = parser.parse_args(argv)
+    
+    work_folder = tempfile.mkdtemp(prefix="recon_benchmark_")
+    try:
+        results = run_benchmarks(work_folder, args.rows, args.suppliers, args.return_ratio, args.repeat, args.seed)
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+    
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "parameters": {
+            "rows": args.rows,
+            "suppliers": args.suppliers,
+            "return_ratio": args.return_ratio,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    
+    output_path = args.output or os.path.join(
+        DEFAULT_RESULTS_FOLDER, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    for name, result in results.items():
+        rate = f"，{result['per_second']:.1f} {result['unit']}/秒" if result.get("per_second") else ""
+        print(f"{name}: 中位数 {result['median']:.4f} 秒（最快 {result['min']:.4f} 秒{rate}）")
+    print(f"结果已保存到: {output_path}")
+    
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print("\n".join(compare_results(previous, report)))
+
+if __name__ == "__main__":
+    main()
@@ -11,16 +11,23 @@ a = Analysis(
         ('favicon.ico', '.'),
         ('Bldbuy_Recon_ByTAX.py', '.'),
         ('Product_Classification_Tool_ByTAX.py', '.'),
+        ('Recon_Common_ByTAX.py', '.'),
+        ('Recon_CLI_ByTAX.py', '.'),
     ],
     hiddenimports=[
         'Bldbuy_Recon_ByTAX',
         'Product_Classification_Tool_ByTAX',
+        'Recon_Common_ByTAX',
+        'Recon_CLI_ByTAX',
+        'argparse',
         'numpy',
         'tkinter.constants',
         'datetime',
         'warnings',
         'glob',
         'threading',
+        'multiprocessing',
+        'concurrent.futures',
         'shutil',
         'logging',
         'pandas',